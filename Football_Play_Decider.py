@@ -1,19 +1,471 @@
-import pandas as pd # for reading in analyzing data
+import os # for checking whether the compiled season is older than the csv
+import sys # for reading queries from stdin when running as a service
+import argparse # for the command line options
+import threading # for updating the service's models while it answers queries
+import json # for storing the compiled season's metadata
+import hashlib # for fingerprinting the csv the season was compiled from
+import time # for timing the pipeline's stages when instrumentation is on
+import bisect # for placing stage timings in histogram buckets
+import functools # for wrapping timed functions
+import contextlib # for the do-nothing span used when instrumentation is off
+import importlib # for importing pandas the first time it's used
+import copy # for copying the service's models before updating them
+import weakref # for remembering the row fingerprints of data frames that are still in use
 import numpy as np # for reorganizing and analyzing data
 
+# class that stands in for a module and only imports it the first time one of its attributes is used
+# the real module then replaces the stand-in, so later uses cost nothing extra
+class LazyModule:
+    def __init__(self, name, alias):
+        self.name = name
+        self.alias = alias
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self.name)
+        globals()[self.alias] = module
+        return getattr(module, attribute)
+
+# for reading in analyzing data; answering from saved query tables (see QueryTables) never needs it, so it's only imported when used
+pd = LazyModule('pandas', 'pd')
+
+"""# Instrumentation
+Optional timing and counting of the pipeline's stages (reading the season, deriving the columns, reorganizing, fitting, answering queries).
+Nothing is recorded until metrics.enable() is called (or --metrics is given); while it's off, a span is one attribute check and a counter is a return.
+Every span's timings go into a fixed set of histogram buckets, so memory stays the same however long the service runs, and the p50/p95/p99
+are estimated from the buckets. The totals can be written as json or as Prometheus text.
+"""
+
+# upper bounds (in seconds) of the histogram buckets: 4 per doubling from 1 microsecond to about 2 minutes (last bucket catches the rest)
+SPAN_BUCKETS = [1e-6 * (2 ** (i / 4)) for i in range(108)]
+# the span handed out while instrumentation is off (it does nothing and can be reused)
+NO_SPAN = contextlib.nullcontext()
+
+# class to collect the timings and counters of the pipeline
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    # function to turn recording on or off
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    # function to forget everything recorded so far
+    def reset(self):
+        with self.lock:
+            self.spans = {} # name -> [bucket counts, number of timings, total seconds, longest]
+            self.counters = {}
+
+    # function to time a stage: "with metrics.span('derive_features'):"
+    def span(self, name):
+        if not self.enabled:
+            return NO_SPAN
+        return self.timing(name)
+
+    @contextlib.contextmanager
+    def timing(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    # function to add one timing (in seconds) to a span's histogram
+    def observe(self, name, seconds):
+        with self.lock:
+            span = self.spans.get(name)
+            if span is None:
+                span = self.spans[name] = [[0] * (len(SPAN_BUCKETS) + 1), 0, 0.0, 0.0]
+            span[0][bisect.bisect_left(SPAN_BUCKETS, seconds)] += 1
+            span[1] += 1
+            span[2] += seconds
+            span[3] = max(span[3], seconds)
+
+    # function to add to a counter (rows processed, cache hits, ...)
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + int(amount)
+
+    # function to estimate a quantile of a span's timings from its buckets (interpolated inside the bucket the quantile falls in)
+    def quantile(self, name, q):
+        buckets, n, _, longest = self.spans[name]
+        rank = q * n
+        seen = 0
+        for i, count in enumerate(buckets):
+            if (count > 0) & (seen + count >= rank):
+                low = SPAN_BUCKETS[i - 1] if i > 0 else 0.0
+                high = SPAN_BUCKETS[i] if i < len(SPAN_BUCKETS) else longest
+                return min(low + ((high - low) * (rank - seen) / count), longest)
+            seen += count
+        return longest
+
+    # function to sum up everything recorded: every span's count, total, mean, p50/p95/p99, and max (in seconds) and every counter
+    def summary(self):
+        with self.lock:
+            spans = {name: {'count': n, 'total': total, 'mean': total / n, 'p50': self.quantile(name, 0.5), 'p95': self.quantile(name, 0.95),
+                            'p99': self.quantile(name, 0.99), 'max': longest} for name, (_, n, total, longest) in sorted(self.spans.items())}
+            return {'spans': spans, 'counters': dict(sorted(self.counters.items()))}
+
+    # function to write everything recorded in the Prometheus text format
+    # spans are one histogram (decider_span_seconds) labeled by span, plus their estimated quantiles; counters are labeled by name
+    def prometheus(self):
+        summary = self.summary()
+        lines = ["# TYPE decider_span_seconds histogram"]
+        with self.lock:
+            for name, (buckets, n, total, _) in sorted(self.spans.items()):
+                cumulative = np.cumsum(buckets)
+                for bound, count in zip(SPAN_BUCKETS, cumulative):
+                    lines.append('decider_span_seconds_bucket{span="%s",le="%.9g"} %d' % (name, bound, count))
+                lines.append('decider_span_seconds_bucket{span="%s",le="+Inf"} %d' % (name, n))
+                lines.append('decider_span_seconds_sum{span="%s"} %.9g' % (name, total))
+                lines.append('decider_span_seconds_count{span="%s"} %d' % (name, n))
+        lines.append("# TYPE decider_span_quantile_seconds gauge")
+        for name, span in summary['spans'].items():
+            for q, label in [('p50', '0.5'), ('p95', '0.95'), ('p99', '0.99')]:
+                lines.append('decider_span_quantile_seconds{span="%s",quantile="%s"} %.9g' % (name, label, span[q]))
+        lines.append("# TYPE decider_events_total counter")
+        for name, value in summary['counters'].items():
+            lines.append('decider_events_total{name="%s"} %d' % (name, value))
+        return "\n".join(lines) + "\n"
+
+    # function to write everything recorded to a file, as Prometheus text if the file ends in .prom or .txt and as json otherwise
+    def write(self, path):
+        text = self.prometheus() if path.endswith(('.prom', '.txt')) else json.dumps(self.summary(), indent=2) + "\n"
+        with open(path, 'w') as file:
+            file.write(text)
+
+# the one set of metrics the whole program records into
+metrics = Metrics()
+
+# decorator to time every call of a function as a span (costs one check when instrumentation is off)
+def timed(name):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return function(*args, **kwargs)
+            with metrics.timing(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+"""# Compile Season
+Parse the play-by-play csv once into a cached columnar bundle (one .npy file per column plus a metadata file). Text columns are stored as integer codes
+and the rows are already in sequential order, so later runs can memory-map the bundle and skip csv parsing and sorting entirely.
+"""
+
+# only the columns the models read; every other column in the csv is never parsed
+SEASON_COLUMNS = ['GameId', 'Quarter', 'Minute', 'Second', 'OffenseTeam', 'Down', 'ToGo', 'YardLine', 'Yards', 'YardLineDirection', 'PlayType', 'Formation',
+                  'IsTouchdown', 'IsInterception', 'IsFumble', 'IsSack']
+
+# text columns that are stored as integer codes (the code to text vocabulary is saved in the metadata)
+CATEGORICAL_COLUMNS = ['OffenseTeam', 'Formation', 'PlayType', 'YardLineDirection']
+
+# storage type of every numeric column
+NUMERIC_DTYPES = {'GameId': np.int64, 'Quarter': np.int8, 'Minute': np.int8, 'Second': np.int8, 'Down': np.int8, 'ToGo': np.int16, 'YardLine': np.int16, 'Yards': np.int16,
+                  'IsTouchdown': np.int8, 'IsInterception': np.int8, 'IsFumble': np.int8, 'IsSack': np.int8}
+
+# function to fingerprint a csv file so a compiled season can be matched to the data it came from
+# function takes the path of the file and returns the sha1 hex digest of its contents
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# row fingerprints already worked out, by the id of their data frame: (weak reference to the frame, the frame's index, fingerprint)
+# an entry is dropped when its frame is, so the same id can't be mistaken for another frame
+row_fingerprints = {}
+
+# function to fingerprint which rows a data frame holds (its index labels in order)
+# pandas copies attrs onto every slice of a frame, so a data hash kept in attrs is stored with the fingerprint of the rows it was made for
+# the index is only hashed the first time for a frame (and again if its index is replaced), later calls are one dictionary lookup
+def row_fingerprint(data):
+    known = row_fingerprints.get(id(data))
+    if (known is not None) and (known[0]() is data) and (known[1] is data.index):
+        return known[2]
+    fingerprint = hashlib.sha1(pd.util.hash_pandas_object(data.index).to_numpy().tobytes()).hexdigest()
+    row_fingerprints[id(data)] = (weakref.ref(data, lambda _, key=id(data): row_fingerprints.pop(key, None)), data.index, fingerprint)
+    return fingerprint
+
+# function to mark a data frame with the hash of its data (see stored_data_version())
+def set_data_version(data, version):
+    data.attrs['data_version'] = version
+    data.attrs['data_rows'] = row_fingerprint(data)
+
+# function to get the data hash kept in a data frame's attrs, or None if there isn't one or the frame holds other rows
+# than the hash was made for (e.g. a slice of the season, which gets a copy of the season's attrs)
+def stored_data_version(data):
+    version = data.attrs.get('data_version')
+    if (version is None) or (data.attrs.get('data_rows') != row_fingerprint(data)):
+        return None
+    return version
+
+# function to find where the compiled version of a csv is stored
+# by default the bundle sits next to the csv (pbp-2024.csv -> pbp-2024.season)
+def season_cache_path(csv_path, cache_dir=None):
+    name = os.path.splitext(os.path.basename(csv_path))[0] + '.season'
+    return os.path.join(cache_dir if cache_dir is not None else os.path.dirname(os.path.abspath(csv_path)), name)
+
+# function to check whether a compiled season can be used instead of parsing the csv again
+# the bundle is reused when the csv's modification time and size are unchanged; if only the modification time moved,
+# the csv is hashed and the bundle is still reused when the contents are the same
+# function returns the bundle's metadata when it is usable and None otherwise
+def season_cache_is_fresh(csv_path, cache_path):
+    try:
+        with open(os.path.join(cache_path, 'meta.json')) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if (meta.get('columns') != SEASON_COLUMNS):
+        return None
+
+    stat = os.stat(csv_path)
+    if (meta['size'] != stat.st_size):
+        return None
+    if (meta['mtime_ns'] != stat.st_mtime_ns):
+        if (meta['sha1'] != file_hash(csv_path)):
+            return None
+        # contents are the same (file was only touched or copied), remember the new time so it isn't hashed again
+        meta['mtime_ns'] = stat.st_mtime_ns
+        with open(os.path.join(cache_path, 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+
+    return meta
+
+# function to compile a season csv into the cached columnar bundle
+# function takes the path of the csv (and optionally where to put the bundle) and returns the bundle's path
+@timed('compile_season')
+def compile_season(csv_path='pbp-2024.csv', cache_dir=None):
+    cache_path = season_cache_path(csv_path, cache_dir)
+    stat = os.stat(csv_path)
+
+    # only parse the columns the models need
+    with metrics.span('compile_season.read_csv'):
+        data = pd.read_csv(csv_path, usecols=SEASON_COLUMNS)
+    metrics.count('compile_season.rows', len(data))
+
+    # ensure data is sorted in sequential order (same order markov_reorganize and q_reorganize used to sort by)
+    data = data.sort_values(by=['GameId', 'Quarter', 'Minute', 'Second'], ascending=[True, True, False, False], kind='stable')
+
+    os.makedirs(cache_path, exist_ok=True)
+    vocab = {}
+    for column in SEASON_COLUMNS:
+        if column in CATEGORICAL_COLUMNS:
+            # missing values get the code -1
+            categories = pd.Categorical(data[column])
+            vocab[column] = categories.categories.astype(str).tolist()
+            values = categories.codes.astype(np.int16)
+        else:
+            values = data[column].fillna(0).to_numpy().astype(NUMERIC_DTYPES[column])
+        np.save(os.path.join(cache_path, column + '.npy'), values)
+
+    # metadata is written last so a half written bundle is never seen as usable
+    meta = {'source': os.path.abspath(csv_path), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': file_hash(csv_path),
+            'rows': len(data), 'columns': SEASON_COLUMNS, 'vocab': vocab}
+    with open(os.path.join(cache_path, 'meta.json'), 'w') as file:
+        json.dump(meta, file)
+
+    return cache_path
+
+# function to load a season, compiling it first only if there is no up to date bundle for the csv
+# function returns a data frame whose columns are memory-mapped from the bundle; text columns come back as categoricals
+# the data frame is marked as presorted so the reorganize functions don't sort it again
+@timed('load_season')
+def load_season(csv_path='pbp-2024.csv', cache_dir=None):
+    cache_path = season_cache_path(csv_path, cache_dir)
+    meta = season_cache_is_fresh(csv_path, cache_path)
+    metrics.count('season_cache.hit' if meta is not None else 'season_cache.miss')
+    if meta is None:
+        compile_season(csv_path, cache_dir)
+        meta = season_cache_is_fresh(csv_path, cache_path)
+
+    columns = {}
+    for column in SEASON_COLUMNS:
+        values = np.load(os.path.join(cache_path, column + '.npy'), mmap_mode='r')
+        if column in CATEGORICAL_COLUMNS:
+            columns[column] = pd.Categorical.from_codes(values, categories=meta['vocab'][column])
+        else:
+            columns[column] = values
+
+    season = pd.DataFrame(columns, copy=False)
+    season.attrs['presorted'] = True
+    set_data_version(season, meta['sha1'])
+
+    return season
+
 """# Clean Data
 Clean data and make it ready for MDP and Q-learning by only keeping necessary columns. Some columns will be deleted, some will be joined, some will be created.
 
-Function to prepare dataset for markov models. Will only leave data with user given team, down, quarter, and field position. Will modify columns as well
+All of the derived columns are built once for the whole season by derive_features(). The reorganize functions then only slice that one frame
+with boolean masks, so nothing is re-derived per team or per situation.
 """
 
+# codes used in the 'NextDownCode' column; downs 1-4 are stored as themselves
+# the codes line up with Q.states (state index = code - 1)
+NEXT_DOWN_TD = 5 # play scored a touchdown
+NEXT_DOWN_TO = 6 # play failed to gain the yards on fourth down (turnover on downs); interceptions and fumbles keep their next down, 'IsTurnover' flags them
+
+# names for the codes used in the 'DistanceBucket' column
+DISTANCE_BUCKETS = ['Short', 'Medium', 'Long'] # 5 or less yards to go, 6-10 yards to go, more than 10 yards to go
+
+# play types the models choose between (the index is the play type's code) and the play outcomes they count
+# outcomes aren't exclusive (e.g. a fumble after a gain is both a next down and a turnover), so each has its own flag column
+PLAY_TYPES = ['RUSH', 'PASS']
+OUTCOMES = ['FirstDown', 'NextDown', 'Touchdown', 'Turnover', 'NegativePlay']
+OUTCOME_COLUMNS = ['IsFirstDown', 'IsNextDown', 'IsTouchdown', 'IsTurnover', 'IsNegativePlay']
+# how the MDP picks name the outcomes (e.g. 'Pass to first down')
+OUTCOME_NAMES = ['first down', 'next down', 'touchdown', 'turnover', 'negative play']
+
+# function to turn reward lists in the order [Turnover, Negative Play, Next Down, First Down, Touchdown] into rewards of every outcome (in OUTCOMES order)
+def outcome_rewards(reward):
+    return np.asarray(reward, dtype=float)[..., [3, 2, 4, 0, 1]]
+
+# function to turn a whole number given as a number or text (e.g. 3, 3.0, or '3') into an int
+# raises ValueError for anything else (e.g. 2.5, True, or 'x') instead of cutting it down to a whole number like int() does
+def whole_number(value):
+    if isinstance(value, (bool, np.bool_)):
+        raise ValueError("Not a whole number: " + str(value))
+    number = float(value)
+    if not number.is_integer():
+        raise ValueError("Not a whole number: " + str(value))
+    return int(number)
+
+# function to turn a quarter given as 1-5 or 'OT' into its number (overtime is quarter 5)
+def quarter_number(quarter):
+    return 5 if (str(quarter).upper() == 'OT') else whole_number(quarter)
+
+# function to turn yards to go into 'DistanceBucket' codes (index into DISTANCE_BUCKETS)
+def distance_bucket(to_go):
+    return np.select([to_go <= 5, to_go <= 10], [0, 1], 2).astype(np.int8)
+
+# function to turn a text column into integer codes
+# function returns the codes (-1 for missing values) and the list of names the codes point to
+# categorical columns (e.g. from load_season()) keep their full vocabulary so codes agree across slices of the same season
+def encode(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy().astype(np.intp), column.cat.categories.astype(str).tolist()
+    codes, names = pd.factorize(column.astype(object), sort=True)
+    return codes.astype(np.intp), [str(name) for name in names]
+
+# function to get every play's play type code (index into PLAY_TYPES)
+def play_type_codes(plays):
+    return (plays['PlayType'] == 'PASS').to_numpy().astype(np.intp)
+
+# function to encode every play's action as play type code * number of formations + formation code
+# formations is the list of formation names to code against (e.g. a fitted model's); without it the plays' own formations are encoded (see encode())
+# function returns the action codes (-1 for a play whose formation is missing or not in formations) and the formations
+def encode_actions(plays, formations=None):
+    if formations is None:
+        formation, formations = encode(plays['Formation'])
+    else:
+        formation = pd.Index(formations).get_indexer(plays['Formation'].astype(str))
+    return np.where(formation >= 0, (play_type_codes(plays) * len(formations)) + formation, -1), formations
+
+# function to split action codes back into (play type codes, formation codes)
+def decode_actions(action, n_formations):
+    return np.divmod(action, n_formations)
+
+# function to name every action code, e.g. 'SHOTGUN PASS'
+def action_names(formations):
+    play_type, formation = decode_actions(np.arange(len(PLAY_TYPES) * len(formations)), max(len(formations), 1))
+    return [formations[f] + " " + PLAY_TYPES[t] for t, f in zip(play_type.tolist(), formation.tolist())]
+
+# function to order actions the way q-tables have their columns: pass actions first, then rush actions, each in the order they were first run
+# takes every action's play type code and where it was first run; returns the positions of the actions in column order
+def column_order(play_type, first):
+    return np.lexsort((first, np.asarray(play_type) != PLAY_TYPES.index('PASS')))
+
+# function to code every play's field side as 0 (OWN) or 1 (OPP), -1 if it has neither
+def side_codes(data):
+    return np.where(data['YardLineDirection'] == 'OWN', 0, np.where(data['YardLineDirection'] == 'OPP', 1, -1))
+
+# function to derive every column the models need for all plays of a season at once
+# function takes the season (straight from load_season() or pd.read_csv()) and returns a data frame with one row per pass or rush play
+# all derived columns are typed: 'NextDownCode' and 'DistanceBucket' are int8 codes and the outcomes are boolean flags
+@timed('derive_features')
+def derive_features(data_set):
+    # the plays only keep the season's data hash if it was made for exactly these rows
+    version = stored_data_version(data_set)
+
+    # ensure data is sorted in sequential order (a season from load_season() is already sorted)
+    # sort data first by game id, then by quarter, followed by time remaining
+    if not data_set.attrs.get('presorted', False):
+        data_set = data_set.sort_values(by=['GameId', 'Quarter', 'Minute', 'Second'], ascending=[True, True, False, False])
+
+    # number the drives: a new drive starts with a new game, a new half (or overtime), or when the other team gets the ball
+    # rows without a team (timeouts, end of quarter, ...) don't end a drive, the team before them is carried forward
+    team, _ = encode(data_set['OffenseTeam'])
+    carried = np.maximum.accumulate(np.where(team >= 0, np.arange(len(team)), 0)) if len(team) else team
+    team = team[carried]
+    game = data_set['GameId'].to_numpy()
+    quarter = data_set['Quarter'].to_numpy()
+    half = (quarter >= 3).astype(np.int8) + (quarter >= 5)
+    new_drive = np.ones(len(team), dtype=bool)
+    new_drive[1:] = (game[1:] != game[:-1]) | (team[1:] != team[:-1]) | (half[1:] != half[:-1])
+    drive = np.cumsum(new_drive) - 1
+
+    # only need play data for when play was a pass or run (all other play types were either equivalent to no play or special teams play)
+    # rows without a play type or without a real down (e.g. two point conversions) are dropped as well
+    # rows without a team or formation can't be attributed to an action, so they're dropped too
+    keep = (data_set['PlayType'].isin(['PASS', 'RUSH']) & data_set['Down'].between(1, 4) & data_set['OffenseTeam'].notna()
+            & data_set['Formation'].notna()).to_numpy()
+    plays = data_set.loc[keep, ['GameId', 'OffenseTeam', 'Quarter', 'Minute', 'Second', 'Down', 'ToGo', 'YardLine', 'Yards', 'YardLineDirection', 'PlayType',
+                                'Formation']].copy()
+
+    down = plays['Down'].to_numpy().astype(np.int8)
+    to_go = plays['ToGo'].to_numpy()
+    yards = plays['Yards'].to_numpy()
+    touchdown = (data_set['IsTouchdown'].to_numpy()[keep] == 1)
+    gained = (yards >= to_go)
+
+    # next down based on current down, yards to go, and yards gained
+    # failing to gain the yards on fourth down is a turnover on downs; a touchdown overrides everything
+    next_down = np.where(gained, 1, down + 1).astype(np.int8)
+    next_down[(down == 4) & ~gained] = NEXT_DOWN_TO
+    next_down[touchdown] = NEXT_DOWN_TD
+
+    plays['DriveId'] = drive[keep]
+    plays['Quarter'] = plays['Quarter'].to_numpy().astype(np.int8)
+    plays['Down'] = down
+    plays['NextDownCode'] = next_down
+    plays['DistanceBucket'] = distance_bucket(to_go)
+
+    # outcome flags
+    # turnover combines interceptions, fumbles, and turnovers on downs; negative play is a sack or a loss of yards
+    plays['IsTouchdown'] = touchdown
+    plays['IsTurnover'] = ((data_set['IsInterception'].to_numpy()[keep] + data_set['IsFumble'].to_numpy()[keep]) > 0) | (next_down == NEXT_DOWN_TO)
+    plays['IsNegativePlay'] = (data_set['IsSack'].to_numpy()[keep] == 1) | (yards < 0)
+    plays['IsFirstDown'] = (next_down == 1)
+    plays['IsNextDown'] = (next_down >= 2) & (next_down <= 4)
+
+    plays.attrs['presorted'] = True
+    plays.attrs.pop('data_version', None)
+    if version is not None:
+        set_data_version(plays, version)
+    # drive number of the last row (played or not), so data read in pieces can keep numbering drives where the last piece stopped
+    plays.attrs['last_drive'] = int(drive[-1]) if len(drive) else -1
+    metrics.count('derive_features.rows', len(data_set))
+    metrics.count('derive_features.plays', len(plays))
+    return plays
+
+"""Function to prepare dataset for markov models. Will only leave data with user given team, down, quarter, and field position"""
+
 # function to reorganize data for markov models so unecessary data is removed
-# function will take in the dataset and user inputted data (quarter, team, and desired outcome)
+# function will take in the dataset (raw or already passed through derive_features()) and user inputted data (quarter, team, and desired outcome)
 # function will return updated dataset
+@timed('markov_reorganize')
 def markov_reorganize(data_set, quarter, down, team, field_side):
-    # ensure data is sorted in sequential order
-    # sort data first by game id, then by quarter, followed by time remaining
-    data_set = data_set.sort_values(by=['GameId', 'Quarter', 'Minute', 'Second'], ascending=[True, True, False, False])
+    # derive the model columns first if the raw season was given
+    if 'NextDownCode' not in data_set.columns:
+        data_set = derive_features(data_set)
+
+    quarter = quarter_number(quarter)
 
     # set an other quarter variable that may need to be used if there aren't enough specific play results within one quarter
     if ((quarter == 1) | (quarter == 3)):
@@ -21,138 +473,27 @@ def markov_reorganize(data_set, quarter, down, team, field_side):
     else:
         other_q = quarter - 1
 
-    # create a data frame with only the necessary data points
-    updated_data = pd.DataFrame(data_set[(data_set['OffenseTeam'] == team) & (data_set['Down'] == down) & (data_set['YardLineDirection'] == field_side) & ((data_set['Quarter'] == quarter) | (data_set['Quarter'] == other_q))]
-                                [['OffenseTeam', 'Quarter', 'Down', 'ToGo', 'Yards', 'YardLineDirection', 'PlayType', 'Formation', 'IsTouchdown',
-                                  'IsInterception', 'IsFumble', 'IsSack']])
-
-    # clean columns so rows with uneccessary data are gone
-
-    # get rid of 'NaN' values
-    updated_data = updated_data.dropna(subset=['PlayType'])
-
-    # change quarter 5 to OT for overtime
-    updated_data['Quarter'] = np.where(updated_data['Quarter'] == 5, 'OT', updated_data['Quarter'])
-
-    # only need play data for when play was a pass, run, or sramble (all other play types were either equivalent to no play or special teams play)
-    #updated_data = updated_data[(updated_data['PlayType'] == 'PASS') | (updated_data['PlayType'] == 'RUSH') | (updated_data['PlayType'] == 'SCRAMBLE') | (updated_data['PlayType'] == 'FIELD GOAL')]
-    updated_data = updated_data[(updated_data['PlayType'] == 'PASS') | (updated_data['PlayType'] == 'RUSH')]
-
-    # combine 'IsInterception' and 'IsFumble' into one turnover column; afterwards get rid of two original columns
-    updated_data['IsTurnover'] = updated_data['IsInterception'] + updated_data['IsFumble']
-    updated_data['IsTurnover'] = np.where(updated_data['IsTurnover'] == 0, False, True)
-    updated_data = updated_data.drop(columns=['IsInterception', 'IsFumble'])
-
-    # create new column for negative plays (sack or loss of yards); get rid of sack column
-    updated_data['IsNegativePlay'] = np.where((updated_data['IsSack'] == 1) | (updated_data['Yards'] < 0), True, False)
-    updated_data = updated_data.drop(columns='IsSack')
-
-    # create new column for next down based on current down, yards to go, and yards gained
-    updated_data['NextDown'] = np.where((updated_data['Yards'] < updated_data['ToGo']), updated_data['Down'] + 1, 1)
-    updated_data['NextDown'] = np.where(updated_data['IsTouchdown'] == 1, 'TD', updated_data['NextDown'])
-    updated_data['NextDown'] = np.where((updated_data['NextDown'] == 5) & (updated_data['Yards'] >= updated_data['ToGo']), 1, updated_data['NextDown'])
-    updated_data['NextDown'] = np.where((updated_data['NextDown'] == 5) & (updated_data['Yards'] < updated_data['ToGo']), 'TO', updated_data['NextDown'])
-    updated_data['IsTurnover'] = np.where(updated_data['NextDown'] == 'TO', True, updated_data['IsTurnover'])
-    #updated_data['NextDown'] = np.where(updated_data['IsTurnover'] == True, 'TO', updated_data['NextDown'])
-
-    #updated_data['NextDown'] = np.where((updated_data['NextDown'] == 5
-     # adjust the turnover and next down stats for when offense gos for it on fourth down
-    #updated_data['IsTurnover'] = np.where((updated_data['NextDown'] == 5) & (updated_data['Yards'] < updated_data['ToGo']), True, updated_data['IsTurnover'])
-    #updated_data['NextDown'] = np.where((updated_data['NextDown'] == 5) & (updated_data['Yards'] < updated_data['ToGo']), "TO", 1)
-
-    # adjust the turnover and next down stats for when offense gos for it on fourth down
-    #updated_data['IsTurnover'] = np.where((updated_data['NextDown'] == 5) & (updated_data['Yards'] < updated_data['ToGo']), True, updated_data['IsTurnover'])
-    #updated_data['NextDown'] = np.where((updated_data['NextDown'] == 5) & (updated_data['Yards'] < updated_data['ToGo']), "TO", 1)
-
-    updated_data['YardLine'] = updated_data['YardLineDirection']
-    #updated_data = updated_data.drop(columns=['Yards'])
-
-    updated_data['YardsToGo'] = 0
-    updated_data['YardsToGo'] = np.where(updated_data['ToGo'] <= 5, 'Short', updated_data['YardsToGo'])
-    updated_data['YardsToGo'] = np.where(updated_data['ToGo'] <= 10, 'Medium', updated_data['YardsToGo'])
-    updated_data['YardsToGo'] = np.where(updated_data['ToGo'] > 10, 'Long', updated_data['YardsToGo'])
-
-
-    # replace 'IsTouchdown' values with boolean values
-    updated_data['IsTouchdown'] = np.where(updated_data['IsTouchdown'] == 1, True, False)
-
-    # new column for field goals
-    #updated_data['IsFieldGoal'] = np.where(updated_data['PlayType'] == 'FIELD GOAL', True, False)
+    # keep only the plays in the given situation
+    mask = ((data_set['OffenseTeam'] == team) & (data_set['Down'] == int(down)) & (data_set['YardLineDirection'] == field_side)
+            & ((data_set['Quarter'] == quarter) | (data_set['Quarter'] == other_q)))
 
-    # rearrange columns (makes it easier to read for debugging)
-    updated_data = updated_data[['OffenseTeam', 'Quarter', 'Down', 'YardsToGo', 'NextDown', 'YardLine', 'PlayType', 'Formation', 'IsTouchdown', 'IsTurnover', 'IsNegativePlay']]
-    #updated_data = updated_data.sort_values(by='Quarter', ascending=True)
+    metrics.count('markov_reorganize.rows', len(data_set))
+    return data_set[mask.to_numpy()]
 
-    return updated_data
-
-"""Function to prepare dataset for q-learning. Will only filter by team, but will modify columns"""
+"""Function to prepare dataset for q-learning. Will only filter by team"""
 
 # function to reorganize data for q-learning so unnecessary data is removed
-# function will take in the dataset and user inputted team
+# function will take in the dataset (raw or already passed through derive_features()) and user inputted team
 # function will return updated dataset
+@timed('q_reorganize')
 def q_reorganize(data_set, team):
-    # ensure data is sorted in sequential order
-    # sort data first by game id, then by quarter, followed by time remaining
-    data_set = data_set.sort_values(by=['GameId', 'Quarter', 'Minute', 'Second'], ascending=[True, True, False, False])
-
-    # create a data frame with inputted team's data
-    updated_data = pd.DataFrame(data_set[(data_set['OffenseTeam'] == team)]
-                                [['OffenseTeam', 'Quarter', 'Down', 'ToGo', 'Yards', 'YardLineDirection', 'PlayType', 'Formation', 'IsTouchdown',
-                                  'IsInterception', 'IsFumble', 'IsSack']])
-
-    # clean columns so rows with uneccessary data are gone
-
-    # get rid of 'NaN' values
-    updated_data = updated_data.dropna(subset=['PlayType'])
-
-    # change quarter 5 to OT for overtime
-    updated_data['Quarter'] = np.where(updated_data['Quarter'] == 5, 'OT', updated_data['Quarter'])
-
-    # only need play data for when play was a pass, run, or sramble (all other play types were either equivalent to no play or special teams play)
-    #updated_data = updated_data[(updated_data['PlayType'] == 'PASS') | (updated_data['PlayType'] == 'RUSH') | (updated_data['PlayType'] == 'SCRAMBLE') | (updated_data['PlayType'] == 'FIELD GOAL')]
-    updated_data = updated_data[(updated_data['PlayType'] == 'PASS') | (updated_data['PlayType'] == 'RUSH')]
-
-    # combine 'IsInterception' and 'IsFumble' into one turnover column; afterwards get rid of two original columns
-    updated_data['IsTurnover'] = updated_data['IsInterception'] + updated_data['IsFumble']
-    updated_data['IsTurnover'] = np.where(updated_data['IsTurnover'] == 0, False, True)
-    updated_data = updated_data.drop(columns=['IsInterception', 'IsFumble'])
-
-    # create new column for negative plays (sack or loss of yards); get rid of sack column
-    updated_data['IsNegativePlay'] = np.where((updated_data['IsSack'] == 1) | (updated_data['Yards'] < 0), True, False)
-    updated_data = updated_data.drop(columns='IsSack')
-
-    # create new column for next down based on current down, yards to go, and yards gained
-    updated_data['NextDown'] = np.where((updated_data['Yards'] < updated_data['ToGo']), updated_data['Down'] + 1, 1)
-    updated_data['NextDown'] = np.where(updated_data['IsTouchdown'] == 1, 'TD', updated_data['NextDown'])
-    updated_data['NextDown'] = np.where((updated_data['NextDown'] == 5) & (updated_data['Yards'] >= updated_data['ToGo']), 1, updated_data['NextDown'])
-    updated_data['NextDown'] = np.where((updated_data['NextDown'] == 5) & (updated_data['Yards'] < updated_data['ToGo']), 'TO', updated_data['NextDown'])
-    updated_data['IsTurnover'] = np.where(updated_data['NextDown'] == 'TO', True, updated_data['IsTurnover'])
-    #updated_data['NextDown'] = np.where(updated_data['IsTurnover'] == True, 'TO', updated_data['NextDown'])
-
-    #updated_data['NextDown'] = np.where((updated_data['NextDown'] == 5
-     # adjust the turnover and next down stats for when offense gos for it on fourth down
-    #updated_data['IsTurnover'] = np.where((updated_data['NextDown'] == 5) & (updated_data['Yards'] < updated_data['ToGo']), True, updated_data['IsTurnover'])
-    #updated_data['NextDown'] = np.where((updated_data['NextDown'] == 5) & (updated_data['Yards'] < updated_data['ToGo']), "TO", 1)
-
-    updated_data['YardLine'] = updated_data['YardLineDirection']
-    #updated_data = updated_data.drop(columns=['Yards'])
+    # derive the model columns first if the raw season was given
+    if 'NextDownCode' not in data_set.columns:
+        data_set = derive_features(data_set)
 
-
-    updated_data['YardsToGo'] = 0
-    updated_data['YardsToGo'] = np.where(updated_data['ToGo'] <= 5, 'Short', updated_data['YardsToGo'])
-    updated_data['YardsToGo'] = np.where(updated_data['ToGo'] <= 10, 'Medium', updated_data['YardsToGo'])
-    updated_data['YardsToGo'] = np.where(updated_data['ToGo'] > 10, 'Long', updated_data['YardsToGo'])
-
-    # replace 'IsTouchdown' values with boolean values
-    updated_data['IsTouchdown'] = np.where(updated_data['IsTouchdown'] == 1, True, False)
-
-    # new column for field goals
-    #updated_data['IsFieldGoal'] = np.where(updated_data['PlayType'] == 'FIELD GOAL', True, False)
-
-    # rearrange columns (makes it easier to read for debugging)
-    updated_data = updated_data[['OffenseTeam', 'Quarter', 'Down', 'YardsToGo', 'NextDown', 'YardLine', 'PlayType', 'Formation', 'IsTouchdown', 'IsTurnover', 'IsNegativePlay']]
-
-    return updated_data
+    # keep only the inputted team's plays
+    metrics.count('q_reorganize.rows', len(data_set))
+    return data_set[(data_set['OffenseTeam'] == team).to_numpy()]
 
 """#  Implementing Markov Models
 Implenting Markov Models, both the Markov Decision Process (which is mentioned in my proposal and crucial to the final result of my project) and the Hidden Markov Model as Professor Alam stated in his Mid-Project Submission requirements. I had to do Markov Models as my data is of the sequential type. I determined it was of this type as the data includes a row of various data points, but these rows are given in a play-by-play sequence and if this sequence were to become completely random, the data would lose most of its meaning. Additionally, each entry (play) is dependent on the previous play as some plays wouldn't make sense for certain previous plays. For instance, if a team runs a play on first down and fail to pick up a first, the next play cannot be any play other than on second down. Each down and play result is essentially a state and the play type and formation is an action.
@@ -160,6 +501,18 @@ Implenting Markov Models, both the Markov Decision Process (which is mentioned i
 Implementing the Markov Decision Process to decide most optimal play for team in given situation
 """
 
+# function to sum up bootstrap resamples of action values; values is (resamples x actions) with nan where an action had no plays in a resample
+# function returns every action's mean value, the low and high ends of the confidence interval, and the share of resamples where it was the best action
+def bootstrap_summary(values, confidence=0.9):
+    present = ~np.isnan(values)
+    best = np.argmax(np.where(present, values, -np.inf), axis=1)
+    p_best = np.bincount(best, minlength=values.shape[1]) / len(values)
+    mean, low, high = np.full((3, values.shape[1]), np.nan)
+    seen = present.any(axis=0)
+    mean[seen] = np.where(present, values, 0)[:, seen].sum(axis=0) / present[:, seen].sum(axis=0)
+    low[seen], high[seen] = np.nanpercentile(values[:, seen], [50 * (1 - confidence), 50 * (1 + confidence)], axis=0)
+    return mean, low, high, p_best
+
 # class to implement Markov Decision Process
 # when class object is declared, class will take the processed data and quarter and use them to implement a MDP
 class MDP:
@@ -171,6 +524,8 @@ class MDP:
 
         # reward dictionary to make it easier to access reward by read next down
         self.rewards = {"Turnover": reward[0], "NegPlay": reward[1], "NextDown": reward[2], "FirstDown": reward[3], "Touchdown": reward[4]}
+        # the same rewards as a list in that order, for outcome_rewards() and state_rewards()
+        self.reward_list = [reward[0], reward[1], reward[2], reward[3], reward[4]]
         # set reward amounts (rewards for each action will depend on the new state)
         self.Touchdown_reward = 10
         self.FirstDown_reward = 5
@@ -179,264 +534,608 @@ class MDP:
         self.NegativePlay_reward = -5
         self.Turnover_reward = -10
 
-        self.calculate()
+        # an MDP can also be made from precomputed counts (see from_index()), in which case there's nothing to calculate
+        if data is not None:
+            self.calculate()
+
+    # function to make an MDP for a situation straight from a SituationIndex instead of filtering and counting plays
+    # takes the rewards, the index, and the situation; returns the MDP with its count and probability arrays already filled
+    @classmethod
+    def from_index(cls, reward, index, quarter, down, team, field_side):
+        mdp = cls(reward, None, quarter)
+        mdp.formations, mdp.counts, mdp.totals, mdp.probabilities = index.lookup(quarter, down, team, field_side)
+        return mdp
 
     # function to calculate frequency and probabilities of each state (score, turnover, down) occurring given each action (play type and formation)
-    # the function takes no parameters and returns none but will call the decision() function
+    # every (play type, formation, outcome) count is made in a single bincount over encoded keys instead of looping over the plays
+    # the function takes no parameters and returns none; results are saved as dense arrays of shape (play types, formations, outcomes)
+    @timed('MDP.calculate')
     def calculate(self):
-        temp = pd.DataFrame(self.data[(self.data['PlayType'] == 'RUSH')]).sort_values(by='Quarter', ascending=True)
-        formations = temp['Formation'].unique()
-        rush_df = pd.DataFrame({'FirstDown':0, 'P(FirstDown)':0, 'NextDown':0, 'P(NextDown)':0, 'Touchdown':0, 'P(Touchdown)':0, 'Turnover':0, 'P(Turnover)':0, 'NegativePlay':0, 'P(NegativePlay)':0, 'TotalPlays':0}, index=formations)
-        q = str(self.quarter)
-        FD_next = ND_next = TD_next = TO_next = NEG_next = 0
-        for each in formations:
-            for row in temp.itertuples():
-                if (row.Formation == each):
-                    if (row.NextDown == '1'):
-                        rush_df.loc[each, 'FirstDown'] = rush_df.loc[each, 'FirstDown'] + 1
-                    if ((row.NextDown != '1') & (row.NextDown != 'TD') & (row.NextDown != 'TO')):
-                        rush_df.loc[each, 'NextDown'] = rush_df.loc[each, 'NextDown'] + 1
-                    if (row.IsTouchdown == True):
-                        rush_df.loc[each, 'Touchdown'] = rush_df.loc[each, 'Touchdown'] + 1
-                    if (row.IsTurnover == True):
-                        rush_df.loc[each, 'Turnover'] = rush_df.loc[each, 'Turnover'] + 1
-                    if (row.IsNegativePlay == True):
-                        rush_df.loc[each, 'NegativePlay'] = rush_df.loc[each, 'NegativePlay'] + 1
-                    rush_df.loc[each, 'TotalPlays'] = rush_df.loc[each, 'TotalPlays'] + 1
-
-        for each in formations:
-            rush_df.loc[each, 'P_FirstDown'] = rush_df.loc[each, 'FirstDown'] / rush_df.loc[each, 'TotalPlays']
-            rush_df.loc[each, 'P_NextDown'] = rush_df.loc[each, 'NextDown'] / rush_df.loc[each, 'TotalPlays']
-            rush_df.loc[each, 'P_Touchdown'] = rush_df.loc[each, 'Touchdown'] / rush_df.loc[each, 'TotalPlays']
-            rush_df.loc[each, 'P_Turnover'] = rush_df.loc[each, 'Turnover'] / rush_df.loc[each, 'TotalPlays']
-            rush_df.loc[each, 'P_NegativePlay'] = rush_df.loc[each, 'NegativePlay'] / rush_df.loc[each, 'TotalPlays']
-        #print("\nRUSHING:\n", rush_df)
-
-        temp = pd.DataFrame(self.data[(self.data['PlayType'] == 'PASS')]).sort_values(by='Quarter', ascending=True)
-        formations = temp['Formation'].unique()
-        pass_df = pd.DataFrame({'FirstDown':0, 'NextDown':0, 'Touchdown':0, 'Turnover':0, 'NegativePlay':0, 'TotalPlays':0}, index=formations)
-        q = str(self.quarter)
-        FD_next = ND_next = TD_next = TO_next = NEG_next = 0
-        for each in formations:
-            for row in temp.itertuples():
-                if (row.Formation == each):
-                    if (row.NextDown == '1'):
-                        pass_df.loc[each, 'FirstDown'] = pass_df.loc[each, 'FirstDown'] + 1
-                    if ((row.NextDown != '1') & (row.NextDown != 'TD') & (row.NextDown != 'TO')):
-                        pass_df.loc[each, 'NextDown'] = pass_df.loc[each, 'NextDown'] + 1
-                    if (row.IsTouchdown == True):
-                        pass_df.loc[each, 'Touchdown'] = pass_df.loc[each, 'Touchdown'] + 1
-                    if (row.IsTurnover == True):
-                        pass_df.loc[each, 'Turnover'] = pass_df.loc[each, 'Turnover'] + 1
-                    if (row.IsNegativePlay == True):
-                        pass_df.loc[each, 'NegativePlay'] = pass_df.loc[each, 'NegativePlay'] + 1
-                    pass_df.loc[each, 'TotalPlays'] = pass_df.loc[each, 'TotalPlays'] + 1
-
-        for each in formations:
-            pass_df.loc[each, 'P_FirstDown'] = pass_df.loc[each, 'FirstDown'] / pass_df.loc[each, 'TotalPlays']
-            pass_df.loc[each, 'P_NextDown'] = pass_df.loc[each, 'NextDown'] / pass_df.loc[each, 'TotalPlays']
-            pass_df.loc[each, 'P_Touchdown'] = pass_df.loc[each, 'Touchdown'] / pass_df.loc[each, 'TotalPlays']
-            pass_df.loc[each, 'P_Turnover'] = pass_df.loc[each, 'Turnover'] / pass_df.loc[each, 'TotalPlays']
-            pass_df.loc[each, 'P_NegativePlay'] = pass_df.loc[each, 'NegativePlay'] / pass_df.loc[each, 'TotalPlays']
-        #print("\nPASSING:\n", pass_df)
-
-        # save data frames within class
-        self.pass_plays = pass_df
-        self.rush_plays = rush_df
-
-        # call class' decision function
-        #self.decision()
+        # encode each play's action as play type code * number of formations + formation code
+        key, formations = encode_actions(self.data)
+
+        # one row per play with a column per outcome flag; each raised flag adds one to its (action, outcome) cell
+        flags = self.data[OUTCOME_COLUMNS].to_numpy(dtype=bool)
+        cells = (key[:, None] * len(OUTCOMES)) + np.arange(len(OUTCOMES))
+        size = len(PLAY_TYPES) * len(formations)
+        counts = np.bincount(cells[flags], minlength=size * len(OUTCOMES)).reshape(len(PLAY_TYPES), len(formations), len(OUTCOMES))
+        totals = np.bincount(key, minlength=size).reshape(len(PLAY_TYPES), len(formations))
+
+        # turn frequencies into probabilities (actions that never happened keep probability 0)
+        probabilities = np.zeros(counts.shape)
+        np.divide(counts, totals[:, :, None], out=probabilities, where=(totals[:, :, None] > 0))
+
+        # save arrays within class
+        self.formations = np.asarray(formations, dtype=object)
+        self.counts = counts
+        self.totals = totals
+        self.probabilities = probabilities
+        metrics.count('MDP.calculate.plays', len(self.data))
+        metrics.count('MDP.calculate.formations', len(formations))
+
+    # function to fold newly observed plays (already filtered to this MDP's situation) into the counts without recounting the old ones
+    # formations not seen before are added; the work done is proportional to the number of new plays
+    # (the new plays are not added to self.data, so solve() still uses the plays the MDP was made with)
+    def update(self, plays):
+        names = plays['Formation'].astype(str).to_numpy()
+        known = set(self.formations)
+        added = [name for name in dict.fromkeys(names) if name not in known]
+        if added:
+            self.formations = np.concatenate([self.formations, np.asarray(added, dtype=object)])
+            # new arrays (not in place) so an MDP made from a SituationIndex never changes the index it came from
+            self.counts = np.concatenate([self.counts, np.zeros((len(PLAY_TYPES), len(added), len(OUTCOMES)), dtype=self.counts.dtype)], axis=1)
+            self.totals = np.concatenate([self.totals, np.zeros((len(PLAY_TYPES), len(added)), dtype=self.totals.dtype)], axis=1)
+
+        key, _ = encode_actions(plays, self.formations)
+        flags = plays[OUTCOME_COLUMNS].to_numpy(dtype=bool)
+        cells = (key[:, None] * len(OUTCOMES)) + np.arange(len(OUTCOMES))
+        size = len(PLAY_TYPES) * len(self.formations)
+        self.counts = self.counts + np.bincount(cells[flags], minlength=size * len(OUTCOMES)).reshape(self.counts.shape)
+        self.totals = self.totals + np.bincount(key, minlength=size).reshape(self.totals.shape)
+
+        self.probabilities = np.zeros(self.counts.shape)
+        np.divide(self.counts, self.totals[:, :, None], out=self.probabilities, where=(self.totals[:, :, None] > 0))
+
+    # function to make a reporting data frame (one row per formation) for a play type from the saved arrays
+    # only formations that were actually run with that play type are included
+    def play_table(self, play_type):
+        i = PLAY_TYPES.index(play_type)
+        seen = self.totals[i] > 0
+        table = pd.DataFrame(self.counts[i][seen], index=self.formations[seen], columns=OUTCOMES)
+        table['TotalPlays'] = self.totals[i][seen]
+        for j in range(len(OUTCOMES)):
+            table['P_' + OUTCOMES[j]] = self.probabilities[i][seen][:, j]
+        return table
+
+    # data frames of the rush and pass results by formation (built only when asked for, e.g. for the notebook's reports)
+    @property
+    def rush_plays(self):
+        return self.play_table('RUSH')
+
+    @property
+    def pass_plays(self):
+        return self.play_table('PASS')
 
     # function to make the decision for which play is most optimal in the given situation
     # function takes no arguments but utilizes class' saved variables along with the Bellman equation to determine the play
     # this function is essentially a version of the Bellman equation and outputs a list that contains the most optimal play,
     # the reward value, and the play outcome (the transition state)
+    @timed('MDP.decision')
     def decision(self):
         discount = 0.4 # as project is supposed to be a simplified play decider meant to be used at amateur level, discount factors will be set to 1 for now
         V_0 = 0 # previous state doesn't matter as project aims to decide best single play in a current situation and not a sequence of plays
 
-        # make an empty list to store the rewards of each possible action going to each state
-        # easy way to keep track of results and use them in Bellman equation
-        values = []
-
-        for row in self.rush_plays.itertuples():
-            val = row.P_FirstDown * (self.rewards['FirstDown'] + (discount * V_0))
-            values.append(["Rush to first down", row.Index, val])
-            val = row.P_NextDown * (self.rewards['NextDown'] + (discount * V_0))
-            values.append(["Rush to next down", row.Index, val])
-            val = row.P_Touchdown * (self.rewards['Touchdown'] + (discount * V_0))
-            values.append(["Rush to touchdown", row.Index, val])
-            val = row.P_Turnover * (self.rewards['Turnover'] + (discount * V_0))
-            values.append(["Rush to turnover", row.Index, val])
-            val = row.P_NegativePlay * (self.rewards['NegPlay'] + (discount * V_0))
-            values.append(["Rush to negative play", row.Index, val])
-
-        for row in self.pass_plays.itertuples():
-            val = row.P_FirstDown * (self.rewards['FirstDown'] + (discount * V_0))
-            values.append(["Pass to first down", row.Index, val])
-            val = row.P_NextDown * (self.rewards['NextDown'] + (discount * V_0))
-            values.append(["Pass to next down", row.Index, val])
-            val = row.P_Touchdown * (self.rewards['Touchdown'] + (discount * V_0))
-            values.append(["Pass to touchdown", row.Index, val])
-            val = row.P_Turnover * (self.rewards['Turnover'] + (discount * V_0))
-            values.append(["Pass to turnover", row.Index, val])
-            val = row.P_NegativePlay * (self.rewards['NegPlay'] + (discount * V_0))
-            values.append(["Pass to negative play", row.Index, val])
-
-
-        max_val = values[0][2]
-        max_list = values[0]
-        for i in range(1, len(values)):
-            if (values[i][2] > max_val):
-                max_val = values[i][2]
-                max_list = values[i]
+        # reward of every outcome in the same order as OUTCOMES
+        reward = outcome_rewards(self.reward_list)
+
+        # value of each action going to each state, actions that never happened can't be picked
+        values = self.probabilities * (reward + (discount * V_0))
+        values[self.totals == 0] = -np.inf
+
+        # first maximum in (play type, formation, outcome) order
+        play_type, formation, outcome = np.unravel_index(np.argmax(values), values.shape)
+        if (values[play_type, formation, outcome] == -np.inf):
+            raise ValueError("No rush or pass plays in this situation")
+
+        max_list = [PLAY_TYPES[play_type].capitalize() + " to " + OUTCOME_NAMES[outcome], self.formations[formation], values[play_type, formation, outcome]]
 
         #print("Most optimal play is", max_list)
         #print("Most optimal play is to", max_list[0], "in", max_list[1], "formation")
         return max_list
 
+    # function to measure how sure decision() can be: the situation's plays are resampled (with replacement) n times and every action's
+    # value (its best outcome, same as decision()) is worked out for all resamples at once from index arrays over the encoded plays
+    # function returns a data frame with one row per action that has plays: its best outcome, number of plays, value, mean bootstrap value,
+    # confidence interval, and the share of resamples where it's the best action (sorted by that share)
+    # needs the plays, so it only works for an MDP made from plays (not from_index())
+    def bootstrap(self, n=1000, confidence=0.9, seed=None):
+        if self.data is None:
+            raise ValueError("Bootstrap needs the situation's plays, make the MDP from plays instead of an index")
+        if len(self.data) == 0:
+            raise ValueError("No rush or pass plays in this situation")
+        rng = np.random.default_rng(seed)
+        n_actions = len(PLAY_TYPES) * len(self.formations)
+        reward = outcome_rewards(self.reward_list)
+
+        # encoded plays, then n resamples of play indexes
+        key, _ = encode_actions(self.data)
+        flags = self.data[OUTCOME_COLUMNS].to_numpy(dtype=bool)
+        plays = rng.integers(0, len(key), size=(n, len(key)))
+
+        # counts of every (resample, action) and (resample, action, outcome) in one bincount each
+        cell = ((np.arange(n)[:, None] * n_actions) + key[plays]).ravel()
+        totals = np.bincount(cell, minlength=n * n_actions).reshape(n, n_actions)
+        counts = np.stack([np.bincount(cell, weights=flags[plays, o].ravel(), minlength=n * n_actions) for o in range(len(OUTCOMES))], axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = ((counts.reshape(n, n_actions, len(OUTCOMES)) / totals[:, :, None]) * reward).max(axis=2)
+        mean, low, high, p_best = bootstrap_summary(values, confidence)
+
+        # the actions that have plays, with their value and best outcome from all the plays
+        point = self.probabilities.reshape(n_actions, len(OUTCOMES)) * reward
+        has_plays = np.flatnonzero(self.totals.reshape(-1) > 0)
+        play_type, formation = decode_actions(has_plays, len(self.formations))
+        outcome_names = np.array(OUTCOME_NAMES, dtype=object)
+        table = pd.DataFrame({'Play': [PLAY_TYPES[t].capitalize() for t in play_type],
+                              'Formation': self.formations[formation],
+                              'Outcome': outcome_names[point[has_plays].argmax(axis=1)], 'Plays': self.totals.reshape(-1)[has_plays],
+                              'Value': point[has_plays].max(axis=1), 'Mean': mean[has_plays], 'Low': low[has_plays], 'High': high[has_plays],
+                              'PBest': p_best[has_plays]})
+        return table.sort_values('PBest', ascending=False, kind='stable').reset_index(drop=True)
+
+    # function to solve the MDP over a full down and distance state space with value iteration
+    # meant for an MDP made with all of a team's plays (e.g. from q_reorganize()); one solve answers every situation for the team
+    # states are (quarter, down, distance bucket, field side) plus the two ending states touchdown and turnover
+    # transitions are estimated from the plays: the next down comes from 'NextDownCode', the next distance from the yards still to go
+    # (a new set of downs is 'Medium', 10 yards), and the next field side from where the ball ends up; the quarter stays the same
+    # each play's reward is the same one Q uses (a negative play gets the negative play reward, otherwise the reward of its next down),
+    # except that a play where the ball is lost (interception, fumble, or failing on fourth down) ends in turnover with the turnover reward
+    # and values are summed over all outcomes of an action, so a play is scored by where the whole sequence of downs is likely to go
+    # function returns the policy as a data frame (one row per state that has plays) and saves the arrays into the class
+    # needs the plays (the yard lines and yards gained aren't in the index), so it only works for an MDP made from plays (not from_index())
+    @timed('MDP.solve')
+    def solve(self, discount=0.4, tol=1e-8, max_iterations=1000):
+        if self.data is None:
+            raise ValueError("Solving needs the team's plays, make the MDP from plays instead of an index")
+        action, formations = encode_actions(self.data)
+        n_actions = len(PLAY_TYPES) * len(formations)
+        shape = (5, 4, len(DISTANCE_BUCKETS), 2)
+        n_states = int(np.prod(shape))
+        touchdown, turnover = n_states, n_states + 1
+
+        encoded = encode_transitions(self.data)
+        state = np.ravel_multi_index((encoded['quarter'], encoded['state'], self.data['DistanceBucket'].to_numpy().astype(np.intp), encoded['side']), shape)
+
+        # where each play leaves the offense; interceptions and fumbles keep a normal 'NextDownCode', so the turnover flag is used for them
+        next_down = self.data['NextDownCode'].to_numpy().astype(np.intp)
+        lost = self.data['IsTurnover'].to_numpy(dtype=bool)
+        left = self.data['ToGo'].to_numpy() - self.data['Yards'].to_numpy()
+        next_bucket = np.where(next_down == 1, 1, distance_bucket(left))
+        next_side = (self.data['YardLine'].to_numpy() + self.data['Yards'].to_numpy() > 50).astype(np.intp)
+        next_state = np.where(lost, turnover, np.where(next_down == NEXT_DOWN_TD, touchdown,
+                     np.ravel_multi_index((encoded['quarter'], np.clip(next_down, 1, 4) - 1, next_bucket, next_side), shape)))
+
+        # transition probabilities and expected rewards for every (state, action) from one bincount each
+        rewards = state_rewards(self.reward_list)
+        play_reward = np.where(lost, rewards[Q.states.index('Turnover')], rewards[encoded['next_state']])
+        pair = (state * n_actions) + action
+        totals = np.bincount(pair, minlength=n_states * n_actions).reshape(n_states, n_actions)
+        counts = np.bincount((pair * (n_states + 2)) + next_state, minlength=n_states * n_actions * (n_states + 2)).reshape(n_states, n_actions, n_states + 2)
+        reward_sums = np.bincount(pair, weights=play_reward, minlength=n_states * n_actions).reshape(n_states, n_actions)
+        seen = totals > 0
+        transitions = np.divide(counts, totals[..., None], out=np.zeros(counts.shape), where=seen[..., None])
+        expected_reward = np.divide(reward_sums, totals, out=np.zeros(totals.shape), where=seen)
+
+        # value iteration; touchdown and turnover end the drive (value 0) and a state without plays keeps value 0
+        values = np.zeros(n_states + 2)
+        for iteration in range(1, max_iterations + 1):
+            action_values = np.where(seen, expected_reward + (discount * (transitions @ values)), -np.inf)
+            new_values = np.where(seen.any(axis=1), action_values.max(axis=1), 0.0)
+            change = np.abs(new_values - values[:n_states]).max()
+            values[:n_states] = new_values
+            if change < tol:
+                break
+
+        best = np.argmax(action_values, axis=1)
+        labels = action_names(formations)
+
+        # save results into class
+        self.state_values = values[:n_states].reshape(shape)
+        self.action_values = action_values.reshape(shape + (n_actions,))
+        self.actions = labels
+        self.iterations = iteration
+
+        has_plays = seen.any(axis=1)
+        quarter, down, bucket, side = np.unravel_index(np.flatnonzero(has_plays), shape)
+        self.policy = pd.DataFrame({'Quarter': quarter + 1, 'Down': down + 1, 'Distance': np.array(DISTANCE_BUCKETS)[bucket],
+                                    'Side': np.array(['OWN', 'OPP'])[side], 'Action': np.array(labels, dtype=object)[best[has_plays]],
+                                    'Value': values[:n_states][has_plays], 'Plays': totals[has_plays, best[has_plays]]})
+        self.policy = self.policy.set_index(['Quarter', 'Down', 'Distance', 'Side'])
+
+        return self.policy
+
+    # function to look up the solved policy for a situation (solve() has to be called first)
+    # distance can be the yards to go or one of DISTANCE_BUCKETS; returns [action, value] like Q.make_decision()
+    def policy_decision(self, quarter, down, distance, field_side):
+        if not hasattr(self, 'action_values'):
+            raise ValueError("Call solve() before looking up its policy")
+        bucket = DISTANCE_BUCKETS.index(distance) if distance in DISTANCE_BUCKETS else int(distance_bucket(int(distance)))
+        row = self.action_values[quarter_number(quarter) - 1, int(down) - 1, bucket, 0 if (field_side == 'OWN') else 1]
+        best = int(np.argmax(row))
+        if (row[best] == -np.inf):
+            raise ValueError("No rush or pass plays in this situation")
+        return [self.actions[best], row[best]]
+
+"""Precomputed situation index so the MDP for any (team, quarter, down, field side) is a lookup instead of a scan over the season"""
+
+# function to count plays by situation: the plays are given as valid codes (team, quarter - 1, down - 1, field side, action) with their
+# outcome flags, and shape is (teams, quarters, downs, field sides, actions)
+# function returns the totals (shaped like shape) and the outcome counts (shape + outcomes), one bincount each
+def count_situations(shape, team, quarter, down, side, action, flags):
+    situation = np.ravel_multi_index((team, quarter, down, side, action), shape)
+    totals = np.bincount(situation, minlength=np.prod(shape)).reshape(shape)
+    cells = (situation[:, None] * len(OUTCOMES)) + np.arange(len(OUTCOMES))
+    counts = np.bincount(cells[flags], minlength=np.prod(shape) * len(OUTCOMES)).reshape(shape + (len(OUTCOMES),))
+    return totals, counts
+
+# function to find the MDP pick of many situations at once from their probabilities (situations..., actions, outcomes) and totals (situations..., actions):
+# the (action, outcome) pair worth the most, the first one on a tie in (play type, formation, outcome) order like MDP.decision()
+# function returns the action (-1 for a situation without plays), the outcome, and the value (-inf without plays) of every situation
+def mdp_picks(probabilities, totals, reward):
+    values = probabilities * outcome_rewards(reward)
+    values[totals == 0] = -np.inf
+    flat = values.reshape(totals.shape[:-1] + (-1,))
+    best = np.argmax(flat, axis=-1)
+    value = np.take_along_axis(flat, best[..., None], axis=-1)[..., 0]
+    action, outcome = np.divmod(best, len(OUTCOMES))
+    return np.where(value > -np.inf, action, -1), outcome, value
+
+# class to hold the MDP's outcome counts for every situation of a season
+# counts are stored in one dense array of shape (teams, quarters, downs, field sides, actions, outcomes) where
+# an action is play type code * number of formations + formation code (same encoding MDP.calculate uses)
+# the counts for a quarter already include its "other quarter" (Q1 with Q2, Q3 with Q4, and OT with Q4) just like markov_reorganize()
+class SituationIndex:
+    sides = ['OWN', 'OPP']
+    # quarter (0-based) whose plays are added to each quarter's plays
+    other_quarter = [1, 0, 3, 2, 3]
+
+    # "constructor" builds the whole index from the season's derived plays (output of derive_features()) in one pass
+    @timed('SituationIndex')
+    def __init__(self, data):
+        team, self.teams = encode(data['OffenseTeam'])
+        action, formations = encode_actions(data)
+        self.formations = np.asarray(formations, dtype=object)
+        side = side_codes(data)
+        quarter = data['Quarter'].to_numpy().astype(np.intp) - 1
+        down = data['Down'].to_numpy().astype(np.intp) - 1
+
+        # plays with a missing team, formation, or field side (or a quarter past overtime) can't be placed in a situation
+        keep = (team >= 0) & (action >= 0) & (side >= 0) & (quarter >= 0) & (quarter < 5)
+        flags = data[OUTCOME_COLUMNS].to_numpy(dtype=bool)[keep]
+
+        self.shape = (len(self.teams), 5, 4, 2, len(PLAY_TYPES) * len(formations))
+        self.set_counts(*count_situations(self.shape, team[keep], quarter[keep], down[keep], side[keep], action[keep], flags))
+
+    # function to make an index from counts made elsewhere (e.g. by fit_parallel()), shaped like the ones the constructor counts
+    @classmethod
+    def from_counts(cls, teams, formations, totals, counts):
+        index = cls.__new__(cls)
+        index.teams = list(teams)
+        index.formations = np.asarray(formations, dtype=object)
+        index.shape = totals.shape
+        index.set_counts(totals, counts)
+        return index
+
+    # function to save the per quarter counts, add in the other quarter's plays, and turn the frequencies into probabilities once for every situation
+    def set_counts(self, totals, counts):
+        self.quarter_totals = totals
+        self.quarter_counts = counts
+        self.totals = totals + totals[:, self.other_quarter]
+        self.counts = counts + counts[:, self.other_quarter]
+        self.probabilities = np.zeros(self.counts.shape)
+        np.divide(self.counts, self.totals[..., None], out=self.probabilities, where=(self.totals[..., None] > 0))
+
+    # function to fold newly observed plays into the index, only the new plays are counted
+    # the index keeps the teams and formations it was built with, so plays of an unknown team or formation are skipped
+    def update(self, plays):
+        team = pd.Index(self.teams).get_indexer(plays['OffenseTeam'].astype(str))
+        action, _ = encode_actions(plays, self.formations)
+        side = side_codes(plays)
+        quarter = plays['Quarter'].to_numpy().astype(np.intp) - 1
+        down = plays['Down'].to_numpy().astype(np.intp) - 1
+        keep = (team >= 0) & (action >= 0) & (side >= 0) & (quarter >= 0) & (quarter < 5)
+        flags = plays[OUTCOME_COLUMNS].to_numpy(dtype=bool)[keep]
+
+        totals, counts = count_situations(self.shape, team[keep], quarter[keep], down[keep], side[keep], action[keep], flags)
+        self.set_counts(self.quarter_totals + totals, self.quarter_counts + counts)
+
+    # function to find the position of a situation in the index
+    def locate(self, quarter, down, team, field_side):
+        if team not in self.teams:
+            raise ValueError("Unknown team " + str(team))
+        return (self.teams.index(team), quarter_number(quarter) - 1, int(down) - 1, self.sides.index(field_side))
+
+    # function to get the MDP arrays for one situation
+    # returns the formation names plus the counts, totals, and probabilities shaped (play types, formations[, outcomes]) the way MDP uses them
+    def lookup(self, quarter, down, team, field_side):
+        cell = self.locate(quarter, down, team, field_side)
+        actions = (len(PLAY_TYPES), len(self.formations))
+        return (self.formations, self.counts[cell].reshape(actions + (len(OUTCOMES),)), self.totals[cell].reshape(actions),
+                self.probabilities[cell].reshape(actions + (len(OUTCOMES),)))
+
+    # function to decide the most optimal play for a situation (same output as MDP.decision())
+    def decision(self, reward, quarter, down, team, field_side):
+        return MDP.from_index(reward, self, quarter, down, team, field_side).decision()
+
 """Implement Hidden Markov Model to generate sequence of play outcomes that can lead to a TD"""
 
+# function to count play type transitions (previous play type x next play type) between plays that follow each other in the same drive
+# (sequence is every play's drive, or game); group (e.g. every play's team) splits the counts into n_groups tables
+# function returns an (n_groups, play types, play types) array
+def count_play_transitions(play_type, sequence, group=None, n_groups=1):
+    group = np.zeros(len(play_type), dtype=np.intp) if group is None else group
+    follows = sequence[1:] == sequence[:-1]
+    cell = (((group[1:][follows] * len(PLAY_TYPES)) + play_type[:-1][follows]) * len(PLAY_TYPES)) + play_type[1:][follows]
+    return np.bincount(cell, minlength=n_groups * len(PLAY_TYPES) ** 2).reshape(n_groups, len(PLAY_TYPES), len(PLAY_TYPES))
+
+# function to count play results (play type x [no result] + OUTCOMES) from the plays' outcome flags, each play counts for its first raised flag
+# (a play with none still counts toward its play type's total); group splits the counts into n_groups tables
+# function returns an (n_groups, play types, outcomes + 1) array
+def count_play_results(play_type, flags, group=None, n_groups=1):
+    group = np.zeros(len(play_type), dtype=np.intp) if group is None else group
+    result = np.select(list(np.asarray(flags).T), range(len(OUTCOMES)), -1)
+    cell = (((group * len(PLAY_TYPES)) + play_type) * (len(OUTCOMES) + 1)) + result + 1
+    return np.bincount(cell, minlength=n_groups * len(PLAY_TYPES) * (len(OUTCOMES) + 1)).reshape(n_groups, len(PLAY_TYPES), len(OUTCOMES) + 1)
+
 # class to implement a hidden markov model
 # this will be similar to the MDP class as the observed states will be the play results (first down, TD, etc)
 # and the hidden states will be the play type, pass or fail
 class HMM:
     # "constructor" to save necessary values into class and begin process
-    def __init__(self, data, quarter):
+    # the model is fit once; drives are then drawn from it with generate_drive() or sample_drives() (seed makes the drives repeatable)
+    def __init__(self, data, quarter, seed=None):
         # save dataset to class
         self.data = data
         self.quarter = str(quarter)
+        self.rng = np.random.default_rng(seed)
+        self.hidden_states = ['RUSH', 'PASS']
+        self.observed_states = ['FirstDown', 'NextDown', 'Touchdown', 'Turnover', 'NegativePlay']
 
-        self.calculate()
-
+        # an HMM can also be made from counts made elsewhere (see from_counts()), in which case there's nothing to calculate
+        if data is not None:
+            self.calculate()
+
+    # function to make an HMM from transition counts (previous play type x next play type) and result counts
+    # (play type x [no result] + observed_states), e.g. from fit_parallel()
+    @classmethod
+    def from_counts(cls, transitions, results, quarter, seed=None):
+        hmm = cls(None, quarter, seed)
+        hmm.set_counts(transitions, results)
+        return hmm
+
+    # function to fit the hidden (play type to play type) and observed (play type to play result) probabilities
+    # transitions are counted from each play and the one before it with one bincount over (previous, current) play type codes;
+    # a play only follows the one before it when both are in the same drive (or the same game if the data has no drive numbers),
+    # so the last play of one game or drive is never chained into the first play of the next
+    # results are counted with one bincount over (play type, result) codes, each play counts for its first result in the order of observed_states
+    @timed('HMM.calculate')
     def calculate(self):
-        plays = ['RUSH', 'PASS']
-
-        # make data frame for probabilities related to hidden states (rush and pass)
-        hidden = pd.DataFrame({'Pass-Pass':0.0, 'Pass-Rush':0.0, 'Rush-Pass':0.0, 'Rush-Rush':0.0, 'TotalPlays':0.0}, index=plays)
-
-
-        # make a data frame for probabilities related to observed states (play results: first down, next down, TD, turnover, negative play)
-        observed = pd.DataFrame({'FirstDown':0.0, 'NextDown':0.0, 'Touchdown':0.0, 'Turnover':0.0, 'NegativePlay':0.0, 'TotalPlays':0.0}, index=plays)
-
-        # variable to hold previous play type
-        prev = None
-        # helper variable
-        i = 0
-        for row in self.data.itertuples():
-            if (i == 0):
-                prev = row.PlayType
-                i = i + 1
-            else:
-                if (row.PlayType == 'PASS'):
-                    if (prev == 'PASS'):
-                        hidden.loc['PASS', 'Pass-Pass'] = hidden.loc['PASS', 'Pass-Pass'] + 1
-                    elif (prev == 'RUSH'):
-                        hidden.loc['PASS', 'Rush-Pass'] = hidden.loc['PASS', 'Rush-Pass'] + 1
-                    hidden.loc['PASS', 'TotalPlays'] = hidden.loc['PASS', 'TotalPlays'] + 1
-                elif (row.PlayType == 'RUSH'):
-                    if (prev == 'PASS'):
-                        hidden.loc['RUSH', 'Pass-Rush'] = hidden.loc['RUSH', 'Pass-Rush'] + 1
-                    elif (prev == 'RUSH'):
-                        hidden.loc['RUSH', 'Rush-Rush'] = hidden.loc['RUSH', 'Rush-Rush'] + 1
-                    hidden.loc['RUSH', 'TotalPlays'] = hidden.loc['RUSH', 'TotalPlays'] + 1
-                prev = row.PlayType
-
-
-            if ((row.PlayType == 'PASS') | (row.PlayType == 'RUSH')):
-                if (row.NextDown == '1'):
-                    observed.loc[row.PlayType, 'FirstDown'] = observed.loc[row.PlayType, 'FirstDown'] + 1
-                elif ((row.NextDown != '1') & (row.NextDown != 'TD') & (row.NextDown != 'TO')):
-                    observed.loc[row.PlayType, 'NextDown'] = observed.loc[row.PlayType, 'NextDown'] + 1
-                elif (row.IsTouchdown == True):
-                    observed.loc[row.PlayType, 'Touchdown'] = observed.loc[row.PlayType, 'Touchdown'] + 1
-                elif (row.IsTurnover == True):
-                    observed.loc[row.PlayType, 'Turnover'] = observed.loc[row.PlayType, 'Turnover'] + 1
-                elif (row.IsNegativePlay == True):
-                    observed.loc[row.PlayType, 'NegativePlay'] = observed.loc[row.PlayType, 'NegativePlay'] + 1
-                observed.loc[row.PlayType, 'TotalPlays'] = observed.loc[row.PlayType, 'TotalPlays'] + 1
-
-        # turn frequencies into probailities
-        for row in hidden.itertuples():
-            each = row.Index
-            hidden.loc[each, 'Pass-Pass'] = hidden.loc[each, 'Pass-Pass'] / hidden.loc[each, 'TotalPlays']
-            hidden.loc[each, 'Pass-Rush'] = hidden.loc[each, 'Pass-Rush'] / hidden.loc[each, 'TotalPlays']
-            hidden.loc[each, 'Rush-Pass'] = hidden.loc[each, 'Rush-Pass'] / hidden.loc[each, 'TotalPlays']
-            hidden.loc[each, 'Rush-Rush'] = hidden.loc[each, 'Rush-Rush'] / hidden.loc[each, 'TotalPlays']
-
-        for row in observed.itertuples():
-            each = row.Index
-            observed.loc[each, 'FirstDown'] = observed.loc[each, 'FirstDown'] / observed.loc[each, 'TotalPlays']
-            observed.loc[each, 'NextDown'] = observed.loc[each, 'NextDown'] / observed.loc[each, 'TotalPlays']
-            observed.loc[each, 'Touchdown'] = observed.loc[each, 'Touchdown'] / observed.loc[each, 'TotalPlays']
-            observed.loc[each, 'Turnover'] = observed.loc[each, 'Turnover'] / observed.loc[each, 'TotalPlays']
-            observed.loc[each, 'NegativePlay'] = observed.loc[each, 'NegativePlay'] / observed.loc[each, 'TotalPlays']
-
-
-        # save hidden and observed data frames into class
-        self.hidden_states = plays
-        self.p_hidden = hidden.drop('TotalPlays', axis=1)
-        self.observed_states = ['FirstDown', 'NextDown', 'Touchdown', 'Turnover', 'NegativePlay']
-        self.p_observed = observed.drop('TotalPlays', axis=1)
+        play_type = play_type_codes(self.data)
+
+        # transitions (row is the previous play type, column the next one) and results
+        sequence = self.data['DriveId' if 'DriveId' in self.data.columns else 'GameId'].to_numpy()
+        transitions = count_play_transitions(play_type, sequence)[0]
+        results = count_play_results(play_type, self.data[OUTCOME_COLUMNS].to_numpy(dtype=bool))[0]
+
+        # remember the last play so plays added later by update() can follow it
+        self.last_play = (play_type[-1], sequence[-1]) if len(play_type) else None
+        self.set_counts(transitions, results)
+
+    # function to fold newly observed plays (that come after the ones already counted) into the counts without recounting the old ones
+    # the first new play follows the last counted play if both are in the same drive
+    def update(self, plays):
+        if len(plays) == 0:
+            return
+        play_type = play_type_codes(plays)
+        sequence = plays['DriveId' if 'DriveId' in plays.columns else 'GameId'].to_numpy()
+
+        previous = getattr(self, 'last_play', None)
+        if previous is not None:
+            play_type_before = np.concatenate([[previous[0]], play_type])
+            sequence_before = np.concatenate([[previous[1]], sequence])
+        else:
+            play_type_before, sequence_before = play_type, sequence
+        transitions = count_play_transitions(play_type_before, sequence_before)[0]
+        results = count_play_results(play_type, plays[OUTCOME_COLUMNS].to_numpy(dtype=bool))[0]
+
+        self.last_play = (play_type[-1], sequence[-1])
+        self.set_counts(self.transition_counts + transitions, self.result_counts + results)
+
+    # function to save the counts and turn them into probabilities
+    def set_counts(self, transitions, results):
+        plays = self.hidden_states
+        self.transition_counts = transitions
+        self.result_counts = results
+        totals = results.sum(axis=1, keepdims=True)
+        observed = results[:, 1:]
+
+        # save probabilities as data frames into class (for reporting)
+        hidden_totals = transitions.sum(axis=1, keepdims=True)
+        self.p_hidden = pd.DataFrame(np.divide(transitions, hidden_totals, out=np.zeros(transitions.shape), where=(hidden_totals > 0)), index=plays, columns=plays)
+        self.p_observed = pd.DataFrame(np.divide(observed, totals, out=np.zeros(observed.shape), where=(totals > 0)), index=plays, columns=self.observed_states)
+
+        self.prepare_sampler(transitions, observed)
+
+    # function to save the fitted probabilities as arrays with precomputed cumulative distributions for the drive sampler
+    # rows that can't be normalized (a play type with no plays) fall back to an even split
+    # on fourth down a 'NextDown' result isn't allowed, so a second set of emission probabilities with 'NextDown' taken out is kept for it
+    # (same as redrawing until the result isn't 'NextDown')
+    def prepare_sampler(self, transitions, emissions):
+        def normalize(rows):
+            rows = np.nan_to_num(np.asarray(rows, dtype=float))
+            totals = rows.sum(axis=1, keepdims=True)
+            return np.where(totals > 0, rows / np.where(totals > 0, totals, 1), 1.0 / rows.shape[1])
+
+        self.transitions = normalize(transitions)
+        self.emissions = normalize(emissions)
+        fourth_down = self.emissions.copy()
+        fourth_down[:, self.observed_states.index('NextDown')] = 0
+        # a play type that only ever leads to 'NextDown' keeps its normal probabilities instead of redrawing forever
+        fourth_down = np.where(fourth_down.sum(axis=1, keepdims=True) > 0, fourth_down, self.emissions)
+        self.fourth_down_emissions = normalize(fourth_down)
+
+        self.transition_cdf = np.cumsum(self.transitions, axis=1)
+        self.emission_cdf = np.cumsum(self.emissions, axis=1)
+        self.fourth_down_cdf = np.cumsum(self.fourth_down_emissions, axis=1)
+        # make sure the last bin always catches a uniform draw even with rounding
+        for cdf in (self.transition_cdf, self.emission_cdf, self.fourth_down_cdf):
+            cdf[:, -1] = 1.0
+
+    # function to generate many possible play outcome sequences at once, all drives are advanced together one play at a time
+    # each drive starts as a rush or pass with even odds and runs until a touchdown or max_plays results (16, like generate_drive() always allowed)
+    # the down is tracked so a drive never goes past fourth down
+    # function returns an (n x max_plays) int array of result codes (index into observed_states, -1 after the drive ended),
+    # the length of every drive, and whether it ended in a touchdown
+    @timed('HMM.sample_drives')
+    def sample_drives(self, n, seed=None, max_plays=16):
+        rng = self.rng if seed is None else np.random.default_rng(seed)
+        first_down = self.observed_states.index('FirstDown')
+        next_down = self.observed_states.index('NextDown')
+        touchdown = self.observed_states.index('Touchdown')
+
+        outcomes = np.full((n, max_plays), -1, dtype=np.int8)
+        lengths = np.zeros(n, dtype=np.int64)
+        down = np.ones(n, dtype=np.int8)
+        alive = np.ones(n, dtype=bool)
+        state = (rng.random(n) >= 0.5).astype(np.intp)
+
+        for step in range(max_plays):
+            if step > 0:
+                state = np.minimum((rng.random(n)[:, None] > self.transition_cdf[state]).sum(axis=1), len(self.hidden_states) - 1)
+            cdf = np.where((down == 4)[:, None], self.fourth_down_cdf[state], self.emission_cdf[state])
+            observe = np.minimum((rng.random(n)[:, None] > cdf).sum(axis=1), len(self.observed_states) - 1)
+
+            outcomes[alive, step] = observe[alive]
+            lengths += alive
+            down = np.where(observe == first_down, 1, np.where((observe == next_down) & (down < 4), down + 1, down)).astype(np.int8)
+            alive &= (observe != touchdown)
+            if not alive.any():
+                break
+
+        scored = outcomes[np.arange(n), lengths - 1] == touchdown
+        return outcomes, lengths, scored
 
-        self.generate_drive()
+    # function to estimate how likely a drive is to end in a touchdown from n sampled drives
+    def touchdown_probability(self, n=100000, seed=None):
+        return self.sample_drives(n, seed)[2].mean()
 
     # function to generate possible play outcome sequence starting from inputted field side to end in a TD
     # function is based off the observeGenerating() function in hmm.ipynb shared by Professor Alam
     def generate_drive(self):
-        # empty list to store the drive plays
-        drive = []
-
-        # variable to prevent drive from having 4+ downs before first down or touchdown
-        # should always be in range of 1-4; can never be > 4
-        current_down = 1
-
-        state = np.random.choice(self.hidden_states, 1, p = [0.5, 0.5])[0]
-
-        observe = np.random.choice(self.observed_states, 1, p = self.p_observed.loc[state].tolist())[0]
-        if (observe == 'FirstDown'):
-            current_down = 1
-        elif ((observe == 'NextDown') & (current_down < 4)):
-            current_down = current_down + 1
-        drive.append(observe)
-
-        for i in range(15):
-            # make list of probability to go to next hidden state based on current state
-            # but normalize first
-            if (state == 'RUSH'):
-                norm = self.p_hidden.loc[state, 'Rush-Rush'] + self.p_hidden.loc[state, 'Rush-Pass']
-                hidden_prob = [self.p_hidden.loc[state, 'Rush-Rush'] / norm, self.p_hidden.loc[state, 'Rush-Pass'] / norm]
-            else:
-                norm = self.p_hidden.loc[state, 'Pass-Rush'] + self.p_hidden.loc[state, 'Pass-Pass']
-                hidden_prob = [self.p_hidden.loc[state, 'Pass-Rush'] / norm, self.p_hidden.loc[state, 'Pass-Pass'] / norm]
-
-            state = np.random.choice(self.hidden_states, 1, p = hidden_prob)[0]
-            observe = np.random.choice(self.observed_states, 1, p = self.p_observed.loc[state].tolist())[0]
-
-            while ((observe == 'NextDown') & (current_down == 4)):
-                observe = np.random.choice(self.observed_states, 1, p = self.p_observed.loc[state].tolist())[0]
-            if ((observe == 'NextDown') & (current_down < 4)):
-                current_down = current_down + 1
-            elif (observe == 'FirstDown'):
-                current_down = 1
-
-            drive.append(observe)
-
-            if observe == 'Touchdown':
-                break
-
+        outcomes, lengths, scored = self.sample_drives(1)
+        drive = [self.observed_states[o] for o in outcomes[0][:lengths[0]]]
 
         print(" ".join(drive))
 
-        # if after all 15 iteration, no TD scored
-        if (len(drive) == 15):
-            if (drive[14] != 'Touchdown'):
-                print("Touchdown unlikely in the sequence")
+        # if the drive ran out of plays without a TD
+        if not scored[0]:
+            print("Touchdown unlikely in the sequence")
+
+        return drive
 
 """# Q-Learning
 Implemented q-learning to determine most optimal play in given situation. Class will analyze dataset and update q-values corresponding to the current state. Once all q-values are updated, it'll choose the max q-value in the user given state.
 """
 
+# function to encode the plays' situations and results as integer arrays for q-learning
+# function takes derived plays and returns a dictionary of arrays: quarter (0-4), side (0 is OWN, 1 is OPP), state (down - 1), and
+# next_state (index into Q.states; a negative play goes to the NegativePlay state no matter what the next down is)
+def encode_transitions(data):
+    return {'quarter': data['Quarter'].to_numpy().astype(np.intp) - 1,
+            'side': (data['YardLineDirection'] != 'OWN').to_numpy().astype(np.intp),
+            'state': data['Down'].to_numpy().astype(np.intp) - 1,
+            'next_state': np.where(data['IsNegativePlay'].to_numpy(dtype=bool), len(Q.states) - 1, data['NextDownCode'].to_numpy().astype(np.intp) - 1)}
+
+# function to turn reward lists in the order [Turnover, Negative Play, Next Down, First Down, Touchdown] into rewards indexed by Q.states
+# works for one list (returns 7 values) or a (k x 5) matrix of lists (returns k x 7)
+def state_rewards(reward):
+    return np.asarray(reward, dtype=float)[..., [3, 2, 2, 2, 4, 0, 1]]
+
+# function to run one q-learning pass over pre-encoded plays
+# tables has shape (number of tables, states, actions) and is updated in place; every play says which table it updates
+# tables can also have a leading reward axis (k, number of tables, states, actions) with rewards of shape (k, states);
+# then every play updates all k tables with one array operation
+# the update reads the value just written by the previous play, so plays are gone through one at a time in order
+# will evaluate the following equation for each play:
+#      Q(s, a) <- Q(s, a) + (learning_rate)[reward + (discount)(max(Q(s', a')) - Q(s, a)]
+def q_learning_pass(tables, table, state, action, next_state, state_rewards, learning_rate=0.3, discount=0.4):
+    # learning_rate makes sure agent learns from new experience, but still values older experience as there should be more older plays versus just one new play
+    plays = zip(table.tolist(), state.tolist(), action.tolist(), next_state.tolist())
+    if tables.ndim == 4:
+        # columns of rewards so rewards[next state] is the k rewards for that state
+        rewards = np.ascontiguousarray(state_rewards.T)
+        for t, s, a, next_s in plays:
+            current_q = tables[:, t, s, a]
+            max_next_q = tables[:, t, next_s].max(axis=1)
+            tables[:, t, s, a] = current_q + (learning_rate) * (rewards[next_s] + ((discount) * (max_next_q)) - current_q)
+        return
+
+    rewards = state_rewards.tolist()
+    for t, s, a, next_s in plays:
+        current_q = tables[t, s, a]
+        max_next_q = tables[t, next_s].max()
+        tables[t, s, a] = current_q + (learning_rate) * (rewards[next_s] + ((discount) * (max_next_q)) - current_q)
+
+# function to train q-tables to convergence by replaying the plays over and over instead of going through them once
+# takes the same arrays as q_learning_pass() (tables are updated in place and can have a leading reward axis) and returns one dictionary of
+# stats per epoch: the epoch, the learning rate used, the largest and mean change of any q-value in that epoch, and how long it took
+# every epoch goes through all plays in batches; a batch reads the values from before the batch and each (table, state, action) cell moves
+# by the learning rate times the mean error of its plays in the batch
+#   - without a batch size every epoch is one batch of all plays, so a value depends on how often each result happened and not on the order
+#     of the plays, and the values settle on a fixed point
+#   - with a batch size the plays are shuffled into batches every epoch (batch size 1 is the same one-play-at-a-time update as
+#     q_learning_pass()); decay lowers the learning rate every epoch (learning_rate / (1 + decay * epoch)) so the values can settle
+# training stops early once no q-value changes by tol or more in an epoch
+def replay_q_learning(tables, table, state, action, next_state, state_rewards, epochs=200, batch_size=None, tol=1e-6, decay=0.0, seed=None,
+                      learning_rate=0.3, discount=0.4):
+    rng = np.random.default_rng(seed)
+    stacked = tables if tables.ndim == 4 else tables[None]
+    n_rewards, n_tables, n_states, n_actions = stacked.shape
+    rows = stacked.reshape(n_rewards, n_tables * n_states, n_actions)
+    cells = rows.reshape(n_rewards, -1)
+    rewards = np.atleast_2d(state_rewards)[:, next_state]
+    next_row = (table * n_states) + next_state
+    cell = (((table * n_states) + state) * n_actions) + action
+    finite = np.isfinite(stacked)
+
+    stats = []
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        before = stacked.copy()
+        rate = learning_rate / (1 + (decay * epoch))
+        if batch_size == 1:
+            order = rng.permutation(len(cell))
+            q_learning_pass(tables, table[order], state[order], action[order], next_state[order], state_rewards, rate, discount)
+        else:
+            order = np.arange(len(cell)) if batch_size is None else rng.permutation(len(cell))
+            size = max(len(cell), 1) if batch_size is None else batch_size
+            for begin in range(0, len(order), size):
+                batch = order[begin:begin + size]
+                error = rewards[:, batch] + ((discount) * rows[:, next_row[batch]].max(axis=2)) - cells[:, cell[batch]]
+                batch_cells, inverse, counts = np.unique(cell[batch], return_inverse=True, return_counts=True)
+                inverse = inverse.reshape(-1)
+                for k in range(n_rewards):
+                    cells[k, batch_cells] += (rate) * np.bincount(inverse, weights=error[k], minlength=len(batch_cells)) / counts
+
+        # change of every q-value this epoch (actions a team never ran stay -inf and don't count)
+        change = np.abs(np.where(finite, stacked - np.where(finite, before, 0.0), 0.0))
+        stats.append({'epoch': epoch + 1, 'learning_rate': rate, 'max_delta': float(change.max()) if change.size else 0.0,
+                      'mean_delta': float(change[finite].mean()) if finite.any() else 0.0, 'seconds': time.perf_counter() - start})
+        metrics.count('replay_q_learning.plays', len(cell))
+        if stats[-1]['max_delta'] < tol:
+            break
+
+    return stats
+
 class Q:
     # class variables that are already determined and needed by all or most functions
     # down dictionary to easily translate between read down and down needed for calculations
@@ -445,138 +1144,1442 @@ class Q:
     states = ['FirstDown', 'SecondDown', 'ThirdDown', 'FourthDown', 'Touchdown', 'Turnover', 'NegativePlay']
 
     # "constructor" of class
+    # reward is one list [Turnover, Negative Play, Next Down, First Down, Touchdown], or a (k x 5) matrix of such lists to train k tables at once
+    # (a reward sweep); a sweep stacks the tables on a leading reward axis and its results have one entry per reward list
     def __init__(self, reward, data, quarter, down, field_side):
         self.data = data
-        self.quarter = int(quarter)
+        self.quarter = quarter_number(quarter)
         self.current_down = down
         self.territory = field_side
-
-        # reward dictionary to make it easier to access reward by read next down
-        self.rewards = {"Turnover": reward[0], "NegPlay": reward[1], "SecondDown": reward[2], "ThirdDown": reward[2], "FourthDown": reward[2], "FirstDown": reward[3], "Touchdown": reward[4]}
-
-        self.make_Q_Table()
+        self.sweep = (np.ndim(reward) == 2)
+
+        # reward dictionary to make it easier to access reward by read next down (one per reward list in a sweep)
+        reward_lists = reward if self.sweep else [reward]
+        rewards = [{"Turnover": r[0], "NegPlay": r[1], "SecondDown": r[2], "ThirdDown": r[2], "FourthDown": r[2], "FirstDown": r[3], "Touchdown": r[4]} for r in reward_lists]
+        self.rewards = rewards if self.sweep else rewards[0]
+        # same rewards as an array indexed by state (NegativePlay uses the negative play reward)
+        self.state_rewards = state_rewards(reward)
+
+        # a Q can also be made from pretrained tables (see from_tables()), in which case there's nothing to train
+        if data is not None:
+            self.make_Q_Table()
+
+    # function to make a Q for a team straight from tables trained by train_all() instead of training on the team's plays
+    # takes the tables and the situation; the q-table only has the actions the team actually ran, like a Q trained on its own
+    @classmethod
+    def from_tables(cls, tables, team, quarter, down, field_side):
+        q = cls(tables.rewards, None, quarter, down, field_side)
+        q.actions, q.values = tables.team_table(team)
+        return q
 
     # function to initialize q-table
     # takes no parameters and will use data to make empty q-table where
     # columns are all the actions taken (will not include all possible actions
     # as not every team has taken each action in given situation)
+    # the table is a single array of shape (quarters, field sides, states, actions); quarter 5 is overtime and field side 0 is OWN, 1 is OPP
     # will return no value but will call next function to fill table
+    @timed('Q.make_Q_Table')
     def make_Q_Table(self):
-        # find all formations (actions) for when team does a pass in given situation
-        pass_formations = self.data[self.data['PlayType'] == 'PASS'][['PlayType', 'Formation']]
-        pass_formations = pass_formations['Formation'].unique().tolist()
-        for i in range(len(pass_formations)):
-            pass_formations[i] = pass_formations[i] + " PASS"
-
-        # find all formations (actions) for when team does a rush in given situation
-        rush_formations = self.data[self.data['PlayType'] == 'RUSH'][['PlayType', 'Formation']]
-        rush_formations = rush_formations['Formation'].unique().tolist()
-        for i in range(len(rush_formations)):
-            rush_formations[i] = rush_formations[i] + " RUSH"
-
-        # make list of all possible actions (run and pass)
-        actions = pass_formations + rush_formations
-
-        # make data frame with each action as a column, each state as an index, and fill it with all 0s (by default)
-        # a data frame will be made for each quarter and each field side (to ensure all possible states are included)
+        # encode each play's action as play type code * number of formations + formation code
+        key, formations = encode_actions(self.data)
+
+        # actions are ordered like before: pass formations in the order they first appear, then rush formations
+        keys, first = np.unique(key, return_index=True)
+        keys = keys[column_order(decode_actions(keys, max(len(formations), 1))[0], first)]
+        self.actions = [action_names(formations)[k] for k in keys]
+        metrics.count('Q.plays', len(self.data))
+        metrics.count('Q.actions', len(self.actions))
+
+        # map every play's key to its column in the table
+        column = np.zeros(len(PLAY_TYPES) * max(len(formations), 1), dtype=np.intp)
+        column[keys] = np.arange(len(keys))
+
+        # pre-encode every play as integers so training never touches the data frame
+        self.encoded = encode_transitions(self.data)
+        self.encoded['action'] = column[key]
+
+        # one table of 0s for each quarter and each field side (to ensure all possible states are included)
         # for example, 1st down in the 2nd quarter in opponent territory is not the same as 2nd down in overtime in your own territory
-        # this code snippet could be sorter, but was written out to show full details of what's happening
-        q1_own = pd.DataFrame(0.0, index=self.states, columns=actions)
-        q1_opp = pd.DataFrame(0.0, index=self.states, columns=actions)
-        q2_own = pd.DataFrame(0.0, index=self.states, columns=actions)
-        q2_opp = pd.DataFrame(0.0, index=self.states, columns=actions)
-        q3_own = pd.DataFrame(0.0, index=self.states, columns=actions)
-        q3_opp = pd.DataFrame(0.0, index=self.states, columns=actions)
-        q4_own = pd.DataFrame(0.0, index=self.states, columns=actions)
-        q4_opp = pd.DataFrame(0.0, index=self.states, columns=actions)
-        OT_own = pd.DataFrame(0.0, index=self.states, columns=actions)
-        OT_opp = pd.DataFrame(0.0, index=self.states, columns=actions)
-
-        q1 = [q1_own, q1_opp]
-        q2 = [q2_own, q2_opp]
-        q3 = [q3_own, q3_opp]
-        q4 = [q4_own, q4_opp]
-        ot = [OT_own, OT_opp]
-        self.q_table = [q1, q2, q3, q4, ot]
+        # a sweep has a full set of tables for every reward list
+        self.values = np.zeros(self.state_rewards.shape[:-1] + (5, 2, len(self.states), len(self.actions)))
 
         self.fill_Q_Table()
 
+    # q-table as data frames (a list per quarter of [OWN, OPP] tables with states as the index and actions as the columns)
+    # these are only made when asked for, e.g. by the notebook's reporting cells
+    @property
+    # a sweep gives a list of these, one per reward list
+    def q_table(self):
+        if self.sweep:
+            return [[[pd.DataFrame(values[q][t], index=self.states, columns=self.actions) for t in range(2)] for q in range(5)] for values in self.values]
+        return [[pd.DataFrame(self.values[q][t], index=self.states, columns=self.actions) for t in range(2)] for q in range(5)]
+
     # function to read through data and fill q-table by using q-learning formula
     # q-values for states "Touchdown", "Turnover", and "NegativePlay" will always stay
     # at 0 as there states are terminating plays meaning that no play can occur at these
     # states, plays can only transition to them. They're still in the table to include all details of what's happening
+    @timed('Q.fill_Q_Table')
     def fill_Q_Table(self):
-        # set up constant for Q(s, a) equation
-        discount = 0.4 # as project is supposed to be a simplified play decider meant to be used at amateur level, discount factors will be set to 1 for now
-        learning_rate = 0.3 # this value makes sure agent learns from new experience, but still values older experience as there should be more older plays versus just one new play
-
-        # iterate through data and fill q-table
-        # will evaluate the following equation for each play:
-        #      Q(s, a) <- Q(s, a) + (learning_rate)[reward + (discount)(max(Q(s', a')) - Q(s, a)]
-        for each in self.data.itertuples():
-            each_quarter = 5 if (each.Quarter == "OT") else int(each.Quarter)
-
-            each_down = self.downs[str(each.Down)]
-
-            if (each.NextDown == "1"):
-                each_next_down = "FirstDown"
-            elif (each.NextDown == "2"):
-                each_next_down = "SecondDown"
-            elif (each.NextDown == "3"):
-                each_next_down = "ThirdDown"
-            elif (each.NextDown == "4"):
-                each_next_down = "FourthDown"
-            elif (each.NextDown == "TD"):
-                each_next_down = "Touchdown"
-            else:
-                each_next_down = "Turnover"
-
-            territory = 0 if (each.YardLine == 'OWN') else 1
-
-            each_formation = each.Formation
-            each_play_type = each.PlayType
-
-            action = each_formation + " " + each_play_type
-            current_q = self.q_table[each_quarter - 1][territory].loc[each_down, action]
-
-            if each.IsNegativePlay == True:
-                reward = self.rewards["NegPlay"]
-                each_next_down = "NegativePlay"
-            else:
-                reward = self.rewards[each_next_down]
-
-            max_next_q = self.q_table[each_quarter - 1][territory].loc[each_next_down].max()
-            q_value = current_q + (learning_rate) * (reward + ((discount) * (max_next_q)) - current_q)
-            self.q_table[each_quarter - 1][territory].loc[each_down, action] = q_value
-
-        '''for i in range(5):
-            for j in range(2):
-                print("Q", i + 1)
-                print("OWN" if j == 0 else "OPP")
-                print(self.q_table[i][j])
-                print("\n\n\n")'''
+        # the 10 sub-tables are numbered quarter * 2 + field side
+        table = (self.encoded['quarter'] * 2) + self.encoded['side']
+        tables = self.values.reshape(self.values.shape[:-4] + (-1, len(self.states), len(self.actions)))
+        q_learning_pass(tables, table, self.encoded['state'], self.encoded['action'], self.encoded['next_state'], self.state_rewards)
+
+    # function to refill the q-table by replaying the team's plays until the values stop changing (see replay_q_learning())
+    # training starts over from a table of 0s; the per-epoch stats are returned and saved as self.convergence
+    def replay(self, epochs=200, batch_size=None, tol=1e-6, decay=0.0, seed=None):
+        self.values[...] = 0.0
+        table = (self.encoded['quarter'] * 2) + self.encoded['side']
+        tables = self.values.reshape(self.values.shape[:-4] + (-1, len(self.states), len(self.actions)))
+        self.convergence = replay_q_learning(tables, table, self.encoded['state'], self.encoded['action'], self.encoded['next_state'],
+                                             self.state_rewards, epochs, batch_size, tol, decay, seed)
+        return self.convergence
+
+    # function to fold newly observed plays (that come after the ones already learned from) into the q-table
+    # the same update is run for only the new plays, continuing from the current values; actions the team hadn't run before get a new column of 0s
+    def update(self, plays):
+        if len(plays) == 0:
+            return
+        action, formations = encode_actions(plays)
+        labels = np.array(action_names(formations), dtype=object)[action]
+        columns = {action: i for i, action in enumerate(self.actions)}
+        added = [label for label in dict.fromkeys(labels) if label not in columns]
+        if added:
+            # new columns keep make_Q_Table()'s order: new pass actions go after the other pass actions, new rush actions at the end
+            actions = self.actions + added
+            play_type = [PLAY_TYPES.index(a.rsplit(" ", 1)[1]) for a in actions]
+            actions = [actions[i] for i in column_order(play_type, np.arange(len(actions)))]
+            columns = {action: i for i, action in enumerate(actions)}
+            values = np.zeros(self.values.shape[:-1] + (len(actions),))
+            values[..., [columns[a] for a in self.actions]] = self.values
+            self.actions, self.values = actions, values
+
+        encoded = encode_transitions(plays)
+        action = np.array([columns[label] for label in labels], dtype=np.intp)
+        tables = self.values.reshape(self.values.shape[:-4] + (-1, len(self.states), len(self.actions)))
+        q_learning_pass(tables, (encoded['quarter'] * 2) + encoded['side'], encoded['state'], action, encoded['next_state'], self.state_rewards)
 
     # function to determine most optimal play. Will go to sub-table corresponding to the user's
     # given quarter and field position. Once in this sub-table, it'll look for the row corresponding
     # to the user's inputted down. It'll locate the max q-value in this row and output the corresponding formation
+    # a sweep returns one [action, q-value] per reward list
     def make_decision(self):
         territory = 0 if (self.territory == "OWN") else 1
         # find max q-value in table corresponding to given situation
-        max_q = self.q_table[self.quarter - 1][territory].loc[self.downs[str(self.current_down)]].max() # get the max value
-        max_action = self.q_table[self.quarter - 1][territory].loc[self.downs[str(self.current_down)]].idxmax() # get action of max value
+        row = self.values[..., self.quarter - 1, territory, int(self.current_down) - 1, :]
+        best = np.argmax(row, axis=-1) # get action of max value (first one if there's a tie)
+
+        if self.sweep:
+            return [[self.actions[b], row[i, b]] for i, b in enumerate(best)]
+        return [self.actions[best], row[best]]
+
+    # function to measure how sure make_decision() can be with an online bootstrap: instead of resampling the plays and training n tables
+    # one after another, every play gets a Poisson(1) weight per resample (how many times it would have been drawn) and all n tables learn
+    # in the same single pass, each play's update counting as many times as its weight (learning rate 1 - (1 - learning_rate) ** weight)
+    # function returns a data frame with one row per action: its q-value in this situation, mean bootstrap q-value, confidence interval,
+    # and the share of resamples where it's the best action (sorted by that share)
+    # needs the team's plays, so it only works for a Q trained on plays with one reward list
+    def bootstrap(self, n=1000, confidence=0.9, seed=None, learning_rate=0.3, discount=0.4):
+        if (self.data is None) or self.sweep:
+            raise ValueError("Bootstrap needs a Q trained on the team's plays with one reward list")
+        rng = np.random.default_rng(seed)
+        rates = 1 - ((1 - learning_rate) ** rng.poisson(1.0, size=(len(self.encoded['state']), n)))
+        tables = np.zeros((n, 10, len(self.states), len(self.actions)))
+        table = (self.encoded['quarter'] * 2) + self.encoded['side']
+        rewards = self.state_rewards.tolist()
+
+        plays = zip(table.tolist(), self.encoded['state'].tolist(), self.encoded['action'].tolist(), self.encoded['next_state'].tolist(), rates)
+        for t, s, a, next_s, rate in plays:
+            current_q = tables[:, t, s, a]
+            tables[:, t, s, a] = current_q + (rate) * (rewards[next_s] + ((discount) * tables[:, t, next_s].max(axis=1)) - current_q)
 
-        return [max_action, max_q]
+        territory = 0 if (self.territory == "OWN") else 1
+        values = tables[:, ((self.quarter - 1) * 2) + territory, int(self.current_down) - 1]
+        mean, low, high, p_best = bootstrap_summary(values, confidence)
+        table = pd.DataFrame({'Action': self.actions, 'Value': self.values[self.quarter - 1, territory, int(self.current_down) - 1],
+                              'Mean': mean, 'Low': low, 'High': high, 'PBest': p_best})
+        return table.sort_values('PBest', ascending=False, kind='stable').reset_index(drop=True)
 
         #return f"Most optimal play is a {max_action} due to a q-value of {max_q}"
 
+"""Train q-learning for every team in one pass over the season and keep the trained tables on disk"""
+
+# class to hold the q-tables of every team, trained by train_all()
+# values has shape (teams, quarters, field sides, states, actions) over every action of the season (play type code * number of formations + formation code)
+# actions a team never ran are -inf so they're never the max of a row, exactly as if the team's table didn't have those columns
+class QTables:
+    # "constructor" to save the trained arrays; first is the index of the play where each team first ran each action (used to order the team's columns)
+    def __init__(self, teams, actions, values, first, rewards, data_version=None):
+        self.teams = list(teams)
+        self.actions = list(actions)
+        self.values = values
+        self.first = first
+        self.rewards = [float(r) for r in rewards]
+        self.data_version = data_version
+        # per-epoch stats when the tables were trained with replay (see train_all())
+        self.convergence = None
+
+    # function to get one team's q-table with only the actions the team ran
+    # columns are in the same order Q uses: pass formations in the order they first appear, then rush formations
+    # returns the list of action names and the (quarters, field sides, states, actions) array
+    def team_table(self, team):
+        if team not in self.teams:
+            raise ValueError("Unknown team " + str(team))
+        i = self.teams.index(team)
+        columns = self.team_columns(i)
+        return [self.actions[a] for a in columns], self.values[i][..., columns]
+
+    # function to get the columns (indexes into actions) of the i-th team's q-table in the order team_table() gives them
+    def team_columns(self, i):
+        seen = np.flatnonzero(self.first[i] >= 0)
+        return seen[column_order(decode_actions(seen, len(self.actions) // len(PLAY_TYPES))[0], self.first[i][seen])]
+
+    # function to get every team's q-learning pick (index into actions, -1 for a team that never ran anything) for every
+    # (quarter, field side, state); ties go to the team's first column, same as Q.from_tables(...).make_decision()
+    def best_actions(self):
+        best = np.full(self.values.shape[:4], -1, dtype=np.intp)
+        for i in range(len(self.teams)):
+            columns = self.team_columns(i)
+            if len(columns):
+                best[i] = columns[np.argmax(self.values[i][..., columns], axis=-1)]
+        return best
+
+    # function to fold newly observed plays (that come after the ones already learned from) into every team's table
+    # the tables keep their teams and actions, so plays of an unknown team or formation are skipped;
+    # an action a team runs for the first time starts at 0 and goes after the team's other actions
+    def update(self, plays):
+        formations = [action.rsplit(" ", 1)[0] for action in self.actions[:len(self.actions) // len(PLAY_TYPES)]]
+        team = pd.Index(self.teams).get_indexer(plays['OffenseTeam'].astype(str))
+        action, _ = encode_actions(plays, formations)
+        keep = (team >= 0) & (action >= 0)
+        team, action = team[keep], action[keep]
+        encoded = {name: values[keep] for name, values in encode_transitions(plays).items()}
+
+        # (team, action) pairs in the order they first show up in the new plays
+        cells, first_play = np.unique((team * len(self.actions)) + action, return_index=True)
+        for t, a in zip(*np.divmod(cells[np.argsort(first_play)], len(self.actions))):
+            if self.first[t, a] < 0:
+                self.first[t, a] = self.first[t].max() + 1
+                self.values[t, ..., a] = 0.0
+
+        table = (((team * 5) + encoded['quarter']) * 2) + encoded['side']
+        q_learning_pass(self.values.reshape(-1, len(Q.states), len(self.actions)), table, encoded['state'], action, encoded['next_state'],
+                        state_rewards(self.rewards))
+
+    # function to copy the tables (update() changes the arrays in place)
+    def copy(self):
+        tables = QTables(self.teams, self.actions, self.values.copy(), self.first.copy(), self.rewards, self.data_version)
+        tables.convergence = self.convergence
+        return tables
+
+    # function to save the tables to a .npz file
+    def save(self, path):
+        np.savez(path, teams=np.array(self.teams), actions=np.array(self.actions), values=self.values, first=self.first,
+                 rewards=np.array(self.rewards), data_version=np.array('' if self.data_version is None else self.data_version))
+
+    # function to load tables saved by save()
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            return cls(saved['teams'].tolist(), saved['actions'].tolist(), saved['values'], saved['first'], saved['rewards'].tolist(),
+                       str(saved['data_version']) or None)
+
+# function to train the q-tables of n_teams teams over n_actions actions from plays encoded as arrays in play order (team, quarter - 1,
+# field side (0 is OWN), state, action, next state, like encode_transitions()); rows is every play's position in the season (default 0, 1, ...)
+# every team has 10 sub-tables, numbered (team * 5 + quarter) * 2 + field side, and actions a team never ran are -inf
+# replay can be a dictionary of replay_q_learning() settings to train to convergence instead of with one pass
+# function returns the values (teams, quarters, field sides, states, actions), the row where each team first ran each action (-1 if it never did),
+# and the per-epoch stats of replay (None without replay)
+def fit_q_tables(team, quarter, side, state, action, next_state, n_teams, n_actions, reward, rows=None, replay=None):
+    first = np.full((n_teams, n_actions), -1, dtype=np.int64)
+    cells, first_play = np.unique((team * n_actions) + action, return_index=True)
+    first.reshape(-1)[cells] = first_play if rows is None else rows[first_play]
+
+    values = np.zeros((n_teams, 5, 2, len(Q.states), n_actions))
+    values[np.broadcast_to((first < 0)[:, None, None, None, :], values.shape)] = -np.inf
+    tables = values.reshape(-1, len(Q.states), n_actions)
+    table = (((team * 5) + quarter) * 2) + side
+    convergence = None
+    if replay is None:
+        q_learning_pass(tables, table, state, action, next_state, state_rewards(reward))
+    else:
+        convergence = replay_q_learning(tables, table, state, action, next_state, state_rewards(reward), **replay)
+    return values, first, convergence
+
+# function to find where the tables for a season and reward vector are kept; the file name is keyed by the data hash and the rewards
+# tables trained with replay are also keyed by the replay settings
+def q_tables_path(cache_dir, data_version, reward, replay=None):
+    key = [float(r) for r in reward] if replay is None else [[float(r) for r in reward], sorted(replay.items())]
+    reward_key = hashlib.sha1(json.dumps(key).encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, "q-tables-" + data_version[:12] + "-" + reward_key + ".npz")
+
+# function to train q-learning for every team at once
+# function takes the season's derived plays (output of derive_features()) and a reward list in the order [Turnover, Negative Play, Next Down, First Down, Touchdown]
+# the season is gone through once in order, each play updating its own team's table the same way Q.fill_Q_Table() does
+# if a cache folder is given the tables are saved there keyed by the season's data hash (from load_season()) and the rewards,
+# and a later call with the same season and rewards just loads them; a slice of the season (e.g. some of its games) has no hash of its own, so it isn't cached
+# replay can be a dictionary of replay_q_learning() settings (e.g. {'epochs': 200, 'tol': 1e-6}) to train every team's
+# tables to convergence instead of with one pass; the per-epoch stats are saved as the tables' convergence
+@timed('train_all')
+def train_all(data, reward, cache_dir=None, replay=None):
+    data_version = stored_data_version(data)
+    path = None
+    if (cache_dir is not None) & (data_version is not None):
+        path = q_tables_path(cache_dir, data_version, reward, replay)
+        if os.path.exists(path):
+            metrics.count('q_tables_cache.hit')
+            return QTables.load(path)
+        metrics.count('q_tables_cache.miss')
+
+    team, teams = encode(data['OffenseTeam'])
+    action, formations = encode_actions(data)
+    actions = action_names(formations)
+
+    encoded = encode_transitions(data)
+    values, first, convergence = fit_q_tables(team, encoded['quarter'], encoded['side'], encoded['state'], action, encoded['next_state'],
+                                              len(teams), len(actions), reward, replay=replay)
+
+    tables = QTables(teams, actions, values, first, reward, data_version)
+    tables.convergence = convergence
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tables.save(path)
+
+    return tables
+
+"""# Fine-Grained Q-Learning
+Q-learning over much finer situations than Q's 7 states per quarter and field side: (down, distance, 10 yard field zone, game clock, score
+differential). Almost none of the possible situations ever happen, so the table only has a row for every situation that did: the situations
+are kept as sorted integer keys next to a (situations x actions) array of values, and memory grows with the situations seen instead of all of them.
+A play's next situation is the next play of the same drive; touchdowns, turnovers, and the last play of a drive end the drive.
+"""
+
+# upper ends of the distance buckets (yards to go): 1, 2, 3, 4-6, 7-9, 10, 11-15, 16+
+FINE_DISTANCE_EDGES = [1, 2, 3, 6, 9, 10, 15]
+# starts (seconds left in the quarter) of the clock buckets inside every quarter: under 2 minutes, 2-5, 5-10, and 10-15 minutes left
+FINE_CLOCK_EDGES = [120, 300, 600]
+# score differential buckets (offense's score minus defense's): down 9+, down 1-8, tied, up 1-8, up 9+
+FINE_SCORE_EDGES = [-8, 0, 1, 9]
+
+# function to encode every play's fine situation as one integer key
+# function takes derived plays, the team code of every play, and the number of teams; the score is only used when the plays have a
+# 'ScoreDifferential' column (the play-by-play csv doesn't have one), otherwise every play is in the tied bucket
+def fine_state_keys(data, team, n_teams):
+    distance = np.searchsorted(FINE_DISTANCE_EDGES, data['ToGo'].to_numpy(), side='left')
+    zone = np.clip(data['YardLine'].to_numpy().astype(np.intp) // 10, 0, 9)
+    seconds = (data['Minute'].to_numpy().astype(np.intp) * 60) + data['Second'].to_numpy().astype(np.intp)
+    clock = ((data['Quarter'].to_numpy().astype(np.intp) - 1) * (len(FINE_CLOCK_EDGES) + 1)) + np.searchsorted(FINE_CLOCK_EDGES, seconds, side='right')
+    if 'ScoreDifferential' in data.columns:
+        score = np.searchsorted(FINE_SCORE_EDGES, data['ScoreDifferential'].to_numpy(), side='right')
+    else:
+        score = np.full(len(data), FINE_SCORE_EDGES.index(0) + 1)
+    down = data['Down'].to_numpy().astype(np.intp) - 1
+    return np.ravel_multi_index((team, down, distance, zone, clock, score), (n_teams,) + FineQ.shape).astype(np.int64)
+
+# function to run one q-learning pass over plays of the fine table
+# values is the (situations x actions) array and is updated in place; next_state is the row of the play's next situation, or -1 when the drive ends
+def fine_q_learning_pass(values, state, action, next_state, rewards, learning_rate=0.3, discount=0.4):
+    for s, a, next_s, reward in zip(state.tolist(), action.tolist(), next_state.tolist(), rewards.tolist()):
+        current_q = values[s, a]
+        max_next_q = values[next_s].max() if next_s >= 0 else 0.0
+        values[s, a] = current_q + (learning_rate) * (reward + ((discount) * (max_next_q)) - current_q)
+
+# class to train q-learning on fine situations for one team (plays from q_reorganize()) or every team at once (the whole season's derived plays)
+# reward is a list [Turnover, Negative Play, Next Down, First Down, Touchdown] like Q's; a play's reward comes from its result the same way
+class FineQ:
+    # number of (downs, distance buckets, field zones, clock buckets, score buckets)
+    shape = (4, len(FINE_DISTANCE_EDGES) + 1, 10, 5 * (len(FINE_CLOCK_EDGES) + 1), len(FINE_SCORE_EDGES) + 1)
+
+    def __init__(self, reward, data, learning_rate=0.3, discount=0.4):
+        self.rewards = [float(r) for r in reward]
+        team, self.teams = encode(data['OffenseTeam'])
+        action, formations = encode_actions(data)
+        self.actions = action_names(formations)
+
+        # one row per situation that happened (keys are sorted so a situation is found with a binary search)
+        self.has_score = 'ScoreDifferential' in data.columns
+        self.keys, state = np.unique(fine_state_keys(data, team, len(self.teams)), return_inverse=True)
+        state = state.reshape(-1)
+        self.values = np.zeros((len(self.keys), len(self.actions)))
+        # actions that were run in each situation (only those can be recommended)
+        self.tried = np.zeros(self.values.shape, dtype=bool)
+        self.tried[state, action] = True
+
+        # next situation is the next play of the same drive unless the play scored or turned the ball over
+        coarse = encode_transitions(data)
+        sequence = data['DriveId' if 'DriveId' in data.columns else 'GameId'].to_numpy()
+        next_state = np.full(len(state), -1, dtype=np.intp)
+        follows = sequence[1:] == sequence[:-1]
+        next_state[:-1][follows] = state[1:][follows]
+        next_state[np.isin(coarse['next_state'], [Q.states.index('Touchdown'), Q.states.index('Turnover')])] = -1
+
+        with metrics.span('FineQ.fill'):
+            fine_q_learning_pass(self.values, state, action, next_state, state_rewards(self.rewards)[coarse['next_state']], learning_rate, discount)
+        metrics.count('FineQ.situations', len(self.keys))
+
+    # memory the table takes in bytes (grows with the situations seen, not with all possible situations)
+    @property
+    def nbytes(self):
+        return self.keys.nbytes + self.values.nbytes + self.tried.nbytes
+
+    # the table as a data frame with one row per situation seen (team, down, distance, zone, clock, score buckets) and one column
+    # per action; actions never run in a situation are empty
+    @property
+    def q_table(self):
+        team, down, distance, zone, clock, score = np.unravel_index(self.keys, (len(self.teams),) + self.shape)
+        index = pd.MultiIndex.from_arrays([np.asarray(self.teams, dtype=object)[team], down + 1, distance, zone, clock, score],
+                                          names=['Team', 'Down', 'Distance', 'Zone', 'Clock', 'Score'])
+        return pd.DataFrame(np.where(self.tried, self.values, np.nan), index=index, columns=self.actions)
+
+    # function to determine the best play for a team's exact situation; minute and second are the time left in the quarter
+    # (the score differential is only used if the table was trained with one)
+    # function returns [action, value] like Q.make_decision() and raises ValueError if the team has no plays in that situation
+    def make_decision(self, team, quarter, down, to_go, yard_line, minute, second, score_differential=None):
+        situation = pd.DataFrame({'Quarter': [quarter_number(quarter)], 'Down': [int(down)], 'ToGo': [to_go], 'YardLine': [yard_line],
+                                  'Minute': [minute], 'Second': [second]})
+        if self.has_score:
+            situation['ScoreDifferential'] = 0 if score_differential is None else score_differential
+        if str(team).upper() not in self.teams:
+            raise ValueError("Invalid team")
+        key = fine_state_keys(situation, np.array([self.teams.index(str(team).upper())]), len(self.teams))[0]
+        row = np.searchsorted(self.keys, key)
+        if (row >= len(self.keys)) or (self.keys[row] != key):
+            raise ValueError("No plays in this situation")
+        values = np.where(self.tried[row], self.values[row], -np.inf)
+        best = int(np.argmax(values))
+        return [self.actions[best], values[best]]
+
+"""# Drive Simulator
+Monte Carlo drives that keep track of the field: every drive has a down, yards to go, and yard line (0-100 from the offense's own goal line),
+and each play's yards are drawn from the season's plays of the same (down, distance bucket, 10 yard field zone, action). Unlike the HMM's
+drives, these can score field goals, punt, turn the ball over on downs, or take a safety, so they give drive success rates and expected points.
+All drives are advanced together as arrays, one play at a time, so millions of drives take seconds.
+"""
+
+# how a simulated drive can end (the order of DriveSimulator.simulate()'s rate columns) and the points the offense gets for each
+DRIVE_RESULTS = ['Touchdown', 'FieldGoal', 'MissedFieldGoal', 'Punt', 'Turnover', 'TurnoverOnDowns', 'Safety', 'Unfinished']
+DRIVE_POINTS = np.array([7, 3, 0, 0, 0, 0, -2, 0])
+
+# function to turn yard lines (0-100 from the offense's own goal line) into 10 yard field zones (0-9)
+def field_zone(yard_line):
+    return np.clip(np.asarray(yard_line) // 10, 0, 9).astype(np.intp)
+
+# function for the chance a field goal tried from yard_line is good
+# the kick is 17 yards longer than the distance to the goal line (snap plus end zone), and about 1 in 100 fewer kicks are good per extra yard
+def field_goal_rate(yard_line):
+    distance = (100 - np.asarray(yard_line)) + 17
+    return np.clip(1.2 - (0.01 * distance), 0.0, 0.99)
+
+# class to simulate drives from the yards gained on the season's plays
+# a policy says which action (index into actions) is run in every (down, distance bucket, field zone) and has shape (4, 3, 10)
+class DriveSimulator:
+    # fewest plays a (down, distance bucket, field zone, action) needs to be drawn from; with fewer the yards are drawn from the same
+    # (down, distance bucket, action) over the whole field, then from all of the action's plays, then from every play
+    min_plays = 5
+
+    # "constructor" sorts the plays (output of derive_features(), the league's or a single team's) into one pool per cell
+    # only the yards and whether the ball was lost on the play (interception or fumble) are drawn, a turnover on downs comes from the simulated downs
+    @timed('DriveSimulator')
+    def __init__(self, data, min_plays=None):
+        if min_plays is not None:
+            self.min_plays = min_plays
+        action, formations = encode_actions(data)
+        self.actions = action_names(formations)
+        keep = (action >= 0) & data['Yards'].notna().to_numpy() & data['YardLine'].notna().to_numpy()
+        if not keep.any():
+            raise ValueError("No rush or pass plays to draw yards from")
+
+        action = action[keep]
+        down = data['Down'].to_numpy().astype(np.intp)[keep] - 1
+        distance = data['DistanceBucket'].to_numpy().astype(np.intp)[keep]
+        zone = field_zone(data['YardLine'].to_numpy()[keep])
+        yards = data['Yards'].to_numpy().astype(np.int64)[keep]
+        lost = (data['IsTurnover'].to_numpy(dtype=bool) & (data['NextDownCode'].to_numpy() != NEXT_DOWN_TO))[keep]
+
+        # every level is (key of each play, key of each cell, number of keys); a cell takes the first level with enough plays
+        self.shape = (4, len(DISTANCE_BUCKETS), 10, len(self.actions))
+        cell_down, cell_distance, _, cell_action = np.indices(self.shape).reshape(4, -1)
+        coarse = (4, len(DISTANCE_BUCKETS), len(self.actions))
+        levels = [(np.ravel_multi_index((down, distance, zone, action), self.shape), np.arange(np.prod(self.shape)), np.prod(self.shape)),
+                  (np.ravel_multi_index((down, distance, action), coarse), np.ravel_multi_index((cell_down, cell_distance, cell_action), coarse), np.prod(coarse)),
+                  (action, cell_action, len(self.actions)),
+                  (np.zeros(len(action), dtype=np.intp), np.zeros(len(cell_action), dtype=np.intp), 1)]
+
+        self.start = np.zeros(np.prod(self.shape), dtype=np.intp)
+        self.count = np.zeros(np.prod(self.shape), dtype=np.intp)
+        pools = []
+        for level, (play_key, cell_key, n_keys) in enumerate(levels):
+            counts = np.bincount(play_key, minlength=n_keys)
+            starts = (np.cumsum(counts) - counts) + (len(action) * level)
+            enough = (self.count == 0) & (counts[cell_key] >= (self.min_plays if level < len(levels) - 1 else 1))
+            self.start[enough] = starts[cell_key][enough]
+            self.count[enough] = counts[cell_key][enough]
+            pools.append(np.argsort(play_key, kind='stable'))
+        pool = np.concatenate(pools)
+        self.yards = yards[pool]
+        self.lost = lost[pool]
+
+        # the action run most often in each (down, distance bucket, field zone), or the most run action where there are no plays
+        runs = np.bincount(levels[0][0], minlength=np.prod(self.shape)).reshape(self.shape)
+        self.usual_policy = np.where(runs.sum(axis=3) > 0, runs.argmax(axis=3), np.bincount(action, minlength=len(self.actions)).argmax())
+
+    # function to make a policy from picks for every down and field side: picks is 4 rows (downs 1-4) of [OWN pick, OPP pick] action names
+    # (zones 0-4 are the offense's own side of the field); a None pick keeps usual_policy for that down and side
+    def policy(self, picks):
+        policy = self.usual_policy.copy()
+        for down, row in enumerate(picks):
+            for side, pick in enumerate(row):
+                if pick is None:
+                    continue
+                if pick not in self.actions:
+                    raise ValueError("Unknown action " + str(pick))
+                policy[down, :, (side * 5):((side + 1) * 5)] = self.actions.index(pick)
+        return policy
+
+    # function to make the policy of a team's q-learning picks in a quarter (from tables trained by train_all())
+    def q_policy(self, tables, team, quarter):
+        def pick(down, side):
+            try:
+                return Q.from_tables(tables, team, quarter, down, side).make_decision()[0]
+            except ValueError:
+                return None
+        return self.policy([[pick(down, side) for side in SituationIndex.sides] for down in range(1, 5)])
+
+    # function to make the policy of a team's MDP picks in a quarter (from a situation index)
+    def mdp_policy(self, index, reward, team, quarter):
+        def pick(down, side):
+            try:
+                play, formation, _ = MDP.from_index(reward, index, quarter, down, team, side).decision()
+            except ValueError:
+                return None
+            return formation + " " + play.split(" ")[0].upper()
+        return self.policy([[pick(down, side) for side in SituationIndex.sides] for down in range(1, 5)])
+
+    # function to simulate n drives from every starting situation under a policy (usual_policy if None)
+    # starts is a data frame (or anything pd.DataFrame() takes) with 'Down', 'ToGo', and 'YardLine' columns; the default is first and 10 from the 25
+    # on fourth down the offense goes for it (runs the policy's play) with go_for_it or fewer yards to go, otherwise it tries a field goal
+    # from field_goal_line on, and punts from further back; a drive still going after max_plays is 'Unfinished'
+    # function returns the starts with the rate of every result in DRIVE_RESULTS, the expected points, and the average number of plays
+    @timed('DriveSimulator.simulate')
+    def simulate(self, policy=None, starts=None, n=10000, seed=None, max_plays=40, go_for_it=0, field_goal_line=60):
+        rng = np.random.default_rng(seed)
+        policy = (self.usual_policy if policy is None else np.asarray(policy)).reshape(-1)
+        starts = pd.DataFrame({'Down': [1], 'ToGo': [10], 'YardLine': [25]} if starts is None else starts).reset_index(drop=True)
+
+        drive_start = np.repeat(np.arange(len(starts)), n)
+        down = np.repeat(starts['Down'].to_numpy().astype(np.intp), n)
+        to_go = np.repeat(starts['ToGo'].to_numpy().astype(np.int64), n)
+        yard_line = np.repeat(starts['YardLine'].to_numpy().astype(np.int64), n)
+        result = np.full(len(drive_start), DRIVE_RESULTS.index('Unfinished'), dtype=np.intp)
+        plays = np.zeros(len(drive_start), dtype=np.int64)
+        alive = np.arange(len(drive_start))
+
+        for step in range(max_plays):
+            d, t, y = down[alive], to_go[alive], yard_line[alive]
+
+            # fourth down kicks end the drive
+            kick = (d == 4) & (t > go_for_it)
+            field_goal = kick & (y >= field_goal_line)
+            good = field_goal & (rng.random(len(alive)) < field_goal_rate(y))
+            result[alive[good]] = DRIVE_RESULTS.index('FieldGoal')
+            result[alive[field_goal & ~good]] = DRIVE_RESULTS.index('MissedFieldGoal')
+            result[alive[kick & ~field_goal]] = DRIVE_RESULTS.index('Punt')
+            alive, d, t, y = alive[~kick], d[~kick], t[~kick], y[~kick]
+            if len(alive) == 0:
+                break
+
+            # run the policy's action and draw one of the cell's plays for every drive
+            situation = np.ravel_multi_index((d - 1, distance_bucket(t), field_zone(y)), self.shape[:3])
+            cell = (situation * len(self.actions)) + policy[situation]
+            drawn = self.start[cell] + (rng.random(len(alive)) * self.count[cell]).astype(np.intp)
+            gained, lost = self.yards[drawn], self.lost[drawn]
+            y = y + gained
+            plays[alive] += 1
+
+            touchdown = ~lost & (y >= 100)
+            safety = ~lost & ~touchdown & (y <= 0)
+            first_down = gained >= t
+            on_downs = ~(lost | touchdown | safety | first_down) & (d == 4)
+            result[alive[lost]] = DRIVE_RESULTS.index('Turnover')
+            result[alive[touchdown]] = DRIVE_RESULTS.index('Touchdown')
+            result[alive[safety]] = DRIVE_RESULTS.index('Safety')
+            result[alive[on_downs]] = DRIVE_RESULTS.index('TurnoverOnDowns')
+
+            down[alive] = np.where(first_down, 1, d + 1)
+            to_go[alive] = np.where(first_down, np.minimum(10, 100 - y), t - gained)
+            yard_line[alive] = y
+            alive = alive[~(lost | touchdown | safety | on_downs)]
+
+        metrics.count('DriveSimulator.simulate.drives', len(drive_start))
+        metrics.count('DriveSimulator.simulate.plays', int(plays.sum()))
+        rates = np.bincount((drive_start * len(DRIVE_RESULTS)) + result, minlength=len(starts) * len(DRIVE_RESULTS)).reshape(len(starts), len(DRIVE_RESULTS)) / n
+        simulated = starts.copy()
+        for r, name in enumerate(DRIVE_RESULTS):
+            simulated[name] = rates[:, r]
+        simulated['ExpectedPoints'] = rates @ DRIVE_POINTS
+        simulated['Plays'] = np.bincount(drive_start, weights=plays, minlength=len(starts)) / n
+        return simulated
+
+"""# Model Cache
+Keeps the models that were already fitted for a situation so the same question (e.g. KC, 3rd down, OPP, 4th quarter) doesn't fit them again.
+Models are kept by (model, team, quarter, down, field side, reward list, season data version) and the least recently used ones are dropped once
+the models held take more than the memory limit. Dropped models can be spilled to a folder and loaded from there instead of being fitted again.
+"""
+
+# function to find the version of a data set: the hash load_season() saved, or else a hash of the data (worked out once and saved in attrs)
+# a slice gets a copy of its parent's attrs, but the saved hash is only used for the rows it was made for, so a slice gets its own hash
+def data_version(data):
+    version = stored_data_version(data)
+    if version is None:
+        version = hashlib.sha1(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes()).hexdigest()
+        set_data_version(data, version)
+    return version
+
+# function to estimate how much memory a fitted model holds (its arrays and data frames, also inside lists and dictionaries)
+def model_nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(index=True, deep=True)))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(model_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(model_nbytes(item) for item in value)
+    if hasattr(value, '__dict__') and not isinstance(value, (type, np.random.Generator)):
+        return sys.getsizeof(value) + model_nbytes(vars(value))
+    return sys.getsizeof(value)
+
+# class to hold fitted models, least recently used first
+# max_bytes bounds the memory the held models take; spill_dir is an optional folder dropped models are pickled to and loaded back from
+class ModelCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.models = {} # key -> (model, bytes), oldest use first
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    # function to find the file a model is spilled to
+    def spill_path(self, key):
+        return os.path.join(self.spill_dir, "model-" + hashlib.sha1(repr(key).encode()).hexdigest() + ".pkl")
+
+    # function to get a model, fitting it with build() only if it isn't held (or spilled) already
+    def get(self, key, build):
+        with self.lock:
+            held = self.models.pop(key, None)
+            if held is not None:
+                self.models[key] = held # most recently used goes last
+                metrics.count('model_cache.hit')
+                return held[0]
+
+        model = None
+        if (self.spill_dir is not None) and os.path.exists(self.spill_path(key)):
+            model = pd.read_pickle(self.spill_path(key))
+            metrics.count('model_cache.spill_hit')
+        if model is None:
+            metrics.count('model_cache.miss')
+            model = build()
+        self.put(key, model)
+        return model
+
+    # function to hold a model, dropping (and spilling) the least recently used models while the held models take too much memory
+    def put(self, key, model):
+        nbytes = model_nbytes(model)
+        dropped = []
+        with self.lock:
+            if key in self.models:
+                self.nbytes -= self.models.pop(key)[1]
+            self.models[key] = (model, nbytes)
+            self.nbytes += nbytes
+            while (self.nbytes > self.max_bytes) and (len(self.models) > 1):
+                oldest = next(iter(self.models))
+                dropped.append((oldest, self.models[oldest][0]))
+                self.nbytes -= self.models.pop(oldest)[1]
+                metrics.count('model_cache.evicted')
+
+        if self.spill_dir is not None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            for old_key, old_model in dropped:
+                if not os.path.exists(self.spill_path(old_key)):
+                    pd.to_pickle(old_model, self.spill_path(old_key))
+
+    # function to drop every held model (spilled models stay on disk, they're keyed by the data version)
+    def clear(self):
+        with self.lock:
+            self.models = {}
+            self.nbytes = 0
+
+    # function to make the key of a model for a situation
+    @staticmethod
+    def key(model, data, quarter, down, team, field_side, reward=()):
+        return (model, str(team).upper(), quarter_number(quarter), int(down), str(field_side).upper(), tuple(float(r) for r in reward), data_version(data))
+
+    # functions to get a situation's MDP, Q, or HMM fitted on the season's derived plays (output of derive_features())
+    def mdp(self, reward, data, quarter, down, team, field_side):
+        return self.get(self.key('MDP', data, quarter, down, team, field_side, reward),
+                        lambda: MDP(reward, markov_reorganize(data, quarter, down, team, field_side), quarter))
+
+    def q(self, reward, data, quarter, down, team, field_side):
+        return self.get(self.key('Q', data, quarter, down, team, field_side, reward),
+                        lambda: Q(reward, q_reorganize(data, team), quarter, down, field_side))
+
+    def hmm(self, data, quarter, down, team, field_side, seed=None):
+        return self.get(self.key('HMM', data, quarter, down, team, field_side),
+                        lambda: HMM(markov_reorganize(data, quarter, down, team, field_side), quarter, seed=seed))
+
+# models fitted by main() or a notebook session (e.g. model_cache.mdp(rewards1, plays, 4, 3, 'KC', 'OPP'))
+model_cache = ModelCache()
+
+"""Fit every team's q-table, MDP counts, and HMM counts in parallel worker processes"""
+
+# season arrays the worker processes read from; each worker fills this once (see attach_season()) from memory-mapped .npy files,
+# so every worker reads the same pages instead of being sent its own pickled copy of the data frame
+shared_season = {}
+
+# function run once in each worker process to memory-map the season arrays written by fit_parallel()
+def attach_season(folder, settings):
+    for name in os.listdir(folder):
+        shared_season[os.path.splitext(name)[0]] = np.load(os.path.join(folder, name), mmap_mode='r')
+    shared_season['settings'] = settings
+
+# function run in a worker process to fit one team's models from the shared season arrays
+# returns only compact arrays: the team's q-table over every action (-inf for actions it never ran) and where it first ran each action
+# (like train_all()), its per quarter MDP totals and outcome counts (like SituationIndex), and its HMM transition and result counts (like HMM)
+def fit_team(team):
+    season = shared_season
+    settings = season['settings']
+    n_actions = settings['actions']
+    rows = np.flatnonzero(season['team'] == team)
+    quarter = season['quarter'][rows]
+    state = season['state'][rows]
+    side = season['side'][rows]
+    action = season['action'][rows]
+
+    # q-learning, same pass over the team's plays in order as Q and train_all()
+    no_team = np.zeros(len(rows), dtype=np.intp)
+    values, first, _ = fit_q_tables(no_team, quarter, (side != 0).astype(np.intp), state, action, season['next_state'][rows], 1, n_actions,
+                                    settings['reward'], rows=rows)
+
+    # MDP counts (plays without a field side can't be placed in a situation)
+    placed = side >= 0
+    totals, counts = count_situations((1, 5, 4, 2, n_actions), no_team[placed], quarter[placed], state[placed], side[placed], action[placed],
+                                      season['flags'][rows][placed])
+
+    # HMM counts, plays only follow each other within a drive
+    play_type = season['play_type'][rows]
+    transitions = count_play_transitions(play_type, season['sequence'][rows])
+    results = count_play_results(play_type, season['flags'][rows])
+
+    return values[0], first[0], totals[0], counts[0], transitions[0], results[0]
+
+# function to fit the models of every team in a process pool, one team per task
+# function takes the season's derived plays, a reward list (for q-learning), and the number of processes (default is one per core)
+# function returns a dictionary with the QTables ('tables'), the SituationIndex ('index'), and the HMM transition and result counts
+# of every team ('transitions' shaped (teams, 2, 2) and 'results' shaped (teams, 2, 6), ready for HMM.from_counts())
+@timed('fit_parallel')
+def fit_parallel(data, reward, processes=None):
+    from concurrent.futures import ProcessPoolExecutor # only needed for parallel fitting
+    import tempfile
+
+    team, teams = encode(data['OffenseTeam'])
+    action, formations = encode_actions(data)
+    play_type = play_type_codes(data)
+    encoded = encode_transitions(data)
+    flags = data[OUTCOME_COLUMNS].to_numpy(dtype=bool)
+
+    arrays = {'team': team, 'quarter': encoded['quarter'], 'state': encoded['state'], 'next_state': encoded['next_state'],
+              'side': side_codes(data),
+              'action': action, 'play_type': play_type, 'flags': flags,
+              'sequence': data['DriveId' if 'DriveId' in data.columns else 'GameId'].to_numpy()}
+    settings = {'reward': [float(r) for r in reward], 'actions': len(PLAY_TYPES) * len(formations)}
+
+    with tempfile.TemporaryDirectory() as folder:
+        for name, values in arrays.items():
+            np.save(os.path.join(folder, name + '.npy'), values)
+        with ProcessPoolExecutor(max_workers=processes, initializer=attach_season, initargs=(folder, settings)) as pool:
+            fitted = list(pool.map(fit_team, range(len(teams))))
+
+    values, first, totals, counts, transitions, results = [np.stack(part) for part in zip(*fitted)]
+    actions = action_names(formations)
+
+    return {'tables': QTables(teams, actions, values, first, reward, stored_data_version(data)),
+            'index': SituationIndex.from_counts(teams, formations, totals, counts),
+            'transitions': transitions, 'results': results}
+
+"""# Stream Seasons
+Fit the models on many seasons of play-by-play (e.g. pbp-2015.csv ... pbp-2024.csv) while holding only about one chunk of rows in memory.
+Every csv is read in chunks with only the needed columns and small types. The rows of a csv aren't in game order, so the chunks are first split
+into groups of whole games (in GameId order) kept in a temporary folder; every group is then sorted, run through derive_features(), and folded into
+the models with their update() methods, so the plays are learned in the same order as they would be from one data frame of every season.
+"""
+
+# types the season columns are read with when streaming; numbers are floats since any of them can be missing (GameId never is)
+STREAM_DTYPES = dict({column: 'category' for column in CATEGORICAL_COLUMNS}, GameId=np.int64,
+                     **{column: np.float32 for column in NUMERIC_DTYPES if column != 'GameId'})
+
+# function to find the season files for a glob pattern (or a list of paths), in name order so seasons are read oldest first
+def season_files(pattern):
+    import glob # only needed when streaming seasons
+
+    paths = sorted(glob.glob(pattern)) if isinstance(pattern, str) else list(pattern)
+    if len(paths) == 0:
+        raise FileNotFoundError("No season files match " + str(pattern))
+    return paths
+
+# function to read the few columns needed to plan the streaming, one chunk at a time
+# function returns the sorted teams and formations of every pass or rush play (the models' vocabulary) and, for every file,
+# the number of rows of each game in GameId order
+def scan_seasons(paths, chunksize=100000):
+    columns = ['GameId', 'OffenseTeam', 'Formation', 'PlayType', 'Down']
+    teams, formations, games = set(), set(), []
+    for path in paths:
+        rows = pd.Series(dtype=np.int64)
+        for chunk in pd.read_csv(path, usecols=columns, dtype={column: STREAM_DTYPES[column] for column in columns}, chunksize=chunksize):
+            rows = rows.add(chunk['GameId'].value_counts(), fill_value=0)
+            # same plays derive_features() keeps
+            keep = (chunk['PlayType'].isin(['PASS', 'RUSH']) & chunk['Down'].between(1, 4) & chunk['OffenseTeam'].notna() & chunk['Formation'].notna())
+            teams.update(chunk.loc[keep, 'OffenseTeam'].astype(str))
+            formations.update(chunk.loc[keep, 'Formation'].astype(str))
+        games.append(rows.sort_index().astype(np.int64))
+    return sorted(teams), sorted(formations), games
+
+# function to read one season file as groups of whole games, in GameId order, each group about chunksize rows
+# games is the number of rows of every game in the file (from scan_seasons()); every chunk is split by group into a temporary folder
+# and each group is put back together (in file order) when its turn comes, so no more than a chunk or a group is in memory at a time
+def game_groups(path, games, chunksize=100000):
+    import tempfile # only needed when streaming seasons
+
+    group = pd.Series((np.cumsum(games.to_numpy()) - games.to_numpy()) // chunksize, index=games.index)
+    n_groups = int(group.max()) + 1 if len(group) else 0
+    if n_groups <= 1:
+        yield pd.read_csv(path, usecols=SEASON_COLUMNS, dtype=STREAM_DTYPES)
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        n_chunks = 0
+        for chunk in pd.read_csv(path, usecols=SEASON_COLUMNS, dtype=STREAM_DTYPES, chunksize=chunksize):
+            for g, part in chunk.groupby(group.reindex(chunk['GameId']).to_numpy(), sort=False):
+                part.to_pickle(os.path.join(folder, str(g) + "-" + str(n_chunks) + ".pkl"))
+            n_chunks += 1
+        for g in range(n_groups):
+            parts = [os.path.join(folder, str(g) + "-" + str(c) + ".pkl") for c in range(n_chunks)]
+            yield pd.concat([pd.read_pickle(part) for part in parts if os.path.exists(part)])
+            for part in parts:
+                if os.path.exists(part):
+                    os.remove(part)
+
+# function to stream the derived plays (output of derive_features()) of every season matching a glob pattern, one group of games at a time
+# drives are numbered across all groups and seasons; games can be given (from scan_seasons()) to skip scanning the files again
+def stream_plays(pattern, chunksize=100000, games=None):
+    paths = season_files(pattern)
+    if games is None:
+        games = scan_seasons(paths, chunksize)[2]
+
+    first_drive = 0
+    for path, season_games in zip(paths, games):
+        for group in game_groups(path, season_games, chunksize):
+            plays = derive_features(group)
+            plays['DriveId'] += first_drive
+            first_drive += plays.attrs['last_drive'] + 1
+            if len(plays):
+                yield plays
+
+# function to fit every team's models on all the seasons matching a glob pattern (e.g. 'pbp-20*.csv') without loading them all at once
+# function takes the pattern, a reward list (for q-learning), and the number of rows to read at a time
+# function returns the same dictionary as fit_parallel(): the QTables ('tables'), the SituationIndex ('index'), and every team's HMM
+# transition and result counts ('transitions' and 'results'); the q-tables and counts are the same as fitting one data frame of every season
+@timed('fit_seasons')
+def fit_seasons(pattern, reward, chunksize=100000):
+    paths = season_files(pattern)
+    teams, formations, games = scan_seasons(paths, chunksize)
+
+    # empty models over the whole vocabulary, filled in by every group's update
+    actions = action_names(formations)
+    shape = (len(teams), 5, 4, 2, len(actions))
+    index = SituationIndex.from_counts(teams, formations, np.zeros(shape, dtype=np.int64), np.zeros(shape + (len(OUTCOMES),), dtype=np.int64))
+    tables = QTables(teams, actions, np.full((len(teams), 5, 2, len(Q.states), len(actions)), -np.inf),
+                     np.full((len(teams), len(actions)), -1, dtype=np.int64), reward)
+    transitions = np.zeros((len(teams), len(PLAY_TYPES), len(PLAY_TYPES)), dtype=np.int64)
+    results = np.zeros((len(teams), len(PLAY_TYPES), len(OUTCOMES) + 1), dtype=np.int64)
+
+    for plays in stream_plays(paths, chunksize, games):
+        index.update(plays)
+        tables.update(plays)
+
+        # HMM counts of every team, plays only follow each other within a drive (and a drive only has one team)
+        team = pd.Index(teams).get_indexer(plays['OffenseTeam'].astype(str))
+        play_type = play_type_codes(plays)
+        transitions += count_play_transitions(play_type, plays['DriveId'].to_numpy(), team, len(teams))
+        results += count_play_results(play_type, plays[OUTCOME_COLUMNS].to_numpy(dtype=bool), team, len(teams))
+
+    return {'tables': tables, 'index': index, 'transitions': transitions, 'results': results}
+
+"""# Policy Evaluation
+Compare the MDP and q-learning picks (for any number of reward lists) on games they weren't fitted on. The season is split into folds of
+whole games; for every fold and reward list the models are fitted on the other folds' games and every held-out play is looked up in its
+situation. A policy can only be judged on the plays where the offense happened to run the action it recommends (an off-policy estimate),
+so the score of each method is the reward, success rate, and yards of those matched plays, next to how often the picks matched at all.
+Every (fold, reward list) is fitted in its own worker process from the same memory-mapped season arrays fit_parallel() uses.
+"""
+
+# function to split the season's games into n_folds folds of whole games, with the games shuffled first (seed makes it repeatable)
+# function returns the fold of every play
+def evaluation_folds(data, n_folds=5, seed=None):
+    game, games = pd.factorize(data['GameId'])
+    fold_of_game = np.empty(len(games), dtype=np.intp)
+    fold_of_game[np.random.default_rng(seed).permutation(len(games))] = np.arange(len(games)) % n_folds
+    return fold_of_game[game]
+
+# function run in a worker process to fit both models on every game outside one fold (with one reward list) and score the fold's plays
+# the models are fitted and picked with the same functions as train_all(), SituationIndex, and decide_many()
+# returns sums (not averages) per method so folds can be added up exactly: held-out plays with a pick, matched plays, and the
+# matched plays' score reward, successes (first down or touchdown), and yards, plus the seconds it took to fit and pick
+def evaluate_fold(task):
+    fold, r = task
+    season = shared_season
+    settings = season['settings']
+    reward = settings['rewards'][r]
+    teams, formations, actions = settings['teams'], settings['formations'], settings['actions']
+    train = np.flatnonzero(season['fold'] != fold)
+    team, quarter, state, side, action = [season[name][train] for name in ['team', 'quarter', 'state', 'side', 'action']]
+
+    # q-learning on the training games, then every team's pick for every (quarter, field side, state)
+    start = time.perf_counter()
+    values, first, _ = fit_q_tables(team, quarter, (side != 0).astype(np.intp), state, action, season['next_state'][train], len(teams), len(actions),
+                                    reward, rows=train)
+    q_pick = QTables(teams, actions, values, first, reward).best_actions()
+    q_seconds = time.perf_counter() - start
+
+    # MDP counts of the training games, then the pick of every situation
+    start = time.perf_counter()
+    placed = side >= 0
+    totals, counts = count_situations((len(teams), 5, 4, 2, len(actions)), team[placed], quarter[placed], state[placed], side[placed], action[placed],
+                                      season['flags'][train][placed])
+    index = SituationIndex.from_counts(teams, formations, totals, counts)
+    mdp_pick = mdp_picks(index.probabilities, index.totals, reward)[0]
+    mdp_seconds = time.perf_counter() - start
+
+    # score the held-out plays that have a field side
+    test = np.flatnonzero((season['fold'] == fold) & (season['side'] >= 0))
+    team, quarter, state, side, action = [season[name][test] for name in ['team', 'quarter', 'state', 'side', 'action']]
+    score = state_rewards(settings['score_reward'])[season['next_state'][test]]
+    success = season['flags'][test][:, [OUTCOMES.index('FirstDown'), OUTCOMES.index('Touchdown')]].any(axis=1)
+    yards = season['yards'][test]
+
+    sums = {}
+    picks = [('Q-learning', q_pick[team, quarter, side, state], q_seconds), ('MDP', mdp_pick[team, quarter, state, side], mdp_seconds)]
+    for method, pick, seconds in picks:
+        matched = (pick >= 0) & (pick == action)
+        sums[method] = {'plays': int((pick >= 0).sum()), 'matched': int(matched.sum()), 'reward': float(score[matched].sum()),
+                        'successes': int(success[matched].sum()), 'yards': float(yards[matched].sum()), 'seconds': seconds}
+    return fold, r, sums
+
+# function to evaluate the MDP and q-learning picks for every reward list on held-out games, folds run in a process pool
+# function takes the season's derived plays, a list of reward lists (each in the order [Turnover, Negative Play, Next Down, First Down, Touchdown]),
+# the number of folds, a seed for splitting the games, the number of processes (default is one per core), and the reward list every play is
+# scored with (default CoachAgent.default_reward, so methods fitted with different rewards are compared on the same scale)
+# function returns one row per method and reward list plus an 'Observed' row for what the offenses actually ran: the held-out plays
+# with a pick, how often the pick matched the action run, and the matched plays' average score reward, success rate, and yards,
+# plus the seconds spent fitting and picking over all folds; the total wall clock time is in the result's attrs['seconds']
+@timed('evaluate_policies')
+def evaluate_policies(data, rewards, n_folds=5, seed=None, processes=None, score_reward=None):
+    from concurrent.futures import ProcessPoolExecutor # only needed for evaluating policies
+    import tempfile
+
+    started = time.perf_counter()
+    rewards = [[float(r) for r in reward] for reward in rewards]
+    score_reward = [float(r) for r in (CoachAgent.default_reward if score_reward is None else score_reward)]
+    team, teams = encode(data['OffenseTeam'])
+    action, formations = encode_actions(data)
+    encoded = encode_transitions(data)
+    flags = data[OUTCOME_COLUMNS].to_numpy(dtype=bool)
+    arrays = {'team': team, 'quarter': encoded['quarter'], 'state': encoded['state'], 'next_state': encoded['next_state'],
+              'side': side_codes(data),
+              'action': action, 'flags': flags,
+              'yards': data['Yards'].to_numpy().astype(float), 'fold': evaluation_folds(data, n_folds, seed)}
+    settings = {'rewards': rewards, 'score_reward': score_reward, 'teams': teams, 'formations': formations,
+                'actions': action_names(formations)}
+
+    with tempfile.TemporaryDirectory() as folder:
+        for name, values in arrays.items():
+            np.save(os.path.join(folder, name + '.npy'), values)
+        with ProcessPoolExecutor(max_workers=processes, initializer=attach_season, initargs=(folder, settings)) as pool:
+            scored = list(pool.map(evaluate_fold, [(fold, r) for r in range(len(rewards)) for fold in range(n_folds)]))
+
+    # add up every method's sums over the folds
+    totals = {}
+    for fold, r, sums in scored:
+        for method, values in sums.items():
+            total = totals.setdefault((method, r), dict.fromkeys(values, 0))
+            for name, value in values.items():
+                total[name] += value
+
+    # what the offenses actually ran: every play with a field side, each held out once
+    placed = arrays['side'] >= 0
+    score = state_rewards(score_reward)[encoded['next_state'][placed]]
+    success = flags[placed][:, [OUTCOMES.index('FirstDown'), OUTCOMES.index('Touchdown')]].any(axis=1)
+    rows = [{'Method': 'Observed', 'Reward': None, 'Plays': int(placed.sum()), 'MatchRate': 1.0, 'Matched': int(placed.sum()),
+             'ExpectedReward': score.mean(), 'SuccessRate': success.mean(), 'Yards': arrays['yards'][placed].mean(), 'Seconds': 0.0}]
+    for (method, r), total in totals.items():
+        matched = max(total['matched'], 1)
+        rows.append({'Method': method, 'Reward': rewards[r], 'Plays': total['plays'], 'MatchRate': total['matched'] / max(total['plays'], 1),
+                     'Matched': total['matched'], 'ExpectedReward': total['reward'] / matched, 'SuccessRate': total['successes'] / matched,
+                     'Yards': total['yards'] / matched, 'Seconds': total['seconds']})
+
+    results = pd.DataFrame(rows)
+    results.attrs['seconds'] = time.perf_counter() - started
+    metrics.count('evaluate_policies.tasks', len(scored))
+    return results
+
+"""# Coach agent service
+Keeps the season, the situation index, and the trained q-tables loaded in memory and answers situation queries for as long as it runs,
+instead of paying for start up, imports, and csv parsing on every question.
+"""
+
+# function to follow a play-by-play csv that is still being written (e.g. a live feed) and yield the new plays as they show up
+# the file is read from where the last read stopped and only complete lines are used, so a half-written row waits for the next poll
+# every piece is run through derive_features() with the last row of the piece before it in front, so drives carry on across pieces;
+# drive numbers start at first_drive (use one past the last drive of the plays already loaded so they don't run together)
+# the generator never ends by itself, it waits poll_interval seconds whenever there is nothing new
+def follow_plays(path, poll_interval=1.0, first_drive=0):
+    import io # only needed when following a feed
+
+    offset = 0
+    header = None
+    rows_read = 0
+    previous = None # last row of the piece before (with the last team seen filled in)
+    team = np.nan
+    base = first_drive # drive number of the first row of the next piece
+    while True:
+        with open(path, 'rb') as feed:
+            feed.seek(offset)
+            chunk = feed.read()
+        end = chunk.rfind(b"\n") + 1
+        lines = chunk[:end].decode()
+        offset += end
+        if header is None:
+            header, _, lines = lines.partition("\n")
+            header = header + "\n" if header else None
+        if (header is None) | (not lines.strip()):
+            time.sleep(poll_interval)
+            continue
+
+        rows = pd.read_csv(io.StringIO(header + lines), usecols=SEASON_COLUMNS)
+        rows.index = np.arange(rows_read, rows_read + len(rows))
+        rows_read += len(rows)
+
+        piece = rows if previous is None else pd.concat([previous, rows])
+        piece.attrs['presorted'] = True
+        plays = derive_features(piece)
+        plays = plays[plays.index >= rows.index[0]]
+        plays['DriveId'] += base
+        base += plays.attrs['last_drive']
+        teams = rows['OffenseTeam'].dropna()
+        team = teams.iloc[-1] if len(teams) else team
+        previous = rows.tail(1).assign(OffenseTeam=team)
+        if len(plays):
+            yield plays
+
+# function to check a query (a dictionary with 'quarter', 'down', 'team', and 'field_side') against the known teams
+# function returns (quarter, down, team, field side) and raises ValueError for anything invalid
+def parse_situation(query, teams):
+    try:
+        quarter = quarter_number(query['quarter'])
+        down = whole_number(query['down'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Query needs a quarter (1-5 or OT) and a down (1-4)")
+    team = str(query.get('team', '')).upper()
+    field_side = str(query.get('field_side', '')).upper()
+
+    if quarter not in [1, 2, 3, 4, 5]:
+        raise ValueError("Invalid quarter")
+    if down not in [1, 2, 3, 4]:
+        raise ValueError("Only 1, 2, 3, or 4 are valid downs")
+    if team not in teams:
+        raise ValueError("Invalid team")
+    if field_side not in ['OWN', 'OPP']:
+        raise ValueError("Field position should be either 'OPP' or 'OWN'")
+
+    return quarter, down, team, field_side
+
+# function to read one of a query's optional whole numbers (e.g. 'drives'), default if the query doesn't have it
+# raises ValueError if it isn't a whole number of 0 or more
+def query_option(query, name, default):
+    value = query.get(name, default)
+    if value is None:
+        return None
+    try:
+        number = whole_number(value)
+        if number < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError("'" + name + "' should be a whole number of 0 or more")
+    return number
+
+# function to pick the q-learning and MDP plays for a situation from trained q-tables and a situation index
+# returns a dictionary that can be written straight out as json; a model that has nothing for the situation gets {'error': message}
+def decide_situation(tables, index, reward, quarter, down, team, field_side):
+    response = {'quarter': quarter, 'down': down, 'team': team, 'field_side': field_side}
+
+    try:
+        with metrics.span('decide_situation.q_learning'):
+            q_action, q_value = Q.from_tables(tables, team, quarter, down, field_side).make_decision()
+        response['q_learning'] = {'action': q_action, 'value': float(q_value)}
+    except ValueError as error:
+        response['q_learning'] = {'error': str(error)}
+
+    try:
+        with metrics.span('decide_situation.mdp'):
+            play, formation, value = MDP.from_index(reward, index, quarter, down, team, field_side).decision()
+        response['mdp'] = {'play': play, 'formation': formation, 'value': float(value)}
+    except ValueError as error:
+        response['mdp'] = {'error': str(error)}
+
+    return response
+
+# class to hold the warm models and answer queries
+# a query is a dictionary with 'quarter', 'down', 'team', and 'field_side' (plus optionally 'drives', the number of drives to sample,
+# 'bootstrap', the number of resamples for the confidence intervals of the picks, and 'seed')
+class CoachAgent:
+    # list of rewards in [Turnover, Negative Play, Next Down, First Down, Touchdown] (same default main() uses)
+    default_reward = [-10, -5, 2.5, 5, 10]
+
+    # "constructor" loads the season and builds every model once
+    # models sampled for the drives are kept in a cache of at most cache_bytes
+    def __init__(self, csv_path='pbp-2024.csv', reward=None, cache_dir='models', cache_bytes=64 * 1024 * 1024):
+        self.reward = list(self.default_reward if reward is None else reward)
+        plays = derive_features(load_season(csv_path))
+        self.index = SituationIndex(plays)
+        self.tables = train_all(plays, self.reward, cache_dir=cache_dir)
+        self.teams = self.index.teams
+        self.models = ModelCache(cache_bytes)
+        # the season's plays are kept as pieces (the loaded season, then every update's plays) and only put together when a model
+        # fitted per situation needs them (see season_plays()); version is the data version of all the pieces together
+        self.pieces = (plays,)
+        self.version = data_version(plays)
+        self.last_drive = int(plays['DriveId'].max()) if len(plays) else -1
+        self.joined = (self.version, plays)
+        # the lock is only held to read or swap the current models, so answers run side by side and an update builds its models
+        # before swapping them in (an answer never sees a half updated model); updates themselves take turns
+        self.lock = threading.Lock()
+        self.update_lock = threading.Lock()
+        self.join_lock = threading.Lock()
+
+    # function to check a query and turn it into (quarter, down, team, field side); raises ValueError for anything invalid
+    def situation(self, query):
+        return parse_situation(query, self.teams)
+
+    # function to get the current models: (index, tables, pieces of the plays, data version)
+    def current(self):
+        with self.lock:
+            return self.index, self.tables, self.pieces, self.version
+
+    # function to get the plays of a version as one data frame; updates only add their plays to the pieces, so they're put together
+    # here, once per version and only when a query needs a model fitted on the plays
+    def season_plays(self, pieces, version):
+        with self.join_lock:
+            if self.joined[0] != version:
+                plays = pd.concat(pieces) if len(pieces) > 1 else pieces[0]
+                set_data_version(plays, version)
+                self.joined = (version, plays)
+            return self.joined[1]
+
+    # function to answer one query with the q-learning pick, the MDP pick, and sampled drives
+    # returns a dictionary that can be written straight out as json (errors are returned as {'error': message})
+    @timed('CoachAgent.answer')
+    def answer(self, query):
+        try:
+            quarter, down, team, field_side = self.situation(query)
+            n_drives = query_option(query, 'drives', 10)
+            seed = query_option(query, 'seed', None)
+            n_resamples = query_option(query, 'bootstrap', 0)
+        except ValueError as error:
+            metrics.count('CoachAgent.answer.invalid')
+            return {'error': str(error)}
+
+        index, tables, pieces, version = self.current()
+        response = decide_situation(tables, index, self.reward, quarter, down, team, field_side)
+
+        if n_drives > 0:
+            with metrics.span('CoachAgent.answer.drives'):
+                hmm = self.models.hmm(self.season_plays(pieces, version), quarter, down, team, field_side)
+                outcomes, lengths, scored = hmm.sample_drives(n_drives, seed=seed)
+            response['drives'] = [{'plays': [hmm.observed_states[o] for o in outcomes[i][:lengths[i]]], 'touchdown': bool(scored[i])} for i in range(n_drives)]
+
+        if n_resamples > 0:
+            response['uncertainty'] = {}
+            fits = [('mdp', self.models.mdp), ('q_learning', self.models.q)]
+            for name, fit in fits:
+                try:
+                    with metrics.span('CoachAgent.answer.bootstrap.' + name):
+                        table = fit(self.reward, self.season_plays(pieces, version), quarter, down, team, field_side).bootstrap(n_resamples, seed=seed)
+                    response['uncertainty'][name] = json.loads(table.to_json(orient='records'))
+                except ValueError as error:
+                    response['uncertainty'][name] = {'error': str(error)}
+
+        return response
+
+    # function to answer many situations in one call (see decide_many())
+    def decide_many(self, situations):
+        index, tables, _, _ = self.current()
+        return decide_many(situations, index, tables, self.reward)
+
+    # function to fold newly observed plays (output of derive_features()) into the warm models
+    # the index and the q-tables only count the new plays, on copies that are swapped in when they're done; the plays are also
+    # added to the pieces so sampled drives use them, and the new data version only hashes the new plays
+    def update(self, plays):
+        if len(plays) == 0:
+            return
+        with self.update_lock:
+            index, tables, pieces, version = self.current()
+            index = copy.copy(index)
+            index.update(plays)
+            tables = tables.copy()
+            tables.update(plays)
+            # the plays are a new version of the data, so models fitted on the old plays aren't used again
+            version = hashlib.sha1((version + data_version(plays)).encode()).hexdigest()
+            with self.lock:
+                self.index, self.tables, self.pieces, self.version = index, tables, pieces + (plays,), version
+            self.last_drive = max(self.last_drive, int(plays['DriveId'].max()))
+            self.models.clear()
+
+    # function to keep updating the models with the plays written to a feed csv (see follow_plays()); never returns
+    def follow(self, path, poll_interval=1.0):
+        for plays in follow_plays(path, poll_interval, first_drive=self.last_drive + 1):
+            self.update(plays)
+
+# function to answer many situations at once (e.g. a full-season playbook of every team in every situation)
+# situations is a data frame (or anything pd.DataFrame() takes, like a structured array) with 'team', 'quarter', 'down', and 'field_side' columns
+# q-learning picks use one team table per team (same as Q.from_tables(...).make_decision()) and the MDP picks for every situation
+# come from the index in one array operation (same as MDP.from_index(...).decision())
+# function returns the situations with the q action and value and the MDP play, formation, and value added; situations that
+# are invalid or have no plays get empty results
+@timed('decide_many')
+def decide_many(situations, index, tables, reward):
+    results = pd.DataFrame(situations).copy()
+    n = len(results)
+    metrics.count('decide_many.situations', n)
+    team = results['team'].astype(str).str.upper().to_numpy()
+    # quarters and downs that aren't whole numbers (e.g. 'x' or missing) become 0, so they're invalid
+    quarter = pd.to_numeric(results['quarter'].astype(str).str.upper().replace('OT', '5'), errors='coerce').to_numpy(dtype=float)
+    down = pd.to_numeric(results['down'], errors='coerce').to_numpy(dtype=float)
+    quarter = np.where(quarter == np.floor(quarter), np.nan_to_num(quarter), 0).astype(int)
+    down = np.where(down == np.floor(down), np.nan_to_num(down), 0).astype(int)
+    field_side = results['field_side'].astype(str).str.upper()
+    side = (field_side == 'OPP').astype(int).to_numpy()
+    team_index = pd.Index(index.teams).get_indexer(team)
+    valid = (team_index >= 0) & (quarter >= 1) & (quarter <= 5) & (down >= 1) & (down <= 4) & field_side.isin(['OWN', 'OPP']).to_numpy()
+
+    # q-learning, every team's pick in its own table
+    q_action = np.full(n, None, dtype=object)
+    q_value = np.full(n, np.nan)
+    q_team = pd.Index(tables.teams).get_indexer(team)
+    rows = np.flatnonzero(valid & (q_team >= 0))
+    cells = (q_team[rows], quarter[rows] - 1, side[rows], down[rows] - 1)
+    pick = tables.best_actions()[cells]
+    ran = pick >= 0
+    q_action[rows[ran]] = np.array(tables.actions, dtype=object)[pick[ran]]
+    q_value[rows[ran]] = tables.values[tuple(c[ran] for c in cells) + (pick[ran],)]
+
+    # MDP, every valid situation at once (see mdp_picks())
+    rows = np.flatnonzero(valid)
+    cells = (team_index[rows], quarter[rows] - 1, down[rows] - 1, side[rows])
+    action, outcome, best_value = mdp_picks(index.probabilities[cells], index.totals[cells], reward)
+    play_type, formation = decode_actions(action, len(index.formations))
+
+    outcome_names = np.array(OUTCOME_NAMES, dtype=object)
+    has_plays = action >= 0
+    mdp_play = np.full(n, None, dtype=object)
+    mdp_formation = np.full(n, None, dtype=object)
+    mdp_value = np.full(n, np.nan)
+    mdp_play[rows[has_plays]] = np.array([p.capitalize() for p in PLAY_TYPES], dtype=object)[play_type[has_plays]] + " to " + outcome_names[outcome[has_plays]]
+    mdp_formation[rows[has_plays]] = index.formations[formation[has_plays]]
+    mdp_value[rows[has_plays]] = best_value[has_plays]
+
+    results['q_action'] = q_action
+    results['q_value'] = q_value
+    results['mdp_play'] = mdp_play
+    results['mdp_formation'] = mdp_formation
+    results['mdp_value'] = mdp_value
+    return results
+
+# function to list every situation for the given teams (every quarter, down, and field side), ready for decide_many()
+def all_situations(teams):
+    team, quarter, down, side = np.meshgrid(np.arange(len(teams)), [1, 2, 3, 4, 5], [1, 2, 3, 4], [0, 1], indexing='ij')
+    return pd.DataFrame({'team': np.asarray(teams, dtype=object)[team.ravel()], 'quarter': quarter.ravel(), 'down': down.ravel(),
+                         'field_side': np.array(['OWN', 'OPP'], dtype=object)[side.ravel()]})
+
+# function to run the agent as a service that reads one json query per line and writes one json answer per line
+# queries come from stdin (answers go to stdout) or, if a socket path is given, from any number of clients connected to that unix socket
+# queries are answered concurrently, so every answer repeats the query's 'id' (when it has one) to match it up
+# the query {"command": "metrics"} is answered with the instrumentation summary (see Metrics.summary())
+# if a feed csv is given the models are updated in the background with every play written to it (see CoachAgent.follow())
+def serve(agent, socket_path=None, feed=None):
+    import asyncio # only needed when running as a service
+
+    if feed is not None:
+        threading.Thread(target=agent.follow, args=(feed,), daemon=True).start()
+
+    async def respond(line, write):
+        try:
+            query = json.loads(line)
+            if not isinstance(query, dict):
+                raise ValueError("Query should be a json object")
+        except ValueError as error:
+            write({'error': str(error)})
+            return
+        if query.get('command') == 'metrics':
+            write(dict(metrics.summary(), id=query['id']) if 'id' in query else metrics.summary())
+            return
+        # a query that fails in the agent still gets an answer, so one bad query can't stop the service or a client's connection
+        try:
+            response = await asyncio.get_running_loop().run_in_executor(None, agent.answer, query)
+        except Exception as error:
+            response = {'error': str(error) or type(error).__name__}
+        if 'id' in query:
+            response = dict(response, id=query['id'])
+        write(response)
+
+    async def handle(reader, write, drain=None):
+        pending = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                task = asyncio.ensure_future(respond(line, write))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if drain is not None:
+                await drain()
+        if pending:
+            await asyncio.gather(*pending)
+
+    async def run_stdio():
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+        def write(response):
+            sys.stdout.write(json.dumps(response) + "\n")
+            sys.stdout.flush()
+
+        await handle(reader, write)
+
+    async def run_socket():
+        async def client(reader, writer):
+            def write(response):
+                writer.write((json.dumps(response) + "\n").encode())
+            await handle(reader, write, writer.drain)
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_unix_server(client, path=socket_path)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run_stdio() if socket_path is None else run_socket())
+
+"""# Query Tables
+A small file with everything needed to answer situation queries (teams, actions, q-tables, and MDP counts) for tools and cron jobs that just
+want a one line answer: loading it and answering only needs numpy, so there's no pandas import, no csv, and no fitting.
+"""
+
+# where the query tables are kept by default
+QUERY_TABLES_PATH = os.path.join('models', 'query-tables.npz')
+
+# function to save the query tables from a situation index, trained q-tables, and the reward list the MDP picks use
+def save_query_tables(path, index, tables, reward):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez_compressed(path, teams=np.array(index.teams), formations=np.array(index.formations, dtype=str), actions=np.array(tables.actions),
+                        q_teams=np.array(tables.teams), values=tables.values, first=tables.first, q_rewards=np.array(tables.rewards),
+                        totals=index.quarter_totals.astype(np.int32), counts=index.quarter_counts.astype(np.int32),
+                        reward=np.array([float(r) for r in reward]), data_version=np.array('' if tables.data_version is None else tables.data_version))
+
+# function to fit the models on a season csv and save them as query tables
+def build_query_tables(csv_path='pbp-2024.csv', path=QUERY_TABLES_PATH, reward=None, cache_dir='models'):
+    reward = list(CoachAgent.default_reward if reward is None else reward)
+    plays = derive_features(load_season(csv_path))
+    save_query_tables(path, SituationIndex(plays), train_all(plays, reward, cache_dir=cache_dir), reward)
+    return path
+
+# class to answer situation queries from saved query tables (same q-learning and MDP answers as CoachAgent, without the drives)
+class QueryTables:
+    def __init__(self, path=QUERY_TABLES_PATH):
+        with np.load(path) as saved:
+            self.reward = saved['reward'].tolist()
+            self.tables = QTables(saved['q_teams'].tolist(), saved['actions'].tolist(), saved['values'], saved['first'], saved['q_rewards'].tolist(),
+                                  str(saved['data_version']) or None)
+            self.index = SituationIndex.from_counts(saved['teams'].tolist(), saved['formations'].tolist(), saved['totals'], saved['counts'])
+        self.teams = self.index.teams
+
+    # function to answer one query (a dictionary with 'quarter', 'down', 'team', and 'field_side'); errors are returned as {'error': message}
+    def answer(self, query):
+        try:
+            situation = parse_situation(query, self.teams)
+        except ValueError as error:
+            return {'error': str(error)}
+        return decide_situation(self.tables, self.index, self.reward, *situation)
+
+"""# Export Playbook
+The whole league's playbook as columnar datasets for dashboards: every team's q-values and MDP probabilities in long format (one row per
+team, quarter, field side, state, and action), written as Parquet partitioned by team. The rows come straight from the q-tables and the
+situation index with array indexing, there's no per team data frame.
+"""
+
+# function to turn trained q-tables into long-format columns: one row per team, quarter, field side, state, and action the team ran
+# sample_count is the number of the team's plays that updated the value (from the index's per quarter counts; states past FourthDown are never updated)
+# returns a dictionary of column name -> (array, or (codes, names) for text columns)
+def playbook_q_columns(tables, index):
+    team, quarter, side, state, action = np.nonzero(np.broadcast_to((tables.first >= 0)[:, None, None, None, :], tables.values.shape))
+
+    # the index has its own team and action codes, so its counts are looked up by name
+    team_map = pd.Index(index.teams).get_indexer(tables.teams)
+    action_map = pd.Index(action_names(index.formations)).get_indexer(tables.actions)
+    counted = (team_map[team] >= 0) & (action_map[action] >= 0) & (state < 4)
+    sample_count = np.zeros(len(team), dtype=np.int64)
+    sample_count[counted] = index.quarter_totals[team_map[team[counted]], quarter[counted], state[counted], side[counted], action_map[action[counted]]]
+
+    return {'team': (team, tables.teams), 'quarter': quarter + 1, 'side': (side, SituationIndex.sides), 'state': (state, Q.states),
+            'action': (action, tables.actions), 'q_value': tables.values[team, quarter, side, state, action], 'sample_count': sample_count}
+
+# function to turn a situation index into long-format columns: one row per team, quarter, field side, down, and action with plays,
+# with the probability of every outcome (same probabilities MDP.from_index() uses) and the number of plays they come from
+def playbook_mdp_columns(index):
+    team, quarter, down, side, action = np.nonzero(index.totals > 0)
+    columns = {'team': (team, index.teams), 'quarter': quarter + 1, 'side': (side, SituationIndex.sides), 'state': (down, Q.states),
+               'action': (action, action_names(index.formations))}
+    probabilities = index.probabilities[team, quarter, down, side, action]
+    columns.update({outcome: probabilities[:, o] for o, outcome in enumerate(OUTCOMES)})
+    columns['sample_count'] = index.totals[team, quarter, down, side, action]
+    return columns
+
+# function to write the q-values and the MDP probabilities of every team under path as two Parquet datasets ('q_values' and 'mdp'),
+# each partitioned by team (path/q_values/team=KC/...), in one write per dataset
+# text columns are written as dictionary columns, so a team or action name is stored once per file instead of once per row
+def export_playbook(path, tables, index):
+    try:
+        import pyarrow as pa # only needed when exporting the playbook
+        import pyarrow.dataset as ds
+    except ImportError as error:
+        raise ImportError("Exporting the playbook needs pyarrow (pip install pyarrow)") from error
+
+    datasets = {'q_values': playbook_q_columns(tables, index), 'mdp': playbook_mdp_columns(index)}
+    for name, columns in datasets.items():
+        arrays = {column: pa.DictionaryArray.from_arrays(pa.array(values[0], type=pa.int32()), pa.array([str(n) for n in values[1]]))
+                  if isinstance(values, tuple) else pa.array(values) for column, values in columns.items()}
+        ds.write_dataset(pa.table(arrays), os.path.join(path, name), format='parquet', existing_data_behavior='delete_matching',
+                         partitioning=ds.partitioning(pa.schema([('team', arrays['team'].type)]), flavor='hive'))
+    return [os.path.join(path, name) for name in datasets]
+
 """# main program"""
 
 # main program to ask user for information and begin play deciding model
 def main():
     error = 0
 
-    # read in data
-    data = pd.read_csv('pbp-2024.csv')
+    # read in data (parsed from the csv only when the compiled season is missing or out of date)
+    data = load_season('pbp-2024.csv')
 
     # make a list of all teams in data set
     teams = data['OffenseTeam'].unique()
@@ -612,9 +2615,9 @@ def main():
         exit()
 
 
-    # clean data; one filtered data for markov models, one for q-learning
-    markov_data = markov_reorganize(data, int(quarter), int(down), team.upper(), field_side.upper())
-    q_data = q_reorganize(data, team.upper())
+    # derive the model columns for the whole season once, then slice out the plays for the markov models
+    plays = derive_features(data)
+    markov_data = markov_reorganize(plays, int(quarter), int(down), team.upper(), field_side.upper())
 
     # list of rewards in [Turnover, Negative Play, Next Down, First Down, Touchdown]
     rewards1 = [-10, -5, 2.5, 5, 10]
@@ -623,16 +2626,55 @@ def main():
     rewards4 = [-10, -5, 0, 10, 5] # values first downs more than touchdowns
 
 
-    test = Q(rewards1, q_data, quarter, down, field_side.upper())
+    # q-tables for every team are trained once per season and reward list, then loaded from the models folder
+    test = Q.from_tables(train_all(plays, rewards1, cache_dir='models'), team.upper(), quarter, down, field_side.upper())
     print("Best play according to Q-learning:", test.make_decision()[0])
-    test = MDP(rewards1, markov_data, quarter)
-    print("Best play according to MDP:", test.decision()[1], test.decision()[0])
+    test = MDP.from_index(rewards1, SituationIndex(plays), quarter, down, team.upper(), field_side.upper())
+    decision = test.decision()
+    print("Best play according to MDP:", decision[1], decision[0])
 
     print("\nPotential TD drives")
+    test = HMM(markov_data, quarter)
     for i in range(10):
         print("Drive #", i + 1)
-        test = HMM(markov_data, quarter)
+        test.generate_drive()
         print("\n")
 
+# function to pick what to run from the command line
+# with no arguments the interactive program runs; --serve starts the coach agent service instead
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="AI assistant football coach agent")
+    parser.add_argument('--serve', action='store_true', help="answer json queries (one per line) until stopped instead of asking once")
+    parser.add_argument('--socket', help="unix socket path to serve on (default is stdin/stdout)")
+    parser.add_argument('--data', default='pbp-2024.csv', help="play-by-play csv to use")
+    parser.add_argument('--follow', metavar='FEED', help="keep updating the models with the plays written to this csv while serving")
+    parser.add_argument('--query', nargs=4, metavar=('QUARTER', 'DOWN', 'TEAM', 'FIELD_SIDE'),
+                        help="answer one situation from the saved query tables and print the answer as json (builds the tables first if they're missing)")
+    parser.add_argument('--tables', default=QUERY_TABLES_PATH, help="query tables file used by --query")
+    parser.add_argument('--save-tables', action='store_true', help="fit the models on --data and save them as the query tables")
+    parser.add_argument('--export', metavar='FOLDER', help="fit the models on --data and write every team's q-values and MDP probabilities to this folder as Parquet")
+    parser.add_argument('--metrics', metavar='FILE', help="time and count every stage and write the totals to this file on exit (.prom or .txt for Prometheus text, json otherwise)")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        import atexit # only needed when writing metrics
+        metrics.enable()
+        atexit.register(metrics.write, args.metrics)
+
+    if args.save_tables or (args.query and not os.path.exists(args.tables)):
+        build_query_tables(args.data, args.tables)
+    if args.query:
+        quarter, down, team, field_side = args.query
+        print(json.dumps(QueryTables(args.tables).answer({'quarter': quarter, 'down': down, 'team': team, 'field_side': field_side})))
+    elif args.save_tables:
+        print("Saved query tables to", args.tables)
+    elif args.export:
+        plays = derive_features(load_season(args.data))
+        print("Wrote", *export_playbook(args.export, train_all(plays, CoachAgent.default_reward, cache_dir='models'), SituationIndex(plays)))
+    elif args.serve:
+        serve(CoachAgent(args.data), args.socket, args.follow)
+    else:
+        main()
+
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	cli()
\ No newline at end of file
@@ -0,0 +1,245 @@
+"""# Benchmark
+Times the decider's hot paths on synthetic play-by-play data so runs on different machines (or before and after a change) can be compared
+without sharing the real data. The synthetic seasons have the same columns as pbp-2024.csv and are seeded, so the same arguments always
+give the same data.
+
+Example: python benchmark.py --seasons 5 --teams 100 --output bench-5x100.json
+"""
+
+import os # for the temporary folder the csv benchmark writes to
+import sys # for finding the platform and silencing generate_drive()'s printing
+import time # for timing
+import json # for the report
+import argparse # for the command line options
+import tempfile # for the csv benchmark
+import contextlib # for silencing generate_drive()'s printing
+import pandas as pd # for the synthetic data
+import numpy as np # for the synthetic data
+import Football_Play_Decider as decider
+
+"""# Synthetic Data"""
+
+# every column of pbp-2024.csv, in order (the unnamed columns are empty in the real file too)
+PBP_COLUMNS = ['GameId', 'GameDate', 'Quarter', 'Minute', 'Second', 'OffenseTeam', 'DefenseTeam', 'Down', 'ToGo', 'YardLine', 'Unnamed: 10',
+               'SeriesFirstDown', 'Unnamed: 12', 'NextScore', 'Description', 'TeamWin', 'Unnamed: 16', 'Unnamed: 17', 'SeasonYear', 'Yards',
+               'Formation', 'PlayType', 'IsRush', 'IsPass', 'IsIncomplete', 'IsTouchdown', 'PassType', 'IsSack', 'IsChallenge', 'IsChallengeReversed',
+               'Challenger', 'IsMeasurement', 'IsInterception', 'IsFumble', 'IsPenalty', 'IsTwoPointConversion', 'IsTwoPointConversionSuccessful',
+               'RushDirection', 'YardLineFixed', 'YardLineDirection', 'IsPenaltyAccepted', 'PenaltyTeam', 'IsNoPlay', 'PenaltyType', 'PenaltyYards']
+
+# play types with roughly the shares they have in a real season (None is a row without a play type, e.g. a timeout)
+PLAY_TYPE_SHARES = {'PASS': 0.41, 'RUSH': 0.29, 'KICK OFF': 0.05, 'PUNT': 0.04, 'EXTRA POINT': 0.025, 'FIELD GOAL': 0.02, 'NO PLAY': 0.045,
+                    'SCRAMBLE': 0.02, 'QB KNEEL': 0.01, None: 0.09}
+# formations of pass and rush plays with roughly their real shares (None is a play without a formation)
+FORMATION_SHARES = {'SHOTGUN': 0.52, 'UNDER CENTER': 0.27, 'NO HUDDLE SHOTGUN': 0.15, 'NO HUDDLE': 0.035, 'WILDCAT': 0.005, None: 0.02}
+# formation special teams plays line up in
+SPECIAL_FORMATIONS = {'PUNT': 'PUNT', 'FIELD GOAL': 'FIELD GOAL', 'EXTRA POINT': 'FIELD GOAL'}
+
+# function to make team abbreviations (AA, AB, ...) for any number of teams
+def team_names(n_teams):
+    letters = [chr(ord('A') + i) for i in range(26)]
+    names = [a + b for a in letters for b in letters]
+    names = names + [a + b + c for a in letters for b in letters for c in letters] if n_teams > len(names) else names
+    return names[:n_teams]
+
+# function to pick from a dictionary of choices and shares
+def pick(rng, shares, size):
+    choices = np.array(list(shares.keys()), dtype=object)
+    weights = np.array(list(shares.values()), dtype=float)
+    return choices[rng.choice(len(choices), size=size, p=weights / weights.sum())]
+
+# function to make seeded synthetic play-by-play with the same columns as pbp-2024.csv
+# takes the number of seasons, number of teams, games each team plays per season, and rows (plays, timeouts, kicks, ...) per game
+# every game is a series of drives that go back and forth between its two teams; the rows come out shuffled like the real csv
+def synthetic_seasons(n_seasons=1, n_teams=32, games_per_team=17, rows_per_game=180, seed=0):
+    rng = np.random.default_rng(seed)
+    teams = np.array(team_names(n_teams), dtype=object)
+
+    # schedule: every week pairs the teams up at random
+    games = []
+    for season in range(n_seasons):
+        for week in range(games_per_team):
+            order = rng.permutation(n_teams)
+            for k in range(n_teams // 2):
+                games.append(((2024 - n_seasons + 1 + season) * 1000000 + (week + 1) * 10000 + k, 2024 - n_seasons + 1 + season,
+                              order[2 * k], order[2 * k + 1]))
+    game_id, season_year, home, away = [np.array(column) for column in zip(*games)]
+    n_games = len(games)
+    n = n_games * rows_per_game
+
+    # one row per play in game order: quarters split the game evenly and some games get an overtime
+    game = np.repeat(np.arange(n_games), rows_per_game)
+    position = np.tile(np.arange(rows_per_game), n_games)
+    quarter = (position * 4 // rows_per_game) + 1
+    overtime = rng.random(n_games) < 0.05
+    quarter[overtime[game] & (position >= rows_per_game - 10)] = 5
+    rows_in_quarter = np.bincount((game * 6) + quarter, minlength=n_games * 6)[(game * 6) + quarter]
+    first_in_quarter = np.maximum.accumulate(np.where(np.r_[True, (quarter[1:] != quarter[:-1]) | (game[1:] != game[:-1])], np.arange(n), 0))
+    seconds_left = 900 - ((np.arange(n) - first_in_quarter + 1) * 900 // (rows_in_quarter + 1))
+
+    # drives: a new drive starts at random and at every half; the offense switches every drive
+    new_drive = (rng.random(n) < 0.16) | (position == 0) | (np.r_[True, (quarter[1:] >= 3) != (quarter[:-1] >= 3)])
+    drive = np.cumsum(new_drive)
+    drive_in_game = drive - drive[np.repeat(np.arange(n_games) * rows_per_game, rows_per_game)]
+    offense = np.where(drive_in_game % 2 == 0, home[game], away[game])
+    defense = np.where(drive_in_game % 2 == 0, away[game], home[game])
+
+    # play type, formation, down, and distance
+    play_type = pick(rng, PLAY_TYPE_SHARES, n)
+    is_play = (play_type == 'PASS') | (play_type == 'RUSH')
+    formation = pick(rng, FORMATION_SHARES, n)
+    for special, special_formation in SPECIAL_FORMATIONS.items():
+        formation[play_type == special] = special_formation
+    down = np.where(is_play | (play_type == 'SCRAMBLE') | (play_type == 'PUNT') | (play_type == 'FIELD GOAL'),
+                    rng.choice([1, 2, 3, 4], size=n, p=[0.38, 0.31, 0.25, 0.06]), 0)
+    down[(play_type == 'PUNT') | (play_type == 'FIELD GOAL')] = 4
+    to_go = np.where(down == 1, np.where(rng.random(n) < 0.9, 10, rng.integers(1, 11, size=n)), rng.integers(1, 21, size=n))
+    to_go[down == 0] = 0
+    yard_line = rng.integers(1, 100, size=n)
+
+    # results: incomplete passes gain nothing, sacks lose yards, and a few plays score or turn the ball over
+    is_pass = play_type == 'PASS'
+    is_rush = play_type == 'RUSH'
+    incomplete = is_pass & (rng.random(n) < 0.36)
+    sack = is_pass & ~incomplete & (rng.random(n) < 0.07)
+    yards = np.where(is_pass, np.round(rng.normal(8, 9, size=n)), np.where(is_rush, np.round(rng.normal(4.3, 5.5, size=n)), 0)).astype(np.int64)
+    yards[incomplete] = 0
+    yards[sack] = -rng.integers(1, 12, size=int(sack.sum()))
+    touchdown = is_play & ~incomplete & ~sack & (rng.random(n) < 0.035)
+    interception = is_pass & (rng.random(n) < 0.022)
+    fumble = (is_pass | is_rush) & (rng.random(n) < 0.01)
+
+    data = pd.DataFrame({column: 0 for column in PBP_COLUMNS}, index=np.arange(n))
+    data['GameId'] = game_id[game]
+    data['GameDate'] = pd.Series(season_year[game]).astype(str).to_numpy() + "-09-08"
+    data['Quarter'] = quarter
+    data['Minute'] = seconds_left // 60
+    data['Second'] = seconds_left % 60
+    data['OffenseTeam'] = teams[offense]
+    data['DefenseTeam'] = teams[defense]
+    data['Down'] = down
+    data['ToGo'] = to_go
+    data['YardLine'] = yard_line
+    data['Description'] = "SYNTHETIC PLAY"
+    data['SeasonYear'] = season_year[game]
+    data['Yards'] = yards
+    data['Formation'] = formation
+    data['PlayType'] = play_type
+    data['IsRush'] = is_rush.astype(int)
+    data['IsPass'] = is_pass.astype(int)
+    data['IsIncomplete'] = incomplete.astype(int)
+    data['IsTouchdown'] = touchdown.astype(int)
+    data['PassType'] = np.where(is_pass, np.where(rng.random(n) < 0.5, 'SHORT RIGHT', 'SHORT LEFT'), None)
+    data['IsSack'] = sack.astype(int)
+    data['IsInterception'] = interception.astype(int)
+    data['IsFumble'] = fumble.astype(int)
+    data['RushDirection'] = np.where(is_rush, 'CENTER', None)
+    data['YardLineFixed'] = np.where(yard_line <= 50, yard_line, 100 - yard_line)
+    data['YardLineDirection'] = np.where(yard_line <= 50, 'OWN', 'OPP')
+    for column in ['Unnamed: 10', 'Unnamed: 12', 'Unnamed: 16', 'Unnamed: 17', 'Challenger', 'PenaltyTeam', 'PenaltyType']:
+        data[column] = None
+
+    # the real csv isn't in game order either
+    return data.iloc[rng.permutation(n)].reset_index(drop=True)
+
+"""# Timing"""
+
+# function to find the most memory the process has used so far, in megabytes (None where the resource module doesn't exist)
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS reports bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+# function to time calls of a function
+# takes the function, the arguments of every call, and the number of plays every call goes through
+# function returns the number of calls, total seconds, queries (calls) per second and plays per second
+# (peak memory is the whole process's, so it is reported once for the run rather than per stage)
+def time_calls(function, calls, plays):
+    start = time.perf_counter()
+    for arguments in calls:
+        function(*arguments)
+    seconds = time.perf_counter() - start
+    return {'calls': len(calls), 'seconds': round(seconds, 6), 'queries_per_sec': round(len(calls) / seconds, 2) if seconds > 0 else None,
+            'plays_per_sec': round(sum(plays) / seconds, 2) if seconds > 0 else None}
+
+# function to run every benchmark on one synthetic data set
+# queries is the number of situations every per-situation benchmark is run for (situations are picked from plays that happened)
+def run(n_seasons=1, n_teams=32, games_per_team=17, rows_per_game=180, queries=200, seed=0, csv=False):
+    reward = [-10, -5, 2.5, 5, 10]
+    report = {'config': {'seasons': n_seasons, 'teams': n_teams, 'games_per_team': games_per_team, 'rows_per_game': rows_per_game,
+                         'queries': queries, 'seed': seed},
+              'python': sys.version.split()[0], 'numpy': np.__version__, 'pandas': pd.__version__, 'results': {}}
+    results = report['results']
+
+    start = time.perf_counter()
+    data = synthetic_seasons(n_seasons, n_teams, games_per_team, rows_per_game, seed)
+    report['generate_seconds'] = round(time.perf_counter() - start, 6)
+    report['rows'] = len(data)
+
+    # parsing the csv and compiling the season (only when asked, writing the csv takes a while for big sizes)
+    if csv:
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'pbp-synthetic.csv')
+            data.to_csv(path, index=False)
+            results['compile_season'] = time_calls(decider.compile_season, [(path,)], [len(data)])
+            results['load_season'] = time_calls(decider.load_season, [(path,)], [len(data)])
+
+    season = data[decider.SEASON_COLUMNS]
+    results['derive_features'] = time_calls(decider.derive_features, [(season,)], [len(season)])
+    plays = decider.derive_features(season)
+    report['plays'] = len(plays)
+
+    # situations that have plays, picked at random
+    rng = np.random.default_rng(seed)
+    picked = plays.iloc[rng.integers(0, len(plays), size=queries)]
+    situations = list(zip(picked['Quarter'].astype(int), picked['Down'].astype(int), picked['OffenseTeam'].astype(str), picked['YardLineDirection'].astype(str)))
+    teams = [situation[2] for situation in situations]
+
+    results['markov_reorganize'] = time_calls(decider.markov_reorganize, [(plays,) + situation for situation in situations], [len(plays)] * queries)
+    results['q_reorganize'] = time_calls(decider.q_reorganize, [(plays, team) for team in teams], [len(plays)] * queries)
+
+    # each model is made once per situation outside the timer, then only the benchmarked method is timed
+    markov_data = [decider.markov_reorganize(plays, *situation) for situation in situations]
+    mdps = [decider.MDP(reward, situation_plays, situation[0]) for situation_plays, situation in zip(markov_data, situations)]
+    results['MDP.calculate'] = time_calls(lambda mdp: mdp.calculate(), [(mdp,) for mdp in mdps], [len(d) for d in markov_data])
+    results['MDP.decision'] = time_calls(lambda mdp: mdp.decision(), [(mdp,) for mdp in mdps], [len(d) for d in markov_data])
+
+    q_data = [decider.q_reorganize(plays, team) for team in teams]
+    qs = [decider.Q(reward, team_plays, situation[0], situation[1], situation[3]) for team_plays, situation in zip(q_data, situations)]
+    results['Q.fill_Q_Table'] = time_calls(lambda q: q.fill_Q_Table(), [(q,) for q in qs], [len(d) for d in q_data])
+    results['Q.make_decision'] = time_calls(lambda q: q.make_decision(), [(q,) for q in qs], [len(d) for d in q_data])
+
+    hmms = [decider.HMM(situation_plays, situation[0], seed=seed) for situation_plays, situation in zip(markov_data, situations)]
+    results['HMM.calculate'] = time_calls(lambda hmm: hmm.calculate(), [(hmm,) for hmm in hmms], [len(d) for d in markov_data])
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        results['HMM.generate_drive'] = time_calls(lambda hmm: hmm.generate_drive(), [(hmm,) for hmm in hmms], [len(d) for d in markov_data])
+
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+# function to run the benchmark from the command line and write the report as json (to stdout unless an output file is given)
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the football play decider on synthetic play-by-play data")
+    parser.add_argument('--seasons', type=int, default=1, help="number of seasons to generate")
+    parser.add_argument('--teams', type=int, default=32, help="number of teams")
+    parser.add_argument('--games', type=int, default=17, help="games every team plays per season")
+    parser.add_argument('--rows-per-game', type=int, default=180, help="csv rows per game (plays, kicks, timeouts, ...)")
+    parser.add_argument('--queries', type=int, default=200, help="situations to run every per-situation benchmark for")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic data and the picked situations")
+    parser.add_argument('--csv', action='store_true', help="also time compiling and loading the season from a csv")
+    parser.add_argument('--output', help="file to write the json report to")
+    args = parser.parse_args(argv)
+
+    report = run(args.seasons, args.teams, args.games, args.rows_per_game, args.queries, args.seed, args.csv)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,42 @@
+"""# Test Fixtures
+Small seeded synthetic seasons (see benchmark.synthetic_seasons()) shared by the tests. The decider and the benchmark are plain modules in the
+repository's root folder, so it is put on the import path first.
+"""
+
+import os # for finding the repository's root folder
+import sys # for importing the decider from the root folder
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Football_Play_Decider as decider
+from benchmark import synthetic_seasons
+
+# reward list the tests fit with, in the order [Turnover, Negative Play, Next Down, First Down, Touchdown]
+REWARD = [-10, -5, 2.5, 5, 10]
+
+# function to get the raw season columns of a small synthetic data set with categorical teams and formations (like load_season() gives);
+# categories keep the whole vocabulary in any slice of the plays, so models fitted on part of the plays line up with ones fitted on all of them
+def synthetic_season(n_seasons=1, seed=1):
+    season = synthetic_seasons(n_seasons, n_teams=6, games_per_team=4, rows_per_game=120, seed=seed)[decider.SEASON_COLUMNS]
+    return season.astype({column: 'category' for column in decider.CATEGORICAL_COLUMNS})
+
+@pytest.fixture(scope='session')
+def reward():
+    return list(REWARD)
+
+# the derived plays of the synthetic season; tests must not change the frame (copy it first)
+@pytest.fixture(scope='session')
+def plays():
+    return decider.derive_features(synthetic_season())
+
+# function to get a synthetic season's raw rows (every play-by-play column) in game order, like a feed or pbp csv has them
+def season_rows(seed=1):
+    rows = synthetic_seasons(1, n_teams=6, games_per_team=4, rows_per_game=120, seed=seed)
+    return rows.sort_values(by=['GameId', 'Quarter', 'Minute', 'Second'], ascending=[True, True, False, False], kind='stable').reset_index(drop=True)
+
+# function to write rows as a play-by-play csv in a folder and return its path
+def write_season(folder, rows, name='pbp-2024.csv'):
+    path = os.path.join(str(folder), name)
+    rows.to_csv(path, index=False)
+    return path
@@ -0,0 +1,30 @@
+"""# Action Encoding Tests
+Every model codes a play's action with encode_actions() and names it with action_names(); q-tables order their columns with column_order().
+"""
+
+import numpy as np
+import pandas as pd
+import Football_Play_Decider as decider
+
+def test_action_codes_name_the_plays_action(plays):
+    action, formations = decider.encode_actions(plays)
+    names = np.array(decider.action_names(formations), dtype=object)[action]
+    np.testing.assert_array_equal(names, (plays['Formation'].astype(str) + " " + plays['PlayType'].astype(str)).to_numpy())
+
+    play_type, formation = decider.decode_actions(action, len(formations))
+    np.testing.assert_array_equal(play_type, decider.play_type_codes(plays))
+    np.testing.assert_array_equal(np.asarray(formations, dtype=object)[formation], plays['Formation'].astype(str).to_numpy())
+
+def test_unknown_formations_get_no_action(plays):
+    _, formations = decider.encode_actions(plays)
+    known = formations[1:]
+    action, returned = decider.encode_actions(plays, known)
+    assert returned == known
+    np.testing.assert_array_equal(action < 0, (plays['Formation'].astype(str) == formations[0]).to_numpy())
+
+def test_columns_are_passes_then_rushes_in_first_run_order():
+    plays = pd.DataFrame({'PlayType': ['RUSH', 'PASS', 'RUSH', 'PASS', 'PASS'], 'Formation': ['B', 'B', 'A', 'A', 'B']})
+    action, formations = decider.encode_actions(plays)
+    keys, first = np.unique(action, return_index=True)
+    order = keys[decider.column_order(decider.decode_actions(keys, len(formations))[0], first)]
+    assert [decider.action_names(formations)[k] for k in order] == ['B PASS', 'A PASS', 'B RUSH', 'A RUSH']
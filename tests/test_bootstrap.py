@@ -0,0 +1,86 @@
+"""# Bootstrap Tests
+The MDP's batched resamples give the same action values as refitting on every resample one at a time, actions whose plays always
+have the same result have no spread, and the online q-learning bootstrap and the coach agent's 'bootstrap' option report every action.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import Football_Play_Decider as decider
+from conftest import REWARD, season_rows, write_season
+from test_mdp_solve import first_and_ten_plays
+
+# function to find the team and situation with the most plays in the first quarter on first down
+def busiest_situation(plays):
+    first = plays[(plays['Quarter'] == 1) & (plays['Down'] == 1)]
+    team, field_side = first.groupby(['OffenseTeam', 'YardLineDirection'], observed=True).size().idxmax()
+    return decider.markov_reorganize(plays, 1, 1, team, field_side)
+
+def test_batched_resamples_match_refitting_every_resample(plays):
+    data = busiest_situation(plays)
+    n = 40
+    table = decider.MDP(REWARD, data, 1).bootstrap(n, seed=11)
+
+    # the same resamples, each one's action values worked out from its own rows
+    resamples = np.random.default_rng(11).integers(0, len(data), size=(n, len(data)))
+    reward = decider.outcome_rewards(REWARD)
+    values = np.full((n, len(table)), np.nan)
+    for i, rows in enumerate(resamples):
+        resample = data.iloc[rows]
+        for a, (play, formation) in enumerate(zip(table['Play'], table['Formation'])):
+            ran = resample[(resample['PlayType'] == play.upper()) & (resample['Formation'] == formation)]
+            if len(ran):
+                values[i, a] = (ran[decider.OUTCOME_COLUMNS].to_numpy(dtype=float).mean(axis=0) * reward).max()
+    mean, low, high, _ = decider.bootstrap_summary(values)
+
+    np.testing.assert_allclose(table['Mean'], mean)
+    np.testing.assert_allclose(table['Low'], low)
+    np.testing.assert_allclose(table['High'], high)
+    assert table['Plays'].sum() == len(data)
+    assert table['PBest'].sum() == pytest.approx(1.0)
+    assert list(table['PBest']) == sorted(table['PBest'], reverse=True)
+
+def test_actions_with_one_result_have_no_spread():
+    table = decider.MDP(REWARD, first_and_ten_plays(), 1).bootstrap(500, seed=2).set_index('Formation')
+    assert table.loc['SHOTGUN', 'Value'] == 5.0
+    assert table.loc['SHOTGUN', ['Mean', 'Low', 'High']].tolist() == [5.0, 5.0, 5.0]
+    assert table.loc['UNDER CENTER', 'Outcome'] != 'turnover'
+    assert table.loc['SHOTGUN', 'PBest'] > 0.99
+
+def test_mdp_bootstrap_needs_plays(plays):
+    index = decider.SituationIndex(plays)
+    with pytest.raises(ValueError, match="plays"):
+        decider.MDP.from_index(REWARD, index, 1, 1, index.teams[0], 'OWN').bootstrap(10)
+
+def test_q_bootstrap_reports_every_action(plays):
+    team = plays['OffenseTeam'].cat.categories[0]
+    q = decider.Q(REWARD, decider.q_reorganize(plays, team), 1, 1, 'OWN')
+    table = q.bootstrap(300, seed=4)
+
+    assert sorted(table['Action']) == sorted(q.actions)
+    row = q.values[0, 0, 0]
+    np.testing.assert_array_equal(table.set_index('Action').loc[q.actions, 'Value'], row)
+    assert (table['Low'] <= table['Mean']).all() and (table['Mean'] <= table['High']).all()
+    assert table['PBest'].sum() == pytest.approx(1.0)
+    pd.testing.assert_frame_equal(q.bootstrap(300, seed=4), table)
+
+def test_q_bootstrap_needs_plays_and_one_reward_list(plays):
+    team = plays['OffenseTeam'].cat.categories[0]
+    sweep = decider.Q([REWARD, [-20, -2, 1, 6, 20]], decider.q_reorganize(plays, team), 1, 1, 'OWN')
+    with pytest.raises(ValueError):
+        sweep.bootstrap(10)
+    tables = decider.train_all(plays, REWARD)
+    with pytest.raises(ValueError):
+        decider.Q.from_tables(tables, team, 1, 1, 'OWN').bootstrap(10)
+
+def test_agent_answers_with_uncertainty(tmp_path):
+    agent = decider.CoachAgent(write_season(tmp_path, season_rows()), cache_dir=str(tmp_path / 'models'))
+    answer = agent.answer({'quarter': 1, 'down': 1, 'team': agent.teams[0], 'field_side': 'OWN', 'drives': 0, 'bootstrap': 50, 'seed': 3})
+    assert set(answer['uncertainty']) == {'mdp', 'q_learning'}
+    for name, rows in answer['uncertainty'].items():
+        if isinstance(rows, dict):
+            assert list(rows) == ['error']
+        else:
+            assert rows and {'Mean', 'Low', 'High', 'PBest'} <= set(rows[0])
+    assert isinstance(answer['uncertainty']['q_learning'], list)
+    assert 'uncertainty' not in agent.answer({'quarter': 1, 'down': 1, 'team': agent.teams[0], 'field_side': 'OWN', 'drives': 0})
@@ -0,0 +1,49 @@
+"""# Batch Query Tests
+decide_many() answers every situation the same way the one-situation paths do (Q.from_tables(...).make_decision() and
+MDP.from_index(...).decision()), and gives invalid situations or situations without plays empty results.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import Football_Play_Decider as decider
+from conftest import REWARD
+
+@pytest.fixture(scope='module')
+def models(plays):
+    return decider.SituationIndex(plays), decider.train_all(plays, REWARD)
+
+def test_every_situation_matches_the_single_answers(models):
+    index, tables = models
+    situations = decider.all_situations(index.teams)
+    results = decider.decide_many(situations, index, tables, REWARD)
+    assert len(results) == len(situations)
+
+    answered = 0
+    for row in results.itertuples():
+        q_action, q_value = decider.Q.from_tables(tables, row.team, row.quarter, row.down, row.field_side).make_decision()
+        assert (row.q_action, row.q_value) == (q_action, q_value)
+        try:
+            play, formation, value = decider.MDP.from_index(REWARD, index, row.quarter, row.down, row.team, row.field_side).decision()
+        except ValueError:
+            assert pd.isna(row.mdp_play) and pd.isna(row.mdp_value)
+            continue
+        assert (row.mdp_play, row.mdp_formation, row.mdp_value) == (play, formation, value)
+        answered += 1
+    assert answered > 0
+
+def test_invalid_situations_get_empty_results(models):
+    index, tables = models
+    team = index.teams[0]
+    situations = pd.DataFrame({'team': [team, team.lower(), team, team, team, 'NOPE', team, team],
+                               'quarter': ['OT', 1, 2.5, 'x', 1, 1, 6, 1],
+                               'down': [1, 1, 1, 1, None, 1, 1, 5],
+                               'field_side': ['OWN', 'own', 'OWN', 'OWN', 'OWN', 'OWN', 'OWN', 'MID']})
+    results = decider.decide_many(situations, index, tables, REWARD)
+
+    # overtime given as 'OT' and names in any case are read, everything else is invalid
+    assert results['q_action'].iloc[:2].notna().all()
+    assert results.loc[0, 'q_action'] == decider.Q.from_tables(tables, team, 5, 1, 'OWN').make_decision()[0]
+    assert results['q_action'].iloc[2:].isna().all()
+    assert results['mdp_play'].iloc[2:].isna().all()
+    assert results['q_value'].iloc[2:].isna().all() and results['mdp_value'].iloc[2:].isna().all()
@@ -0,0 +1,85 @@
+"""# Drive Simulator Tests
+Drives made from plays that always gain the same yards end the way they can be worked out by hand (touchdowns, punts, field goals,
+turnovers, and safeties), and simulating a season gives rates that add up and better expected points closer to the goal line.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import Football_Play_Decider as decider
+from conftest import REWARD
+
+# function to make a game of plays from all over the field where passes from 'SHOTGUN' always gain pass_yards and rushes from
+# 'UNDER CENTER' always gain rush_yards (and are fumbled if fumble is set)
+def constant_plays(pass_yards=12, rush_yards=3, fumble=False, n=40):
+    yard_line = np.tile(np.arange(5, 100, 10), n // 10)
+    rows = pd.DataFrame({'GameId': 1, 'Quarter': 1, 'Minute': 14 - np.arange(2 * len(yard_line)) // 10, 'Second': 0, 'OffenseTeam': 'KC',
+                         'Down': np.tile([1, 1, 2, 3], len(yard_line) // 2), 'ToGo': 10,
+                         'YardLine': np.repeat(np.where(yard_line > 50, 100 - yard_line, yard_line), 2),
+                         'YardLineDirection': np.repeat(np.where(yard_line > 50, 'OPP', 'OWN'), 2),
+                         'Yards': np.tile([pass_yards, rush_yards], len(yard_line)), 'PlayType': np.tile(['PASS', 'RUSH'], len(yard_line)),
+                         'Formation': np.tile(['SHOTGUN', 'UNDER CENTER'], len(yard_line)), 'IsTouchdown': 0, 'IsInterception': 0,
+                         'IsFumble': np.tile([0, int(fumble)], len(yard_line)), 'IsSack': 0})
+    return decider.derive_features(rows)
+
+# function to make the policy that always runs one action
+def always(simulator, action):
+    return simulator.policy([[action, action]] * 4)
+
+def test_drives_with_constant_yards_end_as_worked_out():
+    simulator = decider.DriveSimulator(constant_plays(pass_yards=12, rush_yards=0))
+    starts = pd.DataFrame({'Down': [1, 1], 'ToGo': [10, 10], 'YardLine': [25, 70]})
+
+    # 12 yards a play from the 25 scores on the 7th play
+    passing = simulator.simulate(always(simulator, 'SHOTGUN PASS'), starts, n=200, seed=1).iloc[0]
+    assert passing['Touchdown'] == 1.0 and passing['ExpectedPoints'] == 7.0 and passing['Plays'] == 7.0
+
+    # no gain: three downs, then a punt from the 25 and a field goal try from the 70 (a 47 yard kick)
+    rushing = simulator.simulate(always(simulator, 'UNDER CENTER RUSH'), starts, n=20000, seed=1)
+    assert rushing.loc[0, 'Punt'] == 1.0 and rushing.loc[0, 'Plays'] == 3.0
+    assert rushing.loc[1, 'FieldGoal'] == pytest.approx(decider.field_goal_rate(70), abs=0.02)
+    assert rushing.loc[1, 'FieldGoal'] + rushing.loc[1, 'MissedFieldGoal'] == 1.0
+    assert rushing.loc[1, 'ExpectedPoints'] == pytest.approx(3 * rushing.loc[1, 'FieldGoal'])
+
+    # going for it on fourth and 10 without gaining ends on downs after four plays
+    on_downs = simulator.simulate(always(simulator, 'UNDER CENTER RUSH'), starts, n=100, seed=1, go_for_it=10).iloc[0]
+    assert on_downs['TurnoverOnDowns'] == 1.0 and on_downs['Plays'] == 4.0
+
+def test_fumbles_safeties_and_unfinished_drives():
+    simulator = decider.DriveSimulator(constant_plays(pass_yards=12, rush_yards=-5, fumble=True))
+    fumbles = simulator.simulate(always(simulator, 'UNDER CENTER RUSH'), n=100, seed=2).iloc[0]
+    assert fumbles['Turnover'] == 1.0 and fumbles['Plays'] == 1.0
+
+    simulator = decider.DriveSimulator(constant_plays(pass_yards=12, rush_yards=-5))
+    safety = simulator.simulate(always(simulator, 'UNDER CENTER RUSH'), {'Down': [1], 'ToGo': [10], 'YardLine': [3]}, n=100, seed=2).iloc[0]
+    assert safety['Safety'] == 1.0 and safety['ExpectedPoints'] == -2.0
+
+    unfinished = simulator.simulate(always(simulator, 'SHOTGUN PASS'), n=100, seed=2, max_plays=2).iloc[0]
+    assert unfinished['Unfinished'] == 1.0 and unfinished['Plays'] == 2.0
+
+def test_policy_picks_and_unknown_actions():
+    simulator = decider.DriveSimulator(constant_plays())
+    policy = simulator.policy([['SHOTGUN PASS', None], [None, 'UNDER CENTER RUSH'], [None, None], [None, None]])
+    assert policy.shape == (4, len(decider.DISTANCE_BUCKETS), 10)
+    assert (policy[0, :, :5] == simulator.actions.index('SHOTGUN PASS')).all()
+    assert (policy[1, :, 5:] == simulator.actions.index('UNDER CENTER RUSH')).all()
+    np.testing.assert_array_equal(policy[2:], simulator.usual_policy[2:])
+    with pytest.raises(ValueError, match="Unknown action"):
+        simulator.policy([['PISTOL PASS', None]])
+
+def test_season_rates_add_up_and_field_position_matters(plays):
+    simulator = decider.DriveSimulator(plays)
+    starts = pd.DataFrame({'Down': [1, 1], 'ToGo': [10, 10], 'YardLine': [5, 80]})
+    simulated = simulator.simulate(starts=starts, n=5000, seed=3)
+
+    rates = simulated[decider.DRIVE_RESULTS].to_numpy()
+    np.testing.assert_allclose(rates.sum(axis=1), 1.0)
+    np.testing.assert_allclose(simulated['ExpectedPoints'], rates @ decider.DRIVE_POINTS)
+    assert simulated.loc[1, 'ExpectedPoints'] > simulated.loc[0, 'ExpectedPoints']
+    pd.testing.assert_frame_equal(simulator.simulate(starts=starts, n=5000, seed=3), simulated)
+
+    team = plays['OffenseTeam'].cat.categories[0]
+    index = decider.SituationIndex(plays)
+    for policy in [simulator.q_policy(decider.train_all(plays, REWARD), team, 1), simulator.mdp_policy(index, REWARD, team, 1)]:
+        assert policy.shape == simulator.usual_policy.shape
+        assert ((policy >= 0) & (policy < len(simulator.actions))).all()
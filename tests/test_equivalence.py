@@ -0,0 +1,106 @@
+"""# Equivalence Tests
+The fast paths are meant to give exactly what the straightforward ones do: the situation index what an MDP fitted on the situation's plays
+decides, fit_parallel() and fit_seasons() what train_all(), SituationIndex, and HMM give, and every update() in pieces what one fit on
+all the plays gives. These check that on a small seeded synthetic season (see benchmark.synthetic_seasons()).
+
+Run with: python -m pytest -q (from the repository's root folder)
+"""
+
+import numpy as np
+import pandas as pd
+import Football_Play_Decider as decider
+from benchmark import synthetic_seasons
+from conftest import REWARD
+
+# function to check two q-tables are the same (teams, actions, values, and every team's column order)
+# first is only compared by the order it gives: update() numbers a team's new actions after its others instead of by play
+def assert_same_tables(tables, expected):
+    assert tables.teams == expected.teams
+    assert tables.actions == expected.actions
+    np.testing.assert_array_equal(tables.values, expected.values)
+    for i in range(len(tables.teams)):
+        np.testing.assert_array_equal(tables.team_columns(i), expected.team_columns(i))
+
+# function to check two situation indexes have the same counts
+def assert_same_index(index, expected):
+    assert list(index.teams) == list(expected.teams)
+    assert list(index.formations) == list(expected.formations)
+    np.testing.assert_array_equal(index.quarter_totals, expected.quarter_totals)
+    np.testing.assert_array_equal(index.quarter_counts, expected.quarter_counts)
+
+# function to get every team's HMM counts fitted on the team's own plays
+def team_hmm_counts(plays, teams):
+    hmms = [decider.HMM(decider.q_reorganize(plays, team), 1) for team in teams]
+    return np.stack([hmm.transition_counts for hmm in hmms]), np.stack([hmm.result_counts for hmm in hmms])
+
+def test_index_matches_mdp(plays):
+    index = decider.SituationIndex(plays)
+    checked = 0
+    for team in index.teams:
+        for quarter in range(1, 6):
+            for down in range(1, 5):
+                for field_side in decider.SituationIndex.sides:
+                    situation = decider.markov_reorganize(plays, quarter, down, team, field_side)
+                    if not situation['PlayType'].isin(decider.PLAY_TYPES).any():
+                        continue
+                    assert index.decision(REWARD, quarter, down, team, field_side) == decider.MDP(REWARD, situation, quarter).decision()
+                    checked += 1
+    assert checked > 0
+
+def test_fit_parallel_matches_train_all(plays):
+    fitted = decider.fit_parallel(plays, REWARD, processes=2)
+    assert_same_tables(fitted['tables'], decider.train_all(plays, REWARD))
+    assert_same_index(fitted['index'], decider.SituationIndex(plays))
+
+    transitions, results = team_hmm_counts(plays, fitted['tables'].teams)
+    np.testing.assert_array_equal(fitted['transitions'], transitions)
+    np.testing.assert_array_equal(fitted['results'], results)
+
+def test_fit_seasons_matches_fit_parallel(tmp_path):
+    data = synthetic_seasons(2, n_teams=6, games_per_team=4, rows_per_game=120, seed=2)
+    for year, season in data.groupby('SeasonYear'):
+        season.to_csv(tmp_path / ('pbp-' + str(year) + '.csv'), index=False)
+
+    # small chunks so every season is streamed in several groups of games
+    streamed = decider.fit_seasons(str(tmp_path / 'pbp-*.csv'), REWARD, chunksize=500)
+    seasons = pd.concat([pd.read_csv(tmp_path / ('pbp-' + str(year) + '.csv')) for year in sorted(data['SeasonYear'].unique())])
+    fitted = decider.fit_parallel(decider.derive_features(seasons[decider.SEASON_COLUMNS]), REWARD, processes=2)
+
+    assert_same_tables(streamed['tables'], fitted['tables'])
+    assert_same_index(streamed['index'], fitted['index'])
+    np.testing.assert_array_equal(streamed['transitions'], fitted['transitions'])
+    np.testing.assert_array_equal(streamed['results'], fitted['results'])
+
+def test_update_in_halves_matches_full_fit(plays):
+    half = len(plays) // 2
+    first, second = plays.iloc[:half], plays.iloc[half:]
+
+    index = decider.SituationIndex(first)
+    index.update(second)
+    assert_same_index(index, decider.SituationIndex(plays))
+
+    tables = decider.train_all(first, REWARD)
+    tables.update(second)
+    assert_same_tables(tables, decider.train_all(plays, REWARD))
+
+    for team in tables.teams:
+        q = decider.Q(REWARD, decider.q_reorganize(first, team), 1, 1, 'OWN')
+        q.update(decider.q_reorganize(second, team))
+        expected = decider.Q(REWARD, decider.q_reorganize(plays, team), 1, 1, 'OWN')
+        assert q.actions == expected.actions
+        np.testing.assert_array_equal(q.values, expected.values)
+
+        hmm = decider.HMM(decider.q_reorganize(first, team), 1)
+        hmm.update(decider.q_reorganize(second, team))
+        expected = decider.HMM(decider.q_reorganize(plays, team), 1)
+        np.testing.assert_array_equal(hmm.transition_counts, expected.transition_counts)
+        np.testing.assert_array_equal(hmm.result_counts, expected.result_counts)
+
+def test_slice_is_not_served_the_season_cache(plays, tmp_path):
+    plays = plays.copy()
+    decider.set_data_version(plays, 'season')
+    decider.train_all(plays, REWARD, cache_dir=str(tmp_path))
+    games = plays['GameId'].unique()[:2]
+    part = plays[plays['GameId'].isin(games).to_numpy()]
+    assert decider.stored_data_version(part) is None
+    assert_same_tables(decider.train_all(part, REWARD, cache_dir=str(tmp_path)), decider.train_all(part, REWARD))
@@ -0,0 +1,61 @@
+"""# Policy Evaluation Tests
+Folds hold whole games, and the pooled evaluation scores every method the same way as fitting train_all() and a SituationIndex on the
+training games and looking up every held-out play with decide_many().
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import Football_Play_Decider as decider
+from conftest import REWARD
+
+REWARDS = [REWARD, [-20, -2, 1, 6, 20]]
+
+def test_folds_hold_whole_games(plays):
+    fold = decider.evaluation_folds(plays, 3, seed=2)
+    games = pd.Series(fold).groupby(plays['GameId'].to_numpy()).nunique()
+    assert (games == 1).all()
+    per_fold = np.bincount(pd.Series(fold).groupby(plays['GameId'].to_numpy()).first(), minlength=3)
+    assert per_fold.max() - per_fold.min() <= 1
+    np.testing.assert_array_equal(decider.evaluation_folds(plays, 3, seed=2), fold)
+
+# function to score one method serially: fit on the other folds' games and count the held-out plays whose action matches the pick
+def serial_scores(plays, fold, reward, n_folds):
+    score_rewards = decider.state_rewards(REWARD)
+    scores = {'Q-learning': [0, 0, 0.0], 'MDP': [0, 0, 0.0]}
+    action = (plays['Formation'].astype(str) + " " + plays['PlayType'].astype(str)).to_numpy()
+    next_state = decider.encode_transitions(plays)['next_state']
+    for k in range(n_folds):
+        train = plays[fold != k]
+        test = np.flatnonzero((fold == k) & (decider.side_codes(plays) >= 0))
+        held_out = plays.iloc[test]
+        situations = pd.DataFrame({'team': held_out['OffenseTeam'].astype(str).to_numpy(), 'quarter': held_out['Quarter'].to_numpy(),
+                                   'down': held_out['Down'].to_numpy(), 'field_side': held_out['YardLineDirection'].astype(str).to_numpy()})
+        picks = decider.decide_many(situations, decider.SituationIndex(train), decider.train_all(train, reward), reward)
+        mdp_action = (picks['mdp_formation'].astype(str) + " " + picks['mdp_play'].astype(str).str.split(" ").str[0].str.upper()).to_numpy()
+        for method, pick, has_pick in [('Q-learning', picks['q_action'].astype(str).to_numpy(), picks['q_action'].notna().to_numpy()),
+                                       ('MDP', mdp_action, picks['mdp_play'].notna().to_numpy())]:
+            matched = has_pick & (pick == action[test])
+            scores[method][0] += int(has_pick.sum())
+            scores[method][1] += int(matched.sum())
+            scores[method][2] += float(score_rewards[next_state[test][matched]].sum())
+    return scores
+
+def test_pooled_evaluation_matches_serial_fits(plays):
+    results = decider.evaluate_policies(plays, REWARDS, n_folds=3, seed=2, processes=2)
+    assert list(results['Method']) == ['Observed'] + ['Q-learning', 'MDP'] * len(REWARDS)
+    assert results.attrs['seconds'] > 0
+
+    observed = results.iloc[0]
+    placed = decider.side_codes(plays) >= 0
+    assert observed['Plays'] == placed.sum() and observed['MatchRate'] == 1.0
+
+    fold = decider.evaluation_folds(plays, 3, seed=2)
+    for reward in REWARDS:
+        expected = serial_scores(plays, fold, reward, 3)
+        for method, (n_plays, matched, total) in expected.items():
+            row = results[(results['Method'] == method) & (results['Reward'].apply(lambda r: r == [float(x) for x in reward]))].iloc[0]
+            assert (row['Plays'], row['Matched']) == (n_plays, matched)
+            assert row['MatchRate'] == pytest.approx(matched / n_plays)
+            assert row['ExpectedReward'] == pytest.approx(total / max(matched, 1))
+            assert 0 <= row['SuccessRate'] <= 1
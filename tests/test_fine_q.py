@@ -0,0 +1,41 @@
+"""# FineQ Tests
+Q-learning over fine situations: the table's labels and decisions for a team, including one fitted on a slice of the season
+whose team categories still hold every team.
+"""
+
+import numpy as np
+import pytest
+import Football_Play_Decider as decider
+
+def test_one_team_slice_is_labelled_with_its_team(plays, reward):
+    team = plays['OffenseTeam'].cat.categories[-1]
+    team_plays = decider.q_reorganize(plays, team)
+    fine = decider.FineQ(reward, team_plays)
+
+    table = fine.q_table
+    assert set(table.index.get_level_values('Team')) == {team}
+    assert set(table.index.get_level_values('Down')) <= {1, 2, 3, 4}
+    assert len(table) == len(fine.keys)
+
+    # the team's rows are the same when every team is fitted at once (teams' drives never mix)
+    season = decider.FineQ(reward, plays).q_table
+    np.testing.assert_array_equal(season.loc[team].to_numpy(), table.loc[team].to_numpy())
+
+def test_make_decision_picks_the_best_action_run(plays, reward):
+    team = plays['OffenseTeam'].cat.categories[-1]
+    team_plays = decider.q_reorganize(plays, team)
+    fine = decider.FineQ(reward, team_plays)
+    play = team_plays.iloc[0]
+    action, value = fine.make_decision(team, play['Quarter'], play['Down'], play['ToGo'], play['YardLine'], play['Minute'], play['Second'])
+
+    # the situation's row of the table, actions never run there are empty
+    key = decider.fine_state_keys(team_plays.iloc[:1], np.array([fine.teams.index(team)]), len(fine.teams))[0]
+    row = fine.q_table.iloc[int(np.searchsorted(fine.keys, key))]
+    assert row.name[:2] == (team, int(play['Down']))
+    assert value == row.max()
+    assert action == row.idxmax()
+
+    # another team has no plays of its own in this table
+    other = plays['OffenseTeam'].cat.categories[0]
+    with pytest.raises(ValueError):
+        fine.make_decision(other, play['Quarter'], play['Down'], play['ToGo'], play['YardLine'], play['Minute'], play['Second'])
@@ -0,0 +1,54 @@
+"""# MDP Solver Tests
+Value iteration on a few hand-made plays whose values can be worked out by hand, the turnover terminal for interceptions and fumbles,
+and the clear errors for an MDP that can't be solved.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import Football_Play_Decider as decider
+from conftest import REWARD
+
+# function to make one game of plays on first and 10 at the offense's own 20: passes from 'SHOTGUN' always gain 12 yards,
+# rushes from 'UNDER CENTER' are always fumbled after a gain of 3
+def first_and_ten_plays(n=6):
+    rows = pd.DataFrame({'GameId': 1, 'Quarter': 1, 'Minute': 14 - np.arange(2 * n) // 2, 'Second': 0, 'OffenseTeam': 'KC', 'Down': 1, 'ToGo': 10,
+                         'YardLine': 20, 'Yards': np.tile([12, 3], n), 'YardLineDirection': 'OWN', 'PlayType': np.tile(['PASS', 'RUSH'], n),
+                         'Formation': np.tile(['SHOTGUN', 'UNDER CENTER'], n), 'IsTouchdown': 0, 'IsInterception': 0,
+                         'IsFumble': np.tile([0, 1], n), 'IsSack': 0})
+    return decider.derive_features(rows)
+
+def test_solve_values_match_the_hand_worked_ones():
+    mdp = decider.MDP(REWARD, first_and_ten_plays(), 1)
+    policy = mdp.solve(discount=0.4, tol=1e-12)
+
+    # a pass earns a first down (5) and stays in the same state: V = 5 / (1 - 0.4); a fumble ends the drive with the turnover reward (-10)
+    state = (0, 0, decider.DISTANCE_BUCKETS.index('Medium'), 0)
+    values = dict(zip(mdp.actions, mdp.action_values[state]))
+    assert values['SHOTGUN PASS'] == pytest.approx(5 + 0.4 * (5 / 0.6))
+    assert values['UNDER CENTER RUSH'] == pytest.approx(REWARD[0])
+    assert mdp.state_values[state] == pytest.approx(5 / 0.6)
+
+    assert policy.loc[(1, 1, 'Medium', 'OWN'), 'Action'] == 'SHOTGUN PASS'
+    assert mdp.policy_decision(1, 1, 10, 'OWN')[0] == 'SHOTGUN PASS'
+    assert mdp.policy_decision(1, 1, 'Medium', 'OWN')[1] == pytest.approx(5 / 0.6)
+    with pytest.raises(ValueError):
+        mdp.policy_decision(1, 2, 10, 'OWN')
+
+def test_solve_on_a_season_answers_every_situation_with_plays(plays):
+    team = plays['OffenseTeam'].cat.categories[0]
+    mdp = decider.MDP(REWARD, decider.q_reorganize(plays, team), 1)
+    policy = mdp.solve()
+    assert mdp.iterations < 1000
+    assert policy['Plays'].min() > 0
+    assert set(policy['Action']) <= set(mdp.actions)
+    for (quarter, down, distance, side), row in policy.head(20).iterrows():
+        assert mdp.policy_decision(quarter, down, distance, side) == [row['Action'], mdp.action_values[quarter - 1, down - 1, decider.DISTANCE_BUCKETS.index(distance), int(side == 'OPP')].max()]
+
+def test_indexed_mdp_and_unsolved_policy_raise_value_errors(plays):
+    index = decider.SituationIndex(plays)
+    mdp = decider.MDP.from_index(REWARD, index, 1, 1, index.teams[0], 'OWN')
+    with pytest.raises(ValueError, match="plays"):
+        mdp.solve()
+    with pytest.raises(ValueError, match="solve"):
+        decider.MDP(REWARD, first_and_ten_plays(), 1).policy_decision(1, 1, 10, 'OWN')
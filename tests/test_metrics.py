@@ -0,0 +1,66 @@
+"""# Instrumentation Tests
+Spans and counters are only recorded while instrumentation is on; the summary's quantiles come from the span histograms, and the
+Prometheus text and json outputs hold the same numbers.
+"""
+
+import json
+import pytest
+import Football_Play_Decider as decider
+from conftest import REWARD, season_rows
+
+@pytest.fixture
+def recording():
+    decider.metrics.reset()
+    decider.metrics.enable()
+    yield decider.metrics
+    decider.metrics.enable(False)
+    decider.metrics.reset()
+
+def test_nothing_is_recorded_while_off(plays):
+    decider.metrics.reset()
+    decider.SituationIndex(plays)
+    with decider.metrics.span('off'):
+        decider.metrics.count('off.rows', 10)
+    assert decider.metrics.summary() == {'spans': {}, 'counters': {}}
+
+def test_pipeline_stages_are_timed_and_counted(plays, recording):
+    season = season_rows()
+    derived = decider.derive_features(season.copy())
+    decider.train_all(plays, REWARD)
+    decider.SituationIndex(plays)
+    summary = recording.summary()
+
+    for stage in ['derive_features', 'train_all', 'SituationIndex']:
+        span = summary['spans'][stage]
+        assert span['count'] == 1
+        assert 0 <= span['p50'] <= span['p95'] <= span['p99'] <= span['max'] == pytest.approx(span['total'])
+    assert summary['counters']['derive_features.rows'] == len(season)
+    assert summary['counters']['derive_features.plays'] == len(derived)
+
+def test_quantiles_come_from_the_histogram():
+    metrics = decider.Metrics()
+    for seconds in [0.001] * 90 + [0.5] * 10:
+        metrics.observe('stage', seconds)
+    span = metrics.summary()['spans']['stage']
+    assert span['count'] == 100 and span['total'] == pytest.approx(0.09 + 5.0)
+    assert span['p50'] <= 0.001 < span['p95'] <= span['p99'] <= span['max'] == 0.5
+
+def test_prometheus_and_json_outputs_agree(tmp_path):
+    metrics = decider.Metrics()
+    metrics.enable()
+    for seconds in [0.002, 0.004, 0.2]:
+        metrics.observe('stage', seconds)
+    metrics.count('stage.rows', 42)
+
+    metrics.write(str(tmp_path / 'metrics.prom'))
+    lines = (tmp_path / 'metrics.prom').read_text().splitlines()
+    assert 'decider_span_seconds_bucket{span="stage",le="+Inf"} 3' in lines
+    assert 'decider_span_seconds_count{span="stage"} 3' in lines
+    assert 'decider_events_total{name="stage.rows"} 42' in lines
+    buckets = [int(line.rsplit(" ", 1)[1]) for line in lines if line.startswith('decider_span_seconds_bucket')]
+    assert buckets == sorted(buckets)
+
+    metrics.write(str(tmp_path / 'metrics.json'))
+    summary = json.loads((tmp_path / 'metrics.json').read_text())
+    assert summary['counters'] == {'stage.rows': 42}
+    assert summary['spans']['stage']['count'] == 3
@@ -0,0 +1,71 @@
+"""# Model Cache Tests
+The model cache keeps the most recently used models within its memory bound, spills the ones it drops to disk and loads them back
+instead of fitting again, and keys models by a data version that is cheap to look up again and different for a slice of the season.
+"""
+
+import numpy as np
+import pytest
+import Football_Play_Decider as decider
+from conftest import REWARD
+
+# function to make a build() that counts its calls and returns an array taking nbytes
+def counted_build(calls, nbytes=1000):
+    def build():
+        calls.append(1)
+        return np.zeros(nbytes // 8)
+    return build
+
+def test_least_recently_used_model_is_evicted():
+    cache = decider.ModelCache(max_bytes=2500)
+    calls = []
+    a = cache.get('a', counted_build(calls))
+    cache.get('b', counted_build(calls))
+    assert cache.get('a', counted_build(calls)) is a # a hit, and a is now the most recently used
+    cache.get('c', counted_build(calls))
+
+    assert list(cache.models) == ['a', 'c']
+    assert cache.nbytes == 2 * a.nbytes <= cache.max_bytes
+    assert len(calls) == 3
+    cache.get('b', counted_build(calls))
+    assert len(calls) == 4
+
+def test_evicted_models_are_spilled_and_loaded_back(tmp_path):
+    cache = decider.ModelCache(max_bytes=1500, spill_dir=str(tmp_path))
+    first = cache.get('a', lambda: np.arange(125.0))
+    cache.get('b', lambda: np.zeros(125))
+    assert list(cache.models) == ['b']
+    assert len(list(tmp_path.iterdir())) == 1
+
+    def refit():
+        raise AssertionError("a spilled model should be loaded, not fitted again")
+    np.testing.assert_array_equal(cache.get('a', refit), first)
+
+def test_situation_models_are_fitted_once_per_data_version(plays):
+    plays = plays.copy()
+    cache = decider.ModelCache()
+    team = plays['OffenseTeam'].cat.categories[0]
+    mdp = cache.mdp(REWARD, plays, 1, 1, team, 'OWN')
+    assert cache.mdp(REWARD, plays, 1, 1, team, 'OWN') is mdp
+    assert cache.q(REWARD, plays, 1, 1, team, 'OWN') is not mdp
+
+    # a slice of the plays has its own version, so it gets its own model
+    part = plays.iloc[: len(plays) // 2]
+    assert decider.data_version(part) != decider.data_version(plays)
+    assert cache.mdp(REWARD, part, 1, 1, team, 'OWN') is not mdp
+
+def test_data_version_is_not_rehashed_for_the_same_frame(plays, monkeypatch):
+    plays = plays.copy()
+    version = decider.data_version(plays)
+    hashed = []
+    hash_pandas_object = decider.pd.util.hash_pandas_object
+    monkeypatch.setattr(decider.pd.util, 'hash_pandas_object', lambda *arguments, **options: hashed.append(1) or hash_pandas_object(*arguments, **options))
+
+    for _ in range(10):
+        assert decider.data_version(plays) == version
+        decider.ModelCache.key('MDP', plays, 1, 1, 'A', 'OWN', REWARD)
+    assert hashed == []
+
+    # replacing the frame's index is noticed: the rows are hashed again (the same rows still have the same version)
+    plays.index = plays.index + 1
+    assert decider.data_version(plays) == version
+    assert len(hashed) > 0
@@ -0,0 +1,60 @@
+"""# Playbook Export Tests
+The long-format playbook columns hold exactly the q-values and MDP probabilities the models answer with, and the Parquet export
+writes them partitioned by team (needs pyarrow).
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import Football_Play_Decider as decider
+from conftest import REWARD
+
+@pytest.fixture(scope='module')
+def models(plays):
+    return decider.train_all(plays, REWARD), decider.SituationIndex(plays)
+
+# function to turn playbook columns into a data frame with the text columns as names
+def columns_frame(columns):
+    return pd.DataFrame({name: np.asarray(values[1], dtype=object)[values[0]] if isinstance(values, tuple) else values for name, values in columns.items()})
+
+def test_q_columns_hold_every_teams_table(models):
+    tables, index = models
+    q_values = columns_frame(decider.playbook_q_columns(tables, index))
+    for team in tables.teams:
+        actions, values = tables.team_table(team)
+        rows = q_values[q_values['team'] == team]
+        assert len(rows) == values.size
+        assert set(rows['action']) == set(actions)
+        row = rows[(rows['quarter'] == 2) & (rows['side'] == 'OPP') & (rows['state'] == 'ThirdDown')].set_index('action')
+        np.testing.assert_array_equal(row.loc[actions, 'q_value'].to_numpy(), values[1, 1, 2])
+
+def test_mdp_columns_hold_the_index_probabilities(models):
+    _, index = models
+    mdp = columns_frame(decider.playbook_mdp_columns(index))
+    assert mdp['sample_count'].sum() == index.totals.sum()
+    team = index.teams[0]
+    formations, counts, totals, probabilities = index.lookup(1, 1, team, 'OWN')
+    rows = mdp[(mdp['team'] == team) & (mdp['quarter'] == 1) & (mdp['state'] == 'FirstDown') & (mdp['side'] == 'OWN')]
+    assert rows['sample_count'].sum() == totals.sum()
+    for _, row in rows.iterrows():
+        play_type, formation = row['action'].rsplit(" ", 1)[1], row['action'].rsplit(" ", 1)[0]
+        cell = (decider.PLAY_TYPES.index(play_type), list(formations).index(formation))
+        np.testing.assert_array_equal(row[decider.OUTCOMES].to_numpy(dtype=float), probabilities[cell])
+
+def test_export_writes_a_partition_per_team(models, tmp_path):
+    pytest.importorskip('pyarrow')
+    tables, index = models
+    paths = decider.export_playbook(str(tmp_path), tables, index)
+    assert [path.rsplit('/', 1)[1] for path in paths] == ['q_values', 'mdp']
+    assert sorted(p.name for p in (tmp_path / 'q_values').iterdir()) == sorted('team=' + team for team in tables.teams)
+
+    q_values = pd.read_parquet(paths[0])
+    expected = columns_frame(decider.playbook_q_columns(tables, index))
+    assert len(q_values) == len(expected)
+    assert q_values['q_value'].sum() == pytest.approx(expected['q_value'].sum())
+    mdp = pd.read_parquet(paths[1])
+    assert mdp['sample_count'].sum() == index.totals.sum()
+
+    # exporting again replaces the files instead of adding to them
+    decider.export_playbook(str(tmp_path), tables, index)
+    assert len(pd.read_parquet(paths[0])) == len(expected)
@@ -0,0 +1,60 @@
+"""# Query Tables Tests
+Saved query tables give the coach agent's q-learning and MDP answers without importing pandas, and --query prints them as json
+(building the tables from --data the first time).
+"""
+
+import json
+import os
+import subprocess
+import sys
+import pytest
+import Football_Play_Decider as decider
+from conftest import season_rows, write_season
+
+@pytest.fixture(scope='module')
+def saved(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('query')
+    csv_path = write_season(folder, season_rows())
+    path = decider.build_query_tables(csv_path, str(folder / 'query-tables.npz'), cache_dir=str(folder / 'models'))
+    return csv_path, path, decider.CoachAgent(csv_path, cache_dir=str(folder / 'models'))
+
+def test_answers_match_the_coach_agent(saved):
+    csv_path, path, agent = saved
+    tables = decider.QueryTables(path)
+    assert tables.teams == agent.teams
+    for team in agent.teams:
+        for quarter in [1, 4, 5]:
+            for down in [1, 2, 3, 4]:
+                for field_side in ['OWN', 'OPP']:
+                    query = {'quarter': quarter, 'down': down, 'team': team, 'field_side': field_side}
+                    expected = agent.answer(dict(query, drives=0))
+                    expected.pop('drives', None)
+                    assert tables.answer(query) == expected
+
+@pytest.mark.parametrize('query', [{'quarter': 2.5}, {'down': 7}, {'team': 'NOPE'}, {'field_side': 'MID'}])
+def test_bad_queries_get_an_error(saved, query):
+    tables = decider.QueryTables(saved[1])
+    answer = tables.answer(dict({'quarter': 1, 'down': 1, 'team': tables.teams[0], 'field_side': 'OWN'}, **query))
+    assert list(answer) == ['error']
+
+def test_answering_never_imports_pandas(saved):
+    path = saved[1]
+    team = decider.QueryTables(path).teams[0]
+    script = ("import sys, json; import Football_Play_Decider as decider; "
+              "answer = decider.QueryTables(sys.argv[1]).answer({'quarter': 1, 'down': 1, 'team': sys.argv[2], 'field_side': 'OWN'}); "
+              "print(json.dumps([answer, 'pandas' in sys.modules]))")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', script, path, team], cwd=root, capture_output=True, text=True, check=True).stdout
+    answer, imported = json.loads(output)
+    assert 'error' not in answer
+    assert not imported
+
+def test_query_option_builds_missing_tables_and_prints_json(saved, tmp_path, capsys, monkeypatch):
+    # building the tables caches the trained q-tables under ./models
+    monkeypatch.chdir(tmp_path)
+    csv_path, _, agent = saved
+    path = str(tmp_path / 'tables.npz')
+    decider.cli(['--data', csv_path, '--tables', path, '--query', '1', '1', agent.teams[0], 'OWN'])
+    assert os.path.exists(path)
+    answer = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert answer == decider.QueryTables(path).answer({'quarter': 1, 'down': 1, 'team': agent.teams[0], 'field_side': 'OWN'})
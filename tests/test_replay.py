@@ -0,0 +1,80 @@
+"""# Replay Training Tests
+Full-batch replay settles on the fixed point of the q-learning update (every value is the mean target of its plays), so it doesn't
+depend on the order of the plays; replaying one play at a time is the single pass run over a shuffled season.
+"""
+
+import numpy as np
+import Football_Play_Decider as decider
+from conftest import REWARD
+
+# function to encode the season's plays the way fit_q_tables() sees them: the sub-table of every play, its state, action and next state
+def encoded_season(plays):
+    team, teams = decider.encode(plays['OffenseTeam'])
+    action, formations = decider.encode_actions(plays)
+    encoded = decider.encode_transitions(plays)
+    table = (((team * 5) + encoded['quarter']) * 2) + encoded['side']
+    return table, encoded['state'], action, encoded['next_state'], len(teams) * 10, len(decider.action_names(formations))
+
+def test_full_batch_replay_stops_at_the_fixed_point(plays):
+    tables = decider.train_all(plays, REWARD, replay={'epochs': 500, 'tol': 1e-9})
+    stats = tables.convergence
+    assert 1 < len(stats) < 500
+    assert stats[-1]['max_delta'] < 1e-9 <= stats[-2]['max_delta']
+    assert [s['epoch'] for s in stats] == list(range(1, len(stats) + 1))
+
+    table, state, action, next_state, n_tables, n_actions = encoded_season(plays)
+    values = tables.values.reshape(n_tables, len(decider.Q.states), n_actions)
+    target = decider.state_rewards(REWARD)[next_state] + (0.4 * values[table, next_state].max(axis=1))
+    cell = (((table * len(decider.Q.states)) + state) * n_actions) + action
+    cells, inverse = np.unique(cell, return_inverse=True)
+    mean_target = np.bincount(inverse.reshape(-1), weights=target) / np.bincount(inverse.reshape(-1))
+    np.testing.assert_allclose(values.reshape(-1)[cells], mean_target, atol=1e-8)
+
+def test_full_batch_replay_does_not_depend_on_play_order(plays):
+    table, state, action, next_state, n_tables, n_actions = encoded_season(plays)
+    order = np.random.default_rng(3).permutation(len(table))
+    trained = []
+    for rows in [np.arange(len(table)), order]:
+        values = np.zeros((n_tables, len(decider.Q.states), n_actions))
+        decider.replay_q_learning(values, table[rows], state[rows], action[rows], next_state[rows], decider.state_rewards(REWARD), tol=1e-10)
+        trained.append(values)
+    np.testing.assert_allclose(trained[0], trained[1], atol=1e-9)
+
+def test_one_play_batches_are_a_shuffled_single_pass(plays):
+    table, state, action, next_state, n_tables, n_actions = encoded_season(plays)
+    replayed = np.zeros((n_tables, len(decider.Q.states), n_actions))
+    stats = decider.replay_q_learning(replayed, table, state, action, next_state, decider.state_rewards(REWARD), epochs=1, batch_size=1, seed=7)
+
+    order = np.random.default_rng(7).permutation(len(table))
+    single = np.zeros_like(replayed)
+    decider.q_learning_pass(single, table[order], state[order], action[order], next_state[order], decider.state_rewards(REWARD))
+    np.testing.assert_array_equal(replayed, single)
+    assert len(stats) == 1 and stats[0]['max_delta'] > 0
+
+def test_decay_lowers_the_learning_rate_every_epoch(plays):
+    table, state, action, next_state, n_tables, n_actions = encoded_season(plays)
+    values = np.zeros((n_tables, len(decider.Q.states), n_actions))
+    stats = decider.replay_q_learning(values, table, state, action, next_state, decider.state_rewards(REWARD), epochs=4, batch_size=32,
+                                      decay=0.5, tol=0.0, seed=1)
+    assert [s['learning_rate'] for s in stats] == [0.3 / (1 + (0.5 * epoch)) for epoch in range(4)]
+
+def test_a_reward_sweep_replays_every_reward_list_like_on_its_own(plays):
+    table, state, action, next_state, n_tables, n_actions = encoded_season(plays)
+    rewards = [REWARD, [-20, -2, 1, 6, 20]]
+    swept = np.zeros((2, n_tables, len(decider.Q.states), n_actions))
+    decider.replay_q_learning(swept, table, state, action, next_state, decider.state_rewards(rewards), epochs=30, batch_size=64, tol=0.0, seed=5)
+    for k, reward in enumerate(rewards):
+        alone = np.zeros((n_tables, len(decider.Q.states), n_actions))
+        decider.replay_q_learning(alone, table, state, action, next_state, decider.state_rewards(reward), epochs=30, batch_size=64, tol=0.0, seed=5)
+        np.testing.assert_allclose(swept[k], alone, atol=1e-12)
+
+def test_a_team_q_replays_to_the_same_values_as_train_all(plays):
+    tables = decider.train_all(plays, REWARD, replay={'epochs': 500, 'tol': 1e-10})
+    team = plays['OffenseTeam'].cat.categories[0]
+    q = decider.Q(REWARD, decider.q_reorganize(plays, team), 1, 1, 'OWN')
+    stats = q.replay(epochs=500, tol=1e-10)
+    assert q.convergence is stats and stats[-1]['max_delta'] < 1e-10
+
+    actions, values = tables.team_table(team)
+    assert actions == q.actions
+    np.testing.assert_allclose(q.values, values, atol=1e-8)
@@ -0,0 +1,60 @@
+"""# Season Bundle Tests
+load_season() compiles a csv once into a columnar bundle and reuses it while the csv is unchanged: a touched csv with the same contents
+is still fresh, while changed contents or a broken bundle are compiled again.
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import Football_Play_Decider as decider
+from conftest import season_rows, write_season
+
+@pytest.fixture
+def csv_path(tmp_path):
+    return write_season(tmp_path, season_rows())
+
+# function to make compile_season() fail, so a test can check the bundle is reused
+def forbid_compiling(monkeypatch):
+    def compile_season(*arguments, **options):
+        raise AssertionError("the season should have been loaded from its bundle")
+    monkeypatch.setattr(decider, 'compile_season', compile_season)
+
+def test_bundle_gives_the_same_plays_as_the_csv(csv_path):
+    season = decider.load_season(csv_path)
+    assert os.path.isdir(decider.season_cache_path(csv_path))
+    assert decider.stored_data_version(season) == decider.file_hash(csv_path)
+    assert all(isinstance(season[column].dtype, pd.CategoricalDtype) for column in decider.CATEGORICAL_COLUMNS)
+
+    plays = decider.derive_features(season)
+    expected = decider.derive_features(pd.read_csv(csv_path, usecols=decider.SEASON_COLUMNS))
+    for column in ['GameId', 'Quarter', 'Down', 'ToGo', 'Yards', 'DriveId', 'NextDownCode'] + decider.OUTCOME_COLUMNS:
+        np.testing.assert_array_equal(plays[column].to_numpy(), expected[column].to_numpy())
+    for column in ['OffenseTeam', 'Formation', 'PlayType', 'YardLineDirection']:
+        np.testing.assert_array_equal(plays[column].astype(str).to_numpy(), expected[column].astype(str).to_numpy())
+
+def test_unchanged_or_touched_csv_reuses_the_bundle(csv_path, monkeypatch):
+    decider.load_season(csv_path)
+    forbid_compiling(monkeypatch)
+    decider.load_season(csv_path)
+
+    # a touch only moves the modification time, the contents hash the same so the bundle is kept (and remembers the new time)
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    decider.load_season(csv_path)
+    with open(os.path.join(decider.season_cache_path(csv_path), 'meta.json')) as file:
+        assert json.load(file)['mtime_ns'] == stat.st_mtime_ns + 10**9
+
+def test_changed_csv_or_broken_bundle_is_compiled_again(csv_path):
+    first = decider.load_season(csv_path)
+    rows = pd.read_csv(csv_path)
+    write_season(os.path.dirname(csv_path), rows.iloc[:-50])
+    second = decider.load_season(csv_path)
+    assert len(second) == len(first) - 50
+    assert decider.stored_data_version(second) != decider.stored_data_version(first)
+
+    # a bundle without its metadata (e.g. compiling stopped half way) isn't used
+    os.remove(os.path.join(decider.season_cache_path(csv_path), 'meta.json'))
+    assert decider.season_cache_is_fresh(csv_path, decider.season_cache_path(csv_path)) is None
+    assert len(decider.load_season(csv_path)) == len(second)
@@ -0,0 +1,85 @@
+"""# Service Tests
+The coach agent's answers to good and bad queries, and serve() answering over a unix socket: concurrently, matched up by 'id',
+with an error answer (instead of a stopped service) for a query that can't be read or that fails in the agent.
+"""
+
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import pytest
+import Football_Play_Decider as decider
+from conftest import season_rows, write_season
+
+@pytest.fixture(scope='module')
+def agent(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('service')
+    return decider.CoachAgent(write_season(folder, season_rows()), cache_dir=str(folder / 'models'))
+
+def situation(agent, **extra):
+    return dict({'quarter': 1, 'down': 1, 'team': agent.teams[0], 'field_side': 'OWN'}, **extra)
+
+def test_answer_has_both_picks_and_drives(agent):
+    answer = agent.answer(situation(agent, drives=4, seed=1))
+    assert set(answer['q_learning']) == {'action', 'value'}
+    assert set(answer['mdp']) == {'play', 'formation', 'value'}
+    assert len(answer['drives']) == 4
+    # the same seed samples the same drives
+    assert agent.answer(situation(agent, drives=4, seed=1)) == answer
+
+@pytest.mark.parametrize('query', [{'quarter': 2.5}, {'down': '3.5'}, {'down': True}, {'quarter': 6}, {'team': 'NOPE'},
+                                   {'field_side': 'MID'}, {'drives': 'x'}, {'drives': -1}, {'seed': 1.5}, {'bootstrap': 2.5}])
+def test_bad_queries_get_an_error(agent, query):
+    answer = agent.answer(situation(agent, **query))
+    assert list(answer) == ['error']
+
+def test_whole_numbers_given_as_text_or_floats_are_read(agent):
+    answer = agent.answer(situation(agent, quarter='1', down=1.0, drives='0'))
+    assert answer['quarter'] == 1 and answer['down'] == 1
+    assert 'drives' not in answer
+
+# function to send lines to a socket served by serve() and read back one answer per line
+def ask(path, lines):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall(("\n".join(lines) + "\n").encode())
+        client.shutdown(socket.SHUT_WR)
+        received = b""
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            received += chunk
+    return [json.loads(line) for line in received.decode().splitlines()]
+
+def test_serve_answers_every_query_on_a_socket(agent, monkeypatch):
+    answer = agent.answer
+    def failing_answer(query):
+        if query.get('fail'):
+            raise RuntimeError("model broke")
+        return answer(query)
+    monkeypatch.setattr(agent, 'answer', failing_answer)
+
+    # unix socket paths are short, so the socket goes in its own short temporary folder
+    path = os.path.join(tempfile.mkdtemp(), 's')
+    threading.Thread(target=decider.serve, args=(agent, path), daemon=True).start()
+    for _ in range(100):
+        if os.path.exists(path):
+            break
+        time.sleep(0.05)
+
+    lines = [json.dumps(situation(agent, id=1, drives=2)), "not json", json.dumps(situation(agent, id=2, quarter=2.5)),
+             json.dumps(situation(agent, id=3, fail=True)), json.dumps({'id': 4, 'command': 'metrics'})]
+    answers = ask(path, lines)
+    assert len(answers) == len(lines)
+    by_id = {answer.get('id'): answer for answer in answers}
+    assert len(by_id[1]['drives']) == 2
+    assert by_id[2]['error'] == "Query needs a quarter (1-5 or OT) and a down (1-4)"
+    assert by_id[3]['error'] == "model broke"
+    assert 'error' in by_id[None]
+    assert 4 in by_id
+
+    # the service is still up after the failures
+    assert ask(path, [json.dumps(situation(agent, id=5, drives=0))])[0]['id'] == 5
@@ -0,0 +1,46 @@
+"""# Streaming Tests
+Seasons read in chunks come out as whole games in GameId order, in groups of about chunksize rows, and the streamed plays are the
+plays of one data frame of every season, with drives numbered across the files.
+"""
+
+import numpy as np
+import pandas as pd
+import Football_Play_Decider as decider
+from benchmark import synthetic_seasons
+
+def write_seasons(folder):
+    data = synthetic_seasons(2, n_teams=6, games_per_team=4, rows_per_game=120, seed=4)
+    paths = []
+    for year, season in data.groupby('SeasonYear'):
+        paths.append(str(folder / ('pbp-' + str(year) + '.csv')))
+        season.to_csv(paths[-1], index=False)
+    return data, paths
+
+def test_game_groups_hold_whole_games_in_order(tmp_path):
+    data, paths = write_seasons(tmp_path)
+    teams, formations, games = decider.scan_seasons(paths, chunksize=300)
+    assert teams == sorted(data.loc[data['PlayType'].isin(['PASS', 'RUSH']) & data['Down'].between(1, 4), 'OffenseTeam'].dropna().unique())
+    assert [len(season) for season in games] == [data.loc[data['SeasonYear'] == year, 'GameId'].nunique() for year in sorted(data['SeasonYear'].unique())]
+
+    groups = list(decider.game_groups(paths[0], games[0], chunksize=300))
+    assert len(groups) > 1
+    ids = [np.sort(group['GameId'].unique()) for group in groups]
+    # every game is in one group only, and the groups go in GameId order
+    flat = np.concatenate(ids)
+    assert (np.diff(flat) > 0).all()
+    np.testing.assert_array_equal(flat, games[0].index)
+    for group in groups:
+        # a group is about chunksize rows and every game in it is complete
+        assert len(group) <= 300 + games[0].max()
+        np.testing.assert_array_equal(group['GameId'].value_counts().sort_index(), games[0][group['GameId'].unique()].sort_index())
+
+def test_streamed_plays_are_the_plays_of_every_season(tmp_path):
+    data, paths = write_seasons(tmp_path)
+    streamed = pd.concat(list(decider.stream_plays(str(tmp_path / 'pbp-*.csv'), chunksize=300)))
+    seasons = pd.concat([pd.read_csv(path) for path in paths])
+    expected = decider.derive_features(seasons[decider.SEASON_COLUMNS])
+
+    columns = ['GameId', 'Down', 'YardLine', 'DriveId', 'NextDownCode'] + decider.OUTCOME_COLUMNS
+    pd.testing.assert_frame_equal(streamed[columns].reset_index(drop=True).astype(expected[columns].dtypes.to_dict()),
+                                  expected[columns].reset_index(drop=True))
+    np.testing.assert_array_equal(streamed['OffenseTeam'].astype(str).to_numpy(), expected['OffenseTeam'].astype(str).to_numpy())
@@ -0,0 +1,102 @@
+"""# Online Update Tests
+A coach agent that folds new plays into its warm models should end up where fitting every play at once does, keep answering while
+it updates, and a followed feed should give the same plays as deriving the whole file.
+"""
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+import Football_Play_Decider as decider
+from conftest import REWARD, season_rows, write_season
+
+# function to split the season's rows into the games an agent starts with and the games that come in later
+def split_games(rows, later=2):
+    games = np.sort(rows['GameId'].unique())
+    late = rows['GameId'].isin(games[-later:]).to_numpy()
+    return rows[~late], rows[late]
+
+def test_agent_update_matches_full_fit(tmp_path):
+    rows = season_rows()
+    early, late = split_games(rows)
+    agent = decider.CoachAgent(write_season(tmp_path, early), cache_dir=str(tmp_path / 'models'))
+    version = agent.version
+
+    late_plays = decider.derive_features(late[decider.SEASON_COLUMNS])
+    late_plays['DriveId'] += agent.last_drive + 1
+    agent.update(late_plays)
+
+    # the whole season compiled the same way (the compiled vocabulary has every formation in the csv)
+    os.makedirs(tmp_path / 'full')
+    plays = decider.derive_features(decider.load_season(write_season(tmp_path / 'full', rows)))
+    index, tables = decider.SituationIndex(plays), decider.train_all(plays, REWARD)
+    assert agent.teams == index.teams
+    np.testing.assert_array_equal(agent.index.quarter_counts, index.quarter_counts)
+    assert agent.tables.actions == tables.actions
+    np.testing.assert_array_equal(agent.tables.values, tables.values)
+
+    # the update only adds the new plays as a piece; they're put together when a model needs every play
+    assert agent.version != version
+    assert len(agent.pieces) == 2
+    assert len(agent.season_plays(agent.pieces, agent.version)) == len(plays)
+    assert decider.data_version(agent.season_plays(agent.pieces, agent.version)) == agent.version
+
+    situations = decider.all_situations(agent.teams)
+    pd.testing.assert_frame_equal(agent.decide_many(situations), decider.decide_many(situations, index, tables, REWARD))
+
+def test_answers_and_updates_run_while_drives_are_sampled(tmp_path):
+    rows = season_rows()
+    early, late = split_games(rows)
+    agent = decider.CoachAgent(write_season(tmp_path, early), cache_dir=str(tmp_path / 'models'))
+    query = {'quarter': 1, 'down': 1, 'team': agent.teams[0], 'field_side': 'OWN'}
+
+    # the first answer's drive sampling waits until the others are done
+    sampling, release = threading.Event(), threading.Event()
+    hmm = agent.models.hmm
+    def slow_hmm(*arguments):
+        sampling.set()
+        release.wait(5)
+        return hmm(*arguments)
+    agent.models.hmm = slow_hmm
+
+    slow = {}
+    thread = threading.Thread(target=lambda: slow.update(agent.answer(dict(query, drives=3))))
+    thread.start()
+    try:
+        assert sampling.wait(10)
+        answer = agent.answer(dict(query, drives=0))
+        assert 'q_learning' in answer and 'drives' not in answer
+        late_plays = decider.derive_features(late[decider.SEASON_COLUMNS])
+        late_plays['DriveId'] += agent.last_drive + 1
+        agent.update(late_plays)
+        assert len(agent.pieces) == 2
+        # both were done while the first answer was still sampling
+        assert thread.is_alive()
+    finally:
+        release.set()
+        thread.join(10)
+    assert len(slow['drives']) == 3
+
+def test_follow_plays_gives_the_plays_of_the_whole_file(tmp_path):
+    rows = season_rows()
+    early, late = split_games(rows, later=3)
+    path = write_season(tmp_path, early.iloc[:0], name='feed.csv')
+    feed = decider.follow_plays(path, poll_interval=0.01)
+
+    # rows show up in two writes, the second one ending half way through a line
+    pieces = []
+    for part in [early, late]:
+        text = part.to_csv(index=False, header=False)
+        with open(path, 'a') as file:
+            file.write(text[:-10])
+        if part is early:
+            pieces.append(next(feed))
+        with open(path, 'a') as file:
+            file.write(text[-10:])
+    pieces.append(next(feed))
+
+    followed = pd.concat(pieces)
+    expected = decider.derive_features(rows[decider.SEASON_COLUMNS])
+    columns = ['GameId', 'OffenseTeam', 'Down', 'DriveId', 'NextDownCode'] + decider.OUTCOME_COLUMNS
+    pd.testing.assert_frame_equal(followed[columns].reset_index(drop=True).astype(expected[columns].dtypes.to_dict()),
+                                  expected[columns].reset_index(drop=True))